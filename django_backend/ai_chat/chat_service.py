@@ -1,72 +1,60 @@
 # pyright: reportAttributeAccessIssue=false
 # pyright: reportImplicitRelativeImport=false
 import re
-import os
-import importlib
-from typing import Any, Optional
+from typing import Any, AsyncIterator, Optional
+from asgiref.sync import sync_to_async  # type: ignore
 from django.contrib.auth.models import User  # type: ignore
 from stu_accounts.models import StudentAccount  # type: ignore
+from ai_module import gemini_client  # type: ignore
 from .models import ChatConversation, ChatMessage, UserStudyPlan
+from . import response_cache
+from .intents import INTENT_PATTERNS, intent_engine
+from .chat_users import user_id_for
+from .history_cache import RecentHistory, append_message, course_in, practice_step, recent_history
+from .topic_index import TopicIndex, topic_index_for
+from .prompt_builder import PromptBuilder
+from .student_context import StudentContextBuilder, invalidate_student_context
 from dotenv import load_dotenv
 
 # load var
 load_dotenv()
-GEMINI_KEY = os.getenv("GEMINI_API_KEY")
-use_gemini: bool = bool(GEMINI_KEY)
-genai: Any = None
+use_gemini: bool = gemini_client.has_key()
+CHAT_GENERATION_CONFIG = {"temperature": 0.7, "max_output_tokens": 2048}
+# Bump when the system prompt in generate_ai_response changes, so cached replies are dropped
+CHAT_PROMPT_VERSION = "2"
+# Which prompt context survives trimming to CHAT_PROMPT_TOKEN_BUDGET, lowest first
+PROMPT_PRIORITY_PRACTICE = 1         # practice test summary and wrong answers
+PROMPT_PRIORITY_CONTEXT = 2          # enrolled courses and task progress
+PROMPT_PRIORITY_PLAN = 3
+PROMPT_PRIORITY_HISTORY = 4
+PROMPT_PRIORITY_CORRECT_ANSWERS = 5
 
-if use_gemini:
+
+def _setting(name: str, default: Any) -> Any:
     try:
-        genai = importlib.import_module("google.generativeai")
-        genai.configure(api_key=GEMINI_KEY)
-        _model = genai.GenerativeModel(
-            "gemini-2.5-flash",
-            generation_config={"temperature": 0.7, "max_output_tokens": 2048}
-        )
-    except Exception as e:
-        print(f"[DEBUG] Gemini fail to initialize: {e}")
-        use_gemini = False
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
 
 class AIChatService:
     """AI chat Service - Processing User Messages and Generating Intelligent Replies
 """
     
+    # 意图规则在模块导入时编译一次，所有实例共享
+    intent_engine = intent_engine
+    
     def __init__(self):
-        self.intent_patterns = {
-            'explain_plan': [
-                r'explain.*plan', r'plan.*explain', r'tell.*about.*plan',
-                r'how.*plan.*work', r'plan.*detail', r'plan.*reason'
-            ],
-            'task_help': [
-                r'part.*\d+', r'task.*approach', r'how.*do.*part',
-                r'help.*with.*task', r'task.*detail', r'assignment.*help'
-            ],
-            'practice': [
-                r'practice', r'weak.*topic', r'difficult.*topic',
-                r'need.*help.*with', r'don.*understand', r'struggling.*with',
-                r'weak.*in', r'find.*difficult', r'bad.*at'
-            ],
-            'encouragement': [
-                r'encourage', r'motivation', r'feel.*bad', r'hard.*time',
-                r'anxious', r'worried', r'overwhelm', r'stress'
-            ],
-            'greeting': [
-                r'^(hi|hello|hey)', r'good.*morning', r'good.*afternoon'
-            ]
-        }
+        # 意图规则（按优先级排列）
+        self.intent_patterns = INTENT_PATTERNS
     
     def get_or_create_conversation(self, account: StudentAccount) -> ChatConversation:
         """获取或创建用户的对话会话"""
-        # 创建或获取一个临时User对象用于兼容现有模型
-        user, _ = User.objects.get_or_create(  # type: ignore
-            username=account.student_id,
-            defaults={'email': account.email or f'{account.student_id}@temp.com'}
-        )
-        
+        # 对话挂在与学号同名的Django User上，User id已缓存
         conversation, created = ChatConversation.objects.get_or_create(  # type: ignore
-            user=user,
-            is_active=True,
-            defaults={'user': user}
+            user_id=user_id_for(account),
+            is_active=True
         )
         return conversation
     
@@ -77,28 +65,17 @@ class AIChatService:
         return False  # 前端现在基于会话状态决定是否发送问候
     
     def detect_intent(self, message: str) -> str:
-        """检测用户消息的意图"""
-        message_lower = message.lower()
-        
-        for intent, patterns in self.intent_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, message_lower):
-                    return intent
-        
-        return 'general'
+        """检测用户消息的意图（返回优先级最高的意图）"""
+        return self.intent_engine.detect(message)
     
     def is_practice_request(self, message: str) -> bool:
         """检测是否是练习请求"""
-        practice_keywords = [
-            'practice', 'weak topic', 'difficult topic', 'need help with', 
-            'don\'t understand', 'struggling with', 'weak in', 'find difficult',
-            'bad at', 'want to practice', 'need practice', 'practice session'
-        ]
-        message_lower = message.lower()
-        return any(keyword in message_lower for keyword in practice_keywords)
+        return self.intent_engine.is_practice(message)
     
     def is_in_practice_flow(self, conversation_history: list[dict[str, Any]]) -> bool:
         """检查是否处于练习流程中"""
+        if isinstance(conversation_history, RecentHistory):
+            return conversation_history.in_practice_flow
         if not conversation_history:
             return False
         
@@ -112,21 +89,8 @@ class AIChatService:
         if not last_ai_message:
             return False
         
-        content = last_ai_message['content']
-        
         # 检查是否包含练习流程的标识文本
-        practice_flow_indicators = [
-            'which course would you like to practise?',
-            'which topic would you like to focus on?',
-            'which topic would you like to work on?',
-            'here are some topics available for this course:',
-            'here are the courses you\'re currently enrolled in:',
-            'which course is this topic for?',
-            'i\'m not seeing that course in your enrolments',
-            'i\'m not able to match that to a topic in this course'
-        ]
-        
-        return any(indicator in content.lower() for indicator in practice_flow_indicators)
+        return self.intent_engine.is_practice_flow_prompt(last_ai_message['content'])
     
     def get_student_courses(self, account: StudentAccount) -> list[str]:
         """获取学生注册的课程列表"""
@@ -141,15 +105,21 @@ class AIChatService:
     def get_course_topics(self, course_code: str) -> list[str]:
         """获取课程的题目主题列表"""
         try:
-            from courses.models import QuestionKeyword, QuestionKeywordMap
-            topics = QuestionKeyword.objects.filter(
-                questionkeywordmap__question__course_code=course_code
-            ).values_list('name', flat=True).distinct()
-            return list(topics)
+            return list(topic_index_for(course_code).topics)
         except Exception as e:
             print(f"[DEBUG] 获取课程主题失败: {e}")
             return []
     
+    def validate_topic_input(self, user_input: str, available_topics: list[str]) -> tuple[bool, str]:
+        """验证用户输入的主题是否有效（精确、包含、关键词重叠、模糊匹配）"""
+        topic = TopicIndex(available_topics).match(user_input)
+        return topic is not None, topic
+    
+    def validate_course_topic(self, user_input: str, course_code: str) -> tuple[bool, str]:
+        """同validate_topic_input，但使用按课程缓存的主题索引"""
+        topic = topic_index_for(course_code).match(user_input)
+        return topic is not None, topic
+    
     def validate_course_input(self, user_input: str, available_courses: list[str]) -> tuple[bool, str]:
         """验证用户输入的课程是否有效"""
         user_input_clean = user_input.strip().upper()
@@ -221,50 +191,15 @@ class AIChatService:
     
     def is_explain_plan_request(self, message: str) -> bool:
         """检测是否是解释学习计划的请求"""
-        explain_patterns = [
-            r'explain.*plan',
-            r'please.*explain.*plan',
-            r'please.*explain.*study.*plan',
-            r'tell.*about.*plan',
-            r'plan.*explain',
-            r'study.*plan.*explain',
-            r'explain.*study.*plan'
-        ]
-        
-        message_lower = message.lower()
-        for pattern in explain_patterns:
-            if re.search(pattern, message_lower):
-                return True
-        return False
+        return self.intent_engine.is_explain_plan(message)
     
     def is_stop_request(self, message: str) -> bool:
         """检测是否是停止当前模式的请求"""
-        stop_patterns = [
-            r'\bstop\b',
-            r'\bexit\b', 
-            r'\bback\b'
-        ]
-        
-        message_lower = message.lower().strip()
-        for pattern in stop_patterns:
-            if re.search(pattern, message_lower):
-                return True
-        return False
+        return self.intent_engine.is_stop(message)
     
     def is_why_plan_request(self, message: str) -> bool:
         """检测是否是询问计划整体原因的请求"""
-        why_patterns = [
-            r'why.*plan',
-            r'plan.*why',
-            r'reason.*plan',
-            r'plan.*reason'
-        ]
-        
-        message_lower = message.lower()
-        for pattern in why_patterns:
-            if re.search(pattern, message_lower):
-                return True
-        return False
+        return self.intent_engine.is_why_plan(message)
     
     def parse_explain_task_part_request(self, message: str) -> tuple[Optional[int], Optional[str]]:
         """解析解释具体Task/Part的请求"""
@@ -767,7 +702,7 @@ class AIChatService:
             course = state['course']
             topics = self.get_course_topics(course)
             print(f"[DEBUG] 主题验证: course={course}, available_topics={topics}, user_input={message}")
-            is_valid, validated_topic = self.validate_topic_input(message, topics)
+            is_valid, validated_topic = self.validate_course_topic(message, course)
             print(f"[DEBUG] 主题验证结果: is_valid={is_valid}, validated_topic={validated_topic}")
             
             if is_valid:
@@ -919,13 +854,9 @@ class AIChatService:
     def get_user_study_plan(self, account: StudentAccount) -> Optional[dict[str, Any]]:
         """获取用户的当前学习计划"""
         try:
-            # 创建临时User对象用于查询
-            user, _ = User.objects.get_or_create(  # type: ignore
-                username=account.student_id,
-                defaults={'email': account.email or f'{account.student_id}@temp.com'}
-            )
-            plan = UserStudyPlan.objects.filter(user=user, is_active=True).first()  # type: ignore
-            return plan.plan_data if plan else None
+            return UserStudyPlan.objects.filter(  # type: ignore
+                user_id=user_id_for(account), is_active=True
+            ).values_list('plan_data', flat=True).first()
         except Exception:
             return None
     
@@ -1051,31 +982,6 @@ class AIChatService:
         </div>
         """
     
-    def validate_topic_input(self, user_input: str, available_topics: list[str]) -> tuple[bool, str]:
-        """验证用户输入的主题是否有效"""
-        user_input_clean = user_input.strip().lower()
-        
-        # 精确匹配（忽略大小写）
-        for topic in available_topics:
-            if topic.lower() == user_input_clean:
-                return True, topic
-        
-        # 包含匹配
-        for topic in available_topics:
-            if user_input_clean in topic.lower() or topic.lower() in user_input_clean:
-                return True, topic
-        
-        # 关键词匹配
-        user_words = user_input_clean.split()
-        for topic in available_topics:
-            topic_words = topic.lower().split()
-            # 如果用户输入的词汇中有超过一半匹配主题词汇，则认为匹配
-            matches = sum(1 for word in user_words if word in topic_words)
-            if matches >= min(2, len(user_words), len(topic_words)):
-                return True, topic
-        
-        return False, None
-    
     def generate_encouragement(self) -> str:
         """生成鼓励回复"""
         encouragements = [
@@ -1330,31 +1236,6 @@ class AIChatService:
         </div>
         """
     
-    def validate_topic_input(self, user_input: str, available_topics: list[str]) -> tuple[bool, str]:
-        """验证用户输入的主题是否有效"""
-        user_input_clean = user_input.strip().lower()
-        
-        # 精确匹配（忽略大小写）
-        for topic in available_topics:
-            if topic.lower() == user_input_clean:
-                return True, topic
-        
-        # 包含匹配
-        for topic in available_topics:
-            if user_input_clean in topic.lower() or topic.lower() in user_input_clean:
-                return True, topic
-        
-        # 关键词匹配
-        user_words = user_input_clean.split()
-        for topic in available_topics:
-            topic_words = topic.lower().split()
-            # 如果用户输入的词汇中有超过一半匹配主题词汇，则认为匹配
-            matches = sum(1 for word in user_words if word in topic_words)
-            if matches >= min(2, len(user_words), len(topic_words)):
-                return True, topic
-        
-        return False, None
-    
     def generate_greeting_response(self) -> str:
         """生成问候回复"""
         return """
@@ -1371,31 +1252,6 @@ class AIChatService:
         </div>
         """
     
-    def validate_topic_input(self, user_input: str, available_topics: list[str]) -> tuple[bool, str]:
-        """验证用户输入的主题是否有效"""
-        user_input_clean = user_input.strip().lower()
-        
-        # 精确匹配（忽略大小写）
-        for topic in available_topics:
-            if topic.lower() == user_input_clean:
-                return True, topic
-        
-        # 包含匹配
-        for topic in available_topics:
-            if user_input_clean in topic.lower() or topic.lower() in user_input_clean:
-                return True, topic
-        
-        # 关键词匹配
-        user_words = user_input_clean.split()
-        for topic in available_topics:
-            topic_words = topic.lower().split()
-            # 如果用户输入的词汇中有超过一半匹配主题词汇，则认为匹配
-            matches = sum(1 for word in user_words if word in topic_words)
-            if matches >= min(2, len(user_words), len(topic_words)):
-                return True, topic
-        
-        return False, None
-    
     def generate_general_response(self) -> str:
         """生成通用回复"""
         return """
@@ -1417,162 +1273,113 @@ class AIChatService:
         </div>
         """
     
-    def validate_topic_input(self, user_input: str, available_topics: list[str]) -> tuple[bool, str]:
-        """验证用户输入的主题是否有效"""
-        user_input_clean = user_input.strip().lower()
-        
-        # 精确匹配（忽略大小写）
-        for topic in available_topics:
-            if topic.lower() == user_input_clean:
-                return True, topic
-        
-        # 包含匹配
-        for topic in available_topics:
-            if user_input_clean in topic.lower() or topic.lower() in user_input_clean:
-                return True, topic
-        
-        # 关键词匹配
-        user_words = user_input_clean.split()
-        for topic in available_topics:
-            topic_words = topic.lower().split()
-            # 如果用户输入的词汇中有超过一半匹配主题词汇，则认为匹配
-            matches = sum(1 for word in user_words if word in topic_words)
-            if matches >= min(2, len(user_words), len(topic_words)):
-                return True, topic
-        
-        return False, None
-    
-    def generate_ai_response(self, message: str, account: StudentAccount, conversation_history: Optional[list[dict[str, Any]]] = None) -> str:
-        """使用Gemini AI生成智能回复"""
-        if not use_gemini:
-            # 如果没有AI，回退到基于规则的回复
-            intent = self.detect_intent(message)
-            if intent == 'explain_plan':
-                return self.generate_plan_explanation(account)
-            elif intent == 'task_help':
-                return self.generate_task_help(message, account)
-            elif intent == 'encouragement':
-                return self.generate_encouragement()
-            elif intent == 'practice':
-                # 检查是否提到了具体课程
-                course_code = self.extract_course_from_message(message)
-                if course_code:
-                    return self.generate_course_topic_selection(course_code)
-                else:
-                    # 检查是否有明确的薄弱项主题
-                    topic = self.extract_weak_topic(message)
-                    if topic and self.is_topic_specific(topic):
-                        return self.generate_practice_response(topic)
-                    else:
-                        return self.generate_clarification_response()
-            elif intent == 'greeting':
-                return self.generate_greeting_response()
+    def generate_rule_based_response(self, message: str, account: StudentAccount) -> str:
+        """基于规则的回复（没有AI或Gemini熔断时使用）"""
+        intent = self.detect_intent(message)
+        if intent == 'explain_plan':
+            return self.generate_plan_explanation(account)
+        elif intent == 'task_help':
+            return self.generate_task_help(message, account)
+        elif intent == 'encouragement':
+            return self.generate_encouragement()
+        elif intent == 'practice':
+            # 检查是否提到了具体课程
+            course_code = self.extract_course_from_message(message)
+            if course_code:
+                return self.generate_course_topic_selection(course_code)
             else:
-                return self.generate_general_response()
-        
-        try:
-            # 导入必要的模型
-            from courses.models import StudentEnrollment, CourseCatalog, CourseTask
-            from task_progress.models import TaskProgress
-            from .models import RecentPracticeSession
-            
-            # 获取用户选课信息
-            courses_context = ""
-            try:
-                enrollments = StudentEnrollment.objects.filter(student_id=account.student_id)  # type: ignore
-                if enrollments.exists():
-                    courses_list = []
-                    for enrollment in enrollments[:5]:  # 最多5门课程
-                        try:
-                            course = CourseCatalog.objects.get(code=enrollment.course_code)  # type: ignore
-                            courses_list.append(f"{course.code}: {course.title}")
-                        except CourseCatalog.DoesNotExist:  # type: ignore
-                            courses_list.append(enrollment.course_code)
-                    if courses_list:
-                        courses_context = f"\n\nEnrolled courses ({len(courses_list)}):\n- " + "\n- ".join(courses_list)
-            except Exception as e:
-                print(f"[DEBUG] 获取选课信息失败: {e}")
-            
-            # 获取用户任务进度信息
-            tasks_context = ""
-            try:
-                # 获取所有任务进度
-                task_progresses = TaskProgress.objects.filter(student_id=account.student_id).order_by('-updated_at')[:10]  # type: ignore
-                if task_progresses.exists():
-                    tasks_info = []
-                    for tp in task_progresses[:5]:  # 最多显示5个最近更新的任务
-                        try:
-                            task = CourseTask.objects.get(id=tp.task_id)  # type: ignore
-                            status = "✓ Complete" if tp.progress >= 100 else f"⏳ {tp.progress}% done"
-                            tasks_info.append(f"{task.course_code} - {task.title}: {status}")
-                        except CourseTask.DoesNotExist:  # type: ignore
-                            pass
-                    if tasks_info:
-                        tasks_context = f"\n\nRecent task progress:\n- " + "\n- ".join(tasks_info)
-            except Exception as e:
-                print(f"[DEBUG] 获取任务进度失败: {e}")
+                # 检查是否有明确的薄弱项主题
+                topic = self.extract_weak_topic(message)
+                if topic and self.is_topic_specific(topic):
+                    return self.generate_practice_response(topic)
+                else:
+                    return self.generate_clarification_response()
+        elif intent == 'greeting':
+            return self.generate_greeting_response()
+        else:
+            return self.generate_general_response()
+    
+    def build_chat_prompt(self, message: str, account: StudentAccount, conversation_history: Optional[list[dict[str, Any]]] = None) -> tuple[str, str]:
+        """构建Gemini系统提示，返回 (system_prompt, 回复缓存键)"""
+        # 一次性获取学生上下文（选课、任务进度、最近练习、学习计划），按学生缓存
+        student = StudentContextBuilder().build(account.student_id)
+        
+        builder = PromptBuilder(int(_setting("CHAT_PROMPT_TOKEN_BUDGET", 3000)))
+        builder.section('courses')
+        builder.section('tasks')
+        builder.section('practice', "\n\n🎯 Most recent practice test:")
+        builder.section('questions', "\n\nDetailed test results (✗ = answered incorrectly):")
+        builder.section('plan')
+        builder.section('history', "\n\nRecent conversation:\n", reverse=True)
+        
+        # 选课信息
+        if student.courses:
+            courses_list = [f"{code}: {title}" if title else code for code, title in student.courses]
+            builder.add('courses', f"\n\nEnrolled courses ({len(courses_list)}):\n- " + "\n- ".join(courses_list), PROMPT_PRIORITY_CONTEXT)
+        
+        # 任务进度信息
+        if student.task_progress:
+            tasks_info = []
+            for tp in student.task_progress:
+                status = "✓ Complete" if tp.progress >= 100 else f"⏳ {tp.progress}% done"
+                tasks_info.append(f"{tp.course_code} - {tp.title}: {status}")
+            builder.add('tasks', f"\n\nRecent task progress:\n- " + "\n- ".join(tasks_info), PROMPT_PRIORITY_CONTEXT)
+        
+        # 最近的练习测试结果：错题优先保留，答对的题目最先被裁掉
+        recent_session = student.practice
+        if recent_session:
+            builder.add('practice', (
+                f"\n- Course: {recent_session.course_code}"
+                f"\n- Topic: {recent_session.topic}"
+                f"\n- Score: {recent_session.total_score}/{recent_session.max_score} ({recent_session.percentage:.1f}%)"
+                f"\n- Questions: {recent_session.questions_count}"
+            ), PROMPT_PRIORITY_PRACTICE)
             
-            # 获取最近的练习测试结果
-            practice_context = ""
-            try:
-                recent_session = RecentPracticeSession.get_latest_session(account.student_id)  # type: ignore
-                if recent_session:
-                    practice_context = f"\n\n🎯 Most recent practice test:"
-                    practice_context += f"\n- Course: {recent_session.course_code}"
-                    practice_context += f"\n- Topic: {recent_session.topic}"
-                    practice_context += f"\n- Score: {recent_session.total_score}/{recent_session.max_score} ({recent_session.percentage:.1f}%)"
-                    practice_context += f"\n- Questions: {recent_session.questions_count}"
+            wrong_questions = [q for q in recent_session.questions if not q.get('is_correct', True)]
+            if wrong_questions:
+                builder.add('practice', f"\n- Wrong answers: {len(wrong_questions)} question(s)", PROMPT_PRIORITY_PRACTICE)
+                for idx, q in enumerate(recent_session.questions, 1):
+                    is_correct = q.get('is_correct', False)
+                    lines = [f"\n  Q{idx} [{'✓' if is_correct else '✗'}]: {q.get('question_text', 'N/A')}"]
                     
-                    # 添加所有题目的详细信息（不限制数量）
-                    test_data = recent_session.test_data
-                    if test_data and 'questions' in test_data:
-                        wrong_questions = [q for q in test_data['questions'] if not q.get('is_correct', True)]
-                        if wrong_questions:
-                            practice_context += f"\n- Wrong answers: {len(wrong_questions)} question(s)"
-                            practice_context += "\n\nDetailed test results (ALL questions for student reference):"
-                            # 显示所有题目，不截断内容
-                            for idx, q in enumerate(test_data['questions'], 1):
-                                status = "✓" if q.get('is_correct', False) else "✗"
-                                practice_context += f"\n  Q{idx} [{status}]: {q.get('question_text', 'N/A')}"
-                                
-                                # 如果是选择题，显示选项
-                                if q.get('question_type') == 'mcq' and q.get('options'):
-                                    practice_context += f"\n      Options: {', '.join(q.get('options', []))}"
-                                
-                                practice_context += f"\n      Student's answer: {q.get('student_answer', 'N/A')}"
-                                
-                                if not q.get('is_correct', True):
-                                    practice_context += f"\n      Correct answer: {q.get('correct_answer', 'N/A')}"
-                                    if q.get('feedback'):
-                                        practice_context += f"\n      Feedback: {q.get('feedback', '')}"
-            except Exception as e:
-                print(f"[DEBUG] 获取练习测试结果失败: {e}")
-            
-            # 获取用户的学习计划信息
-            plan_data = self.get_user_study_plan(account)
-            plan_context = ""
-            if plan_data:
-                ai_summary = plan_data.get('aiSummary', {})
-                tasks = ai_summary.get('tasks', [])
-                if tasks:
-                    plan_context = f"\n\nAI-generated study plan includes {len(tasks)} tasks: "
-                    for task in tasks[:3]:  # 只包含前3个任务
-                        task_title = task.get('taskTitle', 'Unknown Task')
-                        parts_count = len(task.get('parts', []))
-                        plan_context += f"\n- {task_title} ({parts_count} parts)"
-            
-            # 构建对话历史上下文 - 增加到20条
-            history_context = ""
-            if conversation_history:
-                recent_messages = conversation_history[-20:]  # 最近20条消息 (从6条增加)
-                history_context = "\n\nRecent conversation:\n"
-                for msg in recent_messages:
-                    role = "Student" if msg['type'] == 'user' else "Coach"
-                    content = msg['content'][:200]  # 限制长度
-                    history_context += f"{role}: {content}\n"
-            
-            # 构建AI提示
-            system_prompt = f"""You are an AI Learning Coach helping university students with their studies. You are supportive, encouraging, and provide practical advice.
+                    # 如果是选择题，显示选项
+                    if q.get('question_type') == 'mcq' and q.get('options'):
+                        lines.append(f"\n      Options: {', '.join(q.get('options', []))}")
+                    
+                    lines.append(f"\n      Student's answer: {q.get('student_answer', 'N/A')}")
+                    
+                    if not q.get('is_correct', True):
+                        lines.append(f"\n      Correct answer: {q.get('correct_answer', 'N/A')}")
+                        if q.get('feedback'):
+                            lines.append(f"\n      Feedback: {q.get('feedback', '')}")
+                    builder.add('questions', "".join(lines), PROMPT_PRIORITY_CORRECT_ANSWERS if is_correct else PROMPT_PRIORITY_PRACTICE)
+        
+        # 学习计划信息
+        plan_data = student.plan
+        if plan_data:
+            ai_summary = plan_data.get('aiSummary', {})
+            tasks = ai_summary.get('tasks', [])
+            if tasks:
+                plan_lines = [f"\n\nAI-generated study plan includes {len(tasks)} tasks: "]
+                for task in tasks[:3]:  # 只包含前3个任务
+                    task_title = task.get('taskTitle', 'Unknown Task')
+                    parts_count = len(task.get('parts', []))
+                    plan_lines.append(f"\n- {task_title} ({parts_count} parts)")
+                builder.add('plan', "".join(plan_lines), PROMPT_PRIORITY_PLAN)
+        
+        # 对话历史（最新在前），保留最近的20条，按时间顺序输出
+        for msg in (conversation_history or [])[:20]:
+            role = "Student" if msg['type'] == 'user' else "Coach"
+            content = msg['content'][:200]  # 限制长度
+            builder.add('history', f"{role}: {content}\n", PROMPT_PRIORITY_HISTORY)
+        
+        # 回复缓存键：提示版本 + 学生上下文 + 最近历史 + 规范化后的消息
+        student_context = f"{account.student_id}|{account.name}" + builder.content('courses', 'tasks', 'practice', 'questions', 'plan')
+        cache_key = response_cache.make_key(CHAT_PROMPT_VERSION, student_context, list(reversed(conversation_history or [])), message)
+        
+        # 构建AI提示：说明和当前消息始终保留，上下文按优先级裁剪到预算内
+        system_prompt = builder.build(
+            head=f"""You are an AI Learning Coach helping university students with their studies. You are supportive, encouraging, and provide practical advice.
 
 Your role:
 - Help students understand their study plans and assignments
@@ -1611,33 +1418,66 @@ Guidelines:
 
 Student context:
 - Student ID: {account.student_id}
-- Name: {account.name or 'Student'}{courses_context}{tasks_context}{practice_context}{plan_context}{history_context}
+- Name: {account.name or 'Student'}""",
+            tail=f"""
 
 Current student message: {message}
 
 Respond as their AI Learning Coach. Use the student's actual course, task, and practice test information to provide personalized, relevant advice. Keep responses concise unless student asks for detailed explanation of a specific question. Do not use "Test Student" - address them naturally or by their actual name."""
-            # 调用Gemini AI
-            response = _model.generate_content(system_prompt)
+        )
+        if builder.dropped:
+            print(f"[DEBUG] 提示超出预算，已裁剪: {builder.dropped}")
+        return system_prompt, cache_key
+    
+    def generate_ai_response(self, message: str, account: StudentAccount, conversation_history: Optional[list[dict[str, Any]]] = None) -> str:
+        """使用Gemini AI生成智能回复"""
+        if not use_gemini or not gemini_client.available():
+            # 如果没有AI（或Gemini熔断中），回退到基于规则的回复
+            return self.generate_rule_based_response(message, account)
+        
+        try:
+            system_prompt, cache_key = self.build_chat_prompt(message, account, conversation_history)
+            # 相同上下文下的重复问题直接返回缓存的回复
+            cached_reply = response_cache.get(cache_key)
+            if cached_reply:
+                print(f"[DEBUG] 聊天回复缓存命中: user={account.student_id}")
+                return cached_reply
             
-            if response and response.candidates and len(response.candidates) > 0:
-                candidate = response.candidates[0]
-                if candidate.content and candidate.content.parts:
-                    ai_text = ""
-                    for part in candidate.content.parts:
-                        if hasattr(part, 'text'):
-                            ai_text += part.text
-                    
-                    if ai_text.strip():
-                        # 清理AI回复中的HTML标签和markdown格式
-                        cleaned_text = self.clean_ai_response(ai_text)
-                        return cleaned_text
+            # 调用Gemini AI
+            ai_text = gemini_client.generate(system_prompt, CHAT_GENERATION_CONFIG)
+            # 清理AI回复中的HTML标签和markdown格式
+            cleaned_text = self.clean_ai_response(ai_text)
+            response_cache.put(cache_key, cleaned_text)
+            return cleaned_text
             
-            # 如果AI回复失败，回退到基于规则的回复
+        except gemini_client.CircuitOpenError:
+            return self.generate_rule_based_response(message, account)
+        except Exception as e:
+            print(f"[DEBUG] AI回复生成失败: {e}")
+            # 回退到基于规则的回复
             return self.generate_general_response()
+    
+    async def agenerate_ai_response(self, message: str, account: StudentAccount, conversation_history: Optional[list[dict[str, Any]]] = None) -> str:
+        """generate_ai_response的异步版本：数据库查询放到线程中，等待Gemini时不占用线程"""
+        if not use_gemini or not gemini_client.available():
+            return await sync_to_async(self.generate_rule_based_response)(message, account)
+        
+        try:
+            system_prompt, cache_key = await sync_to_async(self.build_chat_prompt)(message, account, conversation_history)
+            cached_reply = await response_cache.aget(cache_key)
+            if cached_reply:
+                print(f"[DEBUG] 聊天回复缓存命中: user={account.student_id}")
+                return cached_reply
+            
+            ai_text = await gemini_client.agenerate(system_prompt, CHAT_GENERATION_CONFIG)
+            cleaned_text = self.clean_ai_response(ai_text)
+            await response_cache.aput(cache_key, cleaned_text)
+            return cleaned_text
             
+        except gemini_client.CircuitOpenError:
+            return await sync_to_async(self.generate_rule_based_response)(message, account)
         except Exception as e:
             print(f"[DEBUG] AI回复生成失败: {e}")
-            # 回退到基于规则的回复
             return self.generate_general_response()
     
     def process_message(self, account: StudentAccount, message: str) -> dict[str, Any]:
@@ -1646,8 +1486,8 @@ Respond as their AI Learning Coach. Use the student's actual course, task, and p
             # 获取或创建对话会话
             conversation = self.get_or_create_conversation(account)
             
-            # 获取对话历史用于上下文 - 增加到30条以提供更多上下文
-            conversation_history = self.get_conversation_history(account, limit=30)
+            # 获取对话历史用于上下文（最近30条，来自缓存的环形缓冲区）
+            conversation_history = recent_history(conversation.id)
             
             # 检查是否是欢迎消息（自动发送的初始化消息）
             if message.lower().strip() == 'welcome':
@@ -1661,6 +1501,7 @@ Respond as their AI Learning Coach. Use the student's actual course, task, and p
                     content=ai_response,
                     metadata={'intent': 'welcome', 'ai_powered': False, 'is_welcome': True}
                 )
+                append_message(ai_message)
                 
                 return {
                     'success': True,
@@ -1674,311 +1515,413 @@ Respond as their AI Learning Coach. Use the student's actual course, task, and p
                     }
                 }
             
-            # 对于用户的真实消息，正常处理
-            # 保存用户消息
-            print(f"[DEBUG] 保存用户消息到数据库: user={account.student_id}, message={message}")
-            user_message = ChatMessage.objects.create(  # type: ignore
-                conversation=conversation,
-                message_type='user',
-                content=message
-            )
-            print(f"[DEBUG] 用户消息已保存，ID: {user_message.id}")
+            user_message = self._record_user_message(conversation, account, message)
+            intent, ai_response = self._route_message(account, message, conversation_history)
+            if ai_response is None:
+                ai_response = self.generate_ai_response(message, account, conversation_history)
+            return self._save_ai_reply(conversation, user_message, intent, ai_response)
             
-            # 更新对话的最后活动时间
-            from django.utils import timezone
-            conversation.last_activity_at = timezone.now()
-            conversation.save()
+        except Exception as e:
+            print(f"[DEBUG] 消息处理失败: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    async def aprocess_message(self, account: StudentAccount, message: str) -> dict[str, Any]:
+        """process_message的异步版本，供ASGI下的异步视图使用"""
+        if message.lower().strip() == 'welcome':
+            return await sync_to_async(self.process_message)(account, message)
+        try:
+            conversation, user_message, intent, ai_response, conversation_history = \
+                await sync_to_async(self._prepare_reply)(account, message)
+            if ai_response is None:
+                ai_response = await self.agenerate_ai_response(message, account, conversation_history)
+            return await sync_to_async(self._save_ai_reply)(conversation, user_message, intent, ai_response)
+        except Exception as e:
+            print(f"[DEBUG] 消息处理失败: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    def _prepare_reply(self, account: StudentAccount, message: str) -> tuple:
+        """保存用户消息并路由，返回 (conversation, user_message, intent, 回复或None, 对话历史)"""
+        conversation = self.get_or_create_conversation(account)
+        conversation_history = recent_history(conversation.id)
+        user_message = self._record_user_message(conversation, account, message)
+        intent, ai_response = self._route_message(account, message, conversation_history)
+        return conversation, user_message, intent, ai_response, conversation_history
+    
+    async def astream_ai_response(self, message: str, account: StudentAccount, conversation_history: Optional[list[dict[str, Any]]] = None) -> AsyncIterator[dict[str, Any]]:
+        """与agenerate_ai_response相同，但逐块产出 delta 事件；最后产出一个 reply 事件，内容为清理后的完整回复（不发给客户端）"""
+        if not use_gemini or not gemini_client.available():
+            ai_response = await sync_to_async(self.generate_rule_based_response)(message, account)
+            yield {'event': 'delta', 'data': {'text': ai_response}}
+            yield {'event': 'reply', 'data': {'text': ai_response}}
+            return
+        
+        chunks: list[str] = []
+        try:
+            system_prompt, cache_key = await sync_to_async(self.build_chat_prompt)(message, account, conversation_history)
+            cached_reply = await response_cache.aget(cache_key)
+            if cached_reply:
+                print(f"[DEBUG] 聊天回复缓存命中: user={account.student_id}")
+                yield {'event': 'delta', 'data': {'text': cached_reply}}
+                yield {'event': 'reply', 'data': {'text': cached_reply}}
+                return
             
-            # 获取当前用户模式
-            current_mode = self.get_current_mode(account.student_id)
-            print(f"[DEBUG] 当前用户模式: {current_mode}")
+            async for chunk in gemini_client.agenerate_stream(system_prompt, CHAT_GENERATION_CONFIG):
+                chunks.append(chunk)
+                yield {'event': 'delta', 'data': {'text': chunk}}
+            # 流结束后统一清理HTML标签和markdown格式
+            cleaned_text = self.clean_ai_response("".join(chunks))
+            await response_cache.aput(cache_key, cleaned_text)
+            yield {'event': 'reply', 'data': {'text': cleaned_text}}
+            return
             
-            # 优先级1: 检查是否是显式模块触发词
-            if self.is_explain_plan_request(message) and current_mode != 'study_plan_qna':
-                # 进入study_plan_qna模式
-                self.set_current_mode(account.student_id, 'study_plan_qna', 'awaiting_question')
-                ai_response = self.generate_explain_plan_welcome()
-                intent = 'study_plan_qna'
-            elif self.is_practice_request(message) and current_mode != 'practice_setup':
-                # 检查是否是练习请求,如果是,启动练习设置模式
-                available_courses = self.get_student_courses(account)
-                mentioned_course, mentioned_topic = self.extract_course_and_topic_from_message(message, available_courses)
-                
-                print(f"[DEBUG] 练习请求检测: 课程={mentioned_course}, 主题={mentioned_topic}")
-                
-                # 如果用户同时提供了课程和主题,直接生成练习
-                if mentioned_course and mentioned_topic:
-                    # 验证课程和主题
-                    is_course_valid, valid_course = self.validate_course_input(mentioned_course, available_courses)
-                    if is_course_valid:
-                        topics = self.get_course_topics(valid_course)
-                        is_topic_valid, valid_topic = self.validate_topic_input(mentioned_topic, topics)
-                        
-                        if is_topic_valid:
-                            # 课程和主题都有效,返回"正在生成"消息，让前端处理
-                            print(f"[DEBUG] 开始练习生成流程: {valid_course} - {valid_topic}")
-                            ai_response = f"""
-                            <div>
-                                <div style="font-weight: 700; margin-bottom: 8px;">
-                                    Great choice 💪
-                                </div>
-                                <div style="margin-bottom: 12px;">
-                                    I'm now generating a practice set for {valid_course} – {valid_topic}.
-                                    Please wait a moment…
-                                </div>
-                            </div>
-                            """
-                        else:
-                            # 主题无效
-                            self.set_practice_setup_mode(account.student_id, 'topic', valid_course)
-                            ai_response = f"""
+        except gemini_client.CircuitOpenError:
+            fallback = await sync_to_async(self.generate_rule_based_response)(message, account)
+        except Exception as e:
+            print(f"[DEBUG] AI流式回复生成失败: {e}")
+            if chunks:
+                # 已经发出部分内容，保留已收到的部分
+                yield {'event': 'reply', 'data': {'text': self.clean_ai_response("".join(chunks))}}
+                return
+            fallback = self.generate_general_response()
+        yield {'event': 'delta', 'data': {'text': fallback}}
+        yield {'event': 'reply', 'data': {'text': fallback}}
+    
+    async def astream_message(self, account: StudentAccount, message: str) -> AsyncIterator[dict[str, Any]]:
+        """aprocess_message的流式版本：产出 delta 事件，最后产出带已保存回复的 done 事件（或 error 事件）。
+        数据库读写通过sync_to_async在线程中执行，等待Gemini时不占用线程"""
+        try:
+            if message.lower().strip() == 'welcome':
+                result = await sync_to_async(self.process_message)(account, message)
+                if not result.get('success'):
+                    yield {'event': 'error', 'data': result}
+                    return
+                yield {'event': 'delta', 'data': {'text': result['ai_response']['content']}}
+                yield {'event': 'done', 'data': result}
+                return
+            
+            conversation, user_message, intent, ai_response, conversation_history = \
+                await sync_to_async(self._prepare_reply)(account, message)
+            if ai_response is None:
+                async for item in self.astream_ai_response(message, account, conversation_history):
+                    if item['event'] == 'reply':
+                        ai_response = item['data']['text']
+                    else:
+                        yield item
+            else:
+                yield {'event': 'delta', 'data': {'text': ai_response}}
+            # done 事件中的内容为最终保存的（清理后的）回复
+            saved = await sync_to_async(self._save_ai_reply)(conversation, user_message, intent, ai_response)
+            yield {'event': 'done', 'data': saved}
+            
+        except Exception as e:
+            print(f"[DEBUG] 流式消息处理失败: {e}")
+            yield {'event': 'error', 'data': {'success': False, 'error': str(e)}}
+    
+    def _record_user_message(self, conversation: ChatConversation, account: StudentAccount, message: str) -> ChatMessage:
+        """保存用户消息并更新对话的最后活动时间"""
+        # 对于用户的真实消息，正常处理
+        # 保存用户消息
+        print(f"[DEBUG] 保存用户消息到数据库: user={account.student_id}, message={message}")
+        user_message = ChatMessage.objects.create(  # type: ignore
+            conversation=conversation,
+            message_type='user',
+            content=message
+        )
+        print(f"[DEBUG] 用户消息已保存，ID: {user_message.id}")
+        append_message(user_message)
+        
+        # 更新对话的最后活动时间
+        from django.utils import timezone
+        conversation.last_activity_at = timezone.now()
+        conversation.save()
+        return user_message
+    
+    def _route_message(self, account: StudentAccount, message: str, conversation_history: list[dict[str, Any]]) -> tuple[str, Optional[str]]:
+        """根据当前模式和意图决定回复，返回 (intent, 回复)；回复为None表示需要由AI生成"""
+        # 获取当前用户模式
+        current_mode = self.get_current_mode(account.student_id)
+        print(f"[DEBUG] 当前用户模式: {current_mode}")
+        
+        # 优先级1: 检查是否是显式模块触发词
+        if self.is_explain_plan_request(message) and current_mode != 'study_plan_qna':
+            # 进入study_plan_qna模式
+            self.set_current_mode(account.student_id, 'study_plan_qna', 'awaiting_question')
+            ai_response = self.generate_explain_plan_welcome()
+            intent = 'study_plan_qna'
+        elif self.is_practice_request(message) and current_mode != 'practice_setup':
+            # 检查是否是练习请求,如果是,启动练习设置模式
+            available_courses = self.get_student_courses(account)
+            mentioned_course, mentioned_topic = self.extract_course_and_topic_from_message(message, available_courses)
+            
+            print(f"[DEBUG] 练习请求检测: 课程={mentioned_course}, 主题={mentioned_topic}")
+            
+            # 如果用户同时提供了课程和主题,直接生成练习
+            if mentioned_course and mentioned_topic:
+                # 验证课程和主题
+                is_course_valid, valid_course = self.validate_course_input(mentioned_course, available_courses)
+                if is_course_valid:
+                    topics = self.get_course_topics(valid_course)
+                    is_topic_valid, valid_topic = self.validate_course_topic(mentioned_topic, valid_course)
+                    
+                    if is_topic_valid:
+                        # 课程和主题都有效,返回"正在生成"消息，让前端处理
+                        print(f"[DEBUG] 开始练习生成流程: {valid_course} - {valid_topic}")
+                        ai_response = f"""
                         <div>
                             <div style="font-weight: 700; margin-bottom: 8px;">
-                                I couldn't find that topic in {valid_course} 😅
+                                Great choice 💪
                             </div>
                             <div style="margin-bottom: 12px;">
-                                Here are some topics covered in this course:
-                            </div>
-                            <div style="background: #f8f9fa; padding: 12px; border-radius: 6px; margin-bottom: 12px; line-height: 1.6;">
-                                {chr(10).join(f'• {topic}' for topic in topics)}
-                            </div>
-                            <div>
-                                Please type the topic name you want to practise.
+                                I'm now generating a practice set for {valid_course} – {valid_topic}.
+                                Please wait a moment…
                             </div>
                         </div>
                         """
                     else:
-                        # 课程无效
-                        self.set_practice_setup_mode(account.student_id, 'course')
+                        # 主题无效
+                        self.set_practice_setup_mode(account.student_id, 'topic', valid_course)
                         ai_response = f"""
+                    <div>
+                        <div style="font-weight: 700; margin-bottom: 8px;">
+                            I couldn't find that topic in {valid_course} 😅
+                        </div>
+                        <div style="margin-bottom: 12px;">
+                            Here are some topics covered in this course:
+                        </div>
+                        <div style="background: #f8f9fa; padding: 12px; border-radius: 6px; margin-bottom: 12px; line-height: 1.6;">
+                            {chr(10).join(f'• {topic}' for topic in topics)}
+                        </div>
                         <div>
-                            <div style="font-weight: 700; margin-bottom: 8px;">
-                                I couldn't find that course 😅
-                            </div>
-                            <div style="margin-bottom: 12px;">
-                                Here are the courses you're currently enrolled in:
-                            </div>
-                            <div style="background: #f8f9fa; padding: 12px; border-radius: 6px; margin-bottom: 12px; font-family: monospace;">
-                                {', '.join(available_courses)}
-                            </div>
-                            <div>
-                                Please type the course name you want to practise.
-                            </div>
+                            Please type the topic name you want to practise.
                         </div>
-                        """
-                # 如果没有提供课程和主题,启动练习设置模式
+                    </div>
+                    """
                 else:
-                    if available_courses:
-                        self.set_practice_setup_mode(account.student_id, 'course')
-                        ai_response = f"""
-                        <div>
-                            <div style="font-weight: 700; margin-bottom: 8px;">
-                                Great idea to work on your weak topics 😊
-                            </div>
-                            <div style="margin-bottom: 12px;">
-                                Before we start, which course would you like to practise?
-                            </div>
-                            <div style="margin-bottom: 12px;">
-                                Here are the courses you're currently enrolled in:
-                            </div>
-                            <div style="background: #f8f9fa; padding: 12px; border-radius: 6px; margin-bottom: 12px; font-family: monospace;">
-                                {', '.join(available_courses)}
-                            </div>
-                            <div style="margin-bottom: 12px;">
-                                Please type the course name you want to practise.
-                            </div>
-                            <div style="font-size: 13px; color: #6c757d; font-style: italic;">
-                                Or type <strong>stop</strong> to return to normal chat.
-                            </div>
+                    # 课程无效
+                    self.set_practice_setup_mode(account.student_id, 'course')
+                    ai_response = f"""
+                    <div>
+                        <div style="font-weight: 700; margin-bottom: 8px;">
+                            I couldn't find that course 😅
+                        </div>
+                        <div style="margin-bottom: 12px;">
+                            Here are the courses you're currently enrolled in:
+                        </div>
+                        <div style="background: #f8f9fa; padding: 12px; border-radius: 6px; margin-bottom: 12px; font-family: monospace;">
+                            {', '.join(available_courses)}
                         </div>
-                        """
-                    else:
-                        ai_response = """
                         <div>
-                            <div style="font-weight: 700; margin-bottom: 8px;">
-                                I don't see any courses in your enrollment yet 📚
-                            </div>
-                            <div style="line-height: 1.6;">
-                                To get started with practice, please enroll in some courses first. 
-                                You can do this from the "My Courses" section.
-                            </div>
+                            Please type the course name you want to practise.
                         </div>
-                        """
-                intent = 'practice'
-            # 优先级2: 检查是否在特定模式中
-            elif current_mode == 'study_plan_qna':
-                # 在study_plan_qna模式中，使用专门的处理逻辑
-                ai_response = self.handle_study_plan_qna_mode(account, message)
-                if ai_response is None:
-                    # 🔑 如果返回None，说明检测到了其他请求(如practice)，需要重新处理
-                    # 重新检测意图并处理
-                    if self.is_practice_request(message):
-                        # 处理练习请求
-                        available_courses = self.get_student_courses(account)
-                        mentioned_course, mentioned_topic = self.extract_course_and_topic_from_message(message, available_courses)
-                        
-                        if mentioned_course and mentioned_topic:
-                            # 验证课程和主题
-                            is_course_valid, valid_course = self.validate_course_input(mentioned_course, available_courses)
-                            if is_course_valid:
-                                topics = self.get_course_topics(valid_course)
-                                is_topic_valid, valid_topic = self.validate_topic_input(mentioned_topic, topics)
-                                
-                                if is_topic_valid:
-                                    ai_response = f"""
-                            <div>
-                                <div style="font-weight: 700; margin-bottom: 8px;">
-                                    Great choice 💪
-                                </div>
-                                <div style="margin-bottom: 12px;">
-                                    I'm now generating a practice set for {valid_course} – {valid_topic}.
-                                    Please wait a moment…
-                                </div>
-                            </div>
-                            """
-                                else:
-                                    self.set_practice_setup_mode(account.student_id, 'topic', valid_course)
-                                    ai_response = f"""
+                    </div>
+                    """
+            # 如果没有提供课程和主题,启动练习设置模式
+            else:
+                if available_courses:
+                    self.set_practice_setup_mode(account.student_id, 'course')
+                    ai_response = f"""
+                    <div>
+                        <div style="font-weight: 700; margin-bottom: 8px;">
+                            Great idea to work on your weak topics 😊
+                        </div>
+                        <div style="margin-bottom: 12px;">
+                            Before we start, which course would you like to practise?
+                        </div>
+                        <div style="margin-bottom: 12px;">
+                            Here are the courses you're currently enrolled in:
+                        </div>
+                        <div style="background: #f8f9fa; padding: 12px; border-radius: 6px; margin-bottom: 12px; font-family: monospace;">
+                            {', '.join(available_courses)}
+                        </div>
+                        <div style="margin-bottom: 12px;">
+                            Please type the course name you want to practise.
+                        </div>
+                        <div style="font-size: 13px; color: #6c757d; font-style: italic;">
+                            Or type <strong>stop</strong> to return to normal chat.
+                        </div>
+                    </div>
+                    """
+                else:
+                    ai_response = """
+                    <div>
+                        <div style="font-weight: 700; margin-bottom: 8px;">
+                            I don't see any courses in your enrollment yet 📚
+                        </div>
+                        <div style="line-height: 1.6;">
+                            To get started with practice, please enroll in some courses first. 
+                            You can do this from the "My Courses" section.
+                        </div>
+                    </div>
+                    """
+            intent = 'practice'
+        # 优先级2: 检查是否在特定模式中
+        elif current_mode == 'study_plan_qna':
+            # 在study_plan_qna模式中，使用专门的处理逻辑
+            ai_response = self.handle_study_plan_qna_mode(account, message)
+            if ai_response is None:
+                # 🔑 如果返回None，说明检测到了其他请求(如practice)，需要重新处理
+                # 重新检测意图并处理
+                if self.is_practice_request(message):
+                    # 处理练习请求
+                    available_courses = self.get_student_courses(account)
+                    mentioned_course, mentioned_topic = self.extract_course_and_topic_from_message(message, available_courses)
+                    
+                    if mentioned_course and mentioned_topic:
+                        # 验证课程和主题
+                        is_course_valid, valid_course = self.validate_course_input(mentioned_course, available_courses)
+                        if is_course_valid:
+                            topics = self.get_course_topics(valid_course)
+                            is_topic_valid, valid_topic = self.validate_course_topic(mentioned_topic, valid_course)
+                            
+                            if is_topic_valid:
+                                ai_response = f"""
                         <div>
                             <div style="font-weight: 700; margin-bottom: 8px;">
-                                I couldn't find that topic in {valid_course} 😅
+                                Great choice 💪
                             </div>
                             <div style="margin-bottom: 12px;">
-                                Here are some topics covered in this course:
-                            </div>
-                            <div style="background: #f8f9fa; padding: 12px; border-radius: 6px; margin-bottom: 12px; line-height: 1.6;">
-                                {chr(10).join(f'• {topic}' for topic in topics)}
-                            </div>
-                            <div>
-                                Please type the topic name you want to practise.
+                                I'm now generating a practice set for {valid_course} – {valid_topic}.
+                                Please wait a moment…
                             </div>
                         </div>
                         """
                             else:
-                                self.set_practice_setup_mode(account.student_id, 'course')
+                                self.set_practice_setup_mode(account.student_id, 'topic', valid_course)
                                 ai_response = f"""
+                    <div>
+                        <div style="font-weight: 700; margin-bottom: 8px;">
+                            I couldn't find that topic in {valid_course} 😅
+                        </div>
+                        <div style="margin-bottom: 12px;">
+                            Here are some topics covered in this course:
+                        </div>
+                        <div style="background: #f8f9fa; padding: 12px; border-radius: 6px; margin-bottom: 12px; line-height: 1.6;">
+                            {chr(10).join(f'• {topic}' for topic in topics)}
+                        </div>
                         <div>
-                            <div style="font-weight: 700; margin-bottom: 8px;">
-                                I couldn't find that course 😅
-                            </div>
-                            <div style="margin-bottom: 12px;">
-                                Here are the courses you're currently enrolled in:
-                            </div>
-                            <div style="background: #f8f9fa; padding: 12px; border-radius: 6px; margin-bottom: 12px; font-family: monospace;">
-                                {', '.join(available_courses)}
-                            </div>
-                            <div>
-                                Please type the course name you want to practise.
-                            </div>
+                            Please type the topic name you want to practise.
                         </div>
-                        """
+                    </div>
+                    """
                         else:
-                            # 没有提供课程和主题,启动练习设置模式
-                            if available_courses:
-                                self.set_practice_setup_mode(account.student_id, 'course')
-                                ai_response = f"""
-                        <div>
-                            <div style="font-weight: 700; margin-bottom: 8px;">
-                                Great idea to work on your weak topics 😊
-                            </div>
-                            <div style="margin-bottom: 12px;">
-                                Before we start, which course would you like to practise?
-                            </div>
-                            <div style="margin-bottom: 12px;">
-                                Here are the courses you're currently enrolled in:
-                            </div>
-                            <div style="background: #f8f9fa; padding: 12px; border-radius: 6px; margin-bottom: 12px; font-family: monospace;">
-                                {', '.join(available_courses)}
-                            </div>
-                            <div>
-                                Please type the course name you want to practise.
-                            </div>
+                            self.set_practice_setup_mode(account.student_id, 'course')
+                            ai_response = f"""
+                    <div>
+                        <div style="font-weight: 700; margin-bottom: 8px;">
+                            I couldn't find that course 😅
+                        </div>
+                        <div style="margin-bottom: 12px;">
+                            Here are the courses you're currently enrolled in:
+                        </div>
+                        <div style="background: #f8f9fa; padding: 12px; border-radius: 6px; margin-bottom: 12px; font-family: monospace;">
+                            {', '.join(available_courses)}
                         </div>
-                        """
-                            else:
-                                ai_response = """
                         <div>
-                            <div style="font-weight: 700; margin-bottom: 8px;">
-                                I don't see any courses in your enrollment yet 📚
-                            </div>
-                            <div style="line-height: 1.6;">
-                                To get started with practice, please enroll in some courses first. 
-                                You can do this from the "My Courses" section.
-                            </div>
+                            Please type the course name you want to practise.
                         </div>
-                        """
-                        intent = 'practice'
+                    </div>
+                    """
                     else:
-                        # 其他情况，使用通用回复
-                        intent = self.detect_intent(message)
-                        ai_response = self.generate_general_response()
+                        # 没有提供课程和主题,启动练习设置模式
+                        if available_courses:
+                            self.set_practice_setup_mode(account.student_id, 'course')
+                            ai_response = f"""
+                    <div>
+                        <div style="font-weight: 700; margin-bottom: 8px;">
+                            Great idea to work on your weak topics 😊
+                        </div>
+                        <div style="margin-bottom: 12px;">
+                            Before we start, which course would you like to practise?
+                        </div>
+                        <div style="margin-bottom: 12px;">
+                            Here are the courses you're currently enrolled in:
+                        </div>
+                        <div style="background: #f8f9fa; padding: 12px; border-radius: 6px; margin-bottom: 12px; font-family: monospace;">
+                            {', '.join(available_courses)}
+                        </div>
+                        <div>
+                            Please type the course name you want to practise.
+                        </div>
+                    </div>
+                    """
+                        else:
+                            ai_response = """
+                    <div>
+                        <div style="font-weight: 700; margin-bottom: 8px;">
+                            I don't see any courses in your enrollment yet 📚
+                        </div>
+                        <div style="line-height: 1.6;">
+                            To get started with practice, please enroll in some courses first. 
+                            You can do this from the "My Courses" section.
+                        </div>
+                    </div>
+                    """
+                    intent = 'practice'
                 else:
-                    intent = 'study_plan_qna'
-            elif self.is_in_practice_setup_mode(account.student_id):
-                # 在练习设置模式中，使用专门的处理逻辑
-                ai_response = self.handle_practice_setup_mode(account, message)
-                if ai_response is None:
-                    # 如果返回None，说明模式已结束，回退到普通处理
-                    self.clear_practice_setup_mode(account.student_id)
+                    # 其他情况，使用通用回复
                     intent = self.detect_intent(message)
                     ai_response = self.generate_general_response()
-                else:
-                    # 在练习设置模式中，设置intent为practice
-                    intent = 'practice'
             else:
-                # 普通模式：根据意图生成回复
+                intent = 'study_plan_qna'
+        elif self.is_in_practice_setup_mode(account.student_id):
+            # 在练习设置模式中，使用专门的处理逻辑
+            ai_response = self.handle_practice_setup_mode(account, message)
+            if ai_response is None:
+                # 如果返回None，说明模式已结束，回退到普通处理
+                self.clear_practice_setup_mode(account.student_id)
                 intent = self.detect_intent(message)
-                
-                if intent == 'explain_plan':
-                    # 对于计划解释请求，返回保存的计划描述
-                    ai_response = self.generate_plan_explanation(account)
-                elif intent == 'task_help':
-                    # 对于任务帮助请求，生成任务相关的回复
-                    ai_response = self.generate_ai_response(message, account, conversation_history)
-                elif intent == 'encouragement':
-                    # 对于鼓励请求，生成鼓励性回复
-                    ai_response = self.generate_ai_response(message, account, conversation_history)
-                elif intent == 'greeting':
-                    # 对于问候，生成问候回复
-                    ai_response = self.generate_ai_response(message, account, conversation_history)
-                else:
-                    # 对于其他消息，使用AI生成智能回复
-                    ai_response = self.generate_ai_response(message, account, conversation_history)
-            
-            # 保存AI回复
-            print(f"[DEBUG] 保存AI回复到数据库: user={account.student_id}, response={ai_response[:50]}...")
-            ai_message = ChatMessage.objects.create(  # type: ignore
-                conversation=conversation,
-                message_type='ai',
-                content=ai_response,
-                metadata={'intent': intent, 'ai_powered': use_gemini and intent != 'explain_plan'}
-            )
-            print(f"[DEBUG] AI回复已保存，ID: {ai_message.id}")
-            
-            return {
-                'success': True,
-                'user_message': {
-                    'id': user_message.id,  # type: ignore
-                    'content': user_message.content,  # type: ignore
-                    'timestamp': user_message.timestamp.isoformat(),  # type: ignore
-                    'type': 'user'
-                },
-                'ai_response': {
-                    'id': ai_message.id,  # type: ignore
-                    'content': ai_message.content,  # type: ignore
-                    'timestamp': ai_message.timestamp.isoformat(),  # type: ignore
-                    'type': 'ai',
-                    'intent': intent,
-                    'ai_powered': use_gemini and intent != 'explain_plan'
-                }
-            }
+                ai_response = self.generate_general_response()
+            else:
+                # 在练习设置模式中，设置intent为practice
+                intent = 'practice'
+        else:
+            # 普通模式：根据意图生成回复
+            intent = self.detect_intent(message)
             
-        except Exception as e:
-            print(f"[DEBUG] 消息处理失败: {e}")
-            return {
-                'success': False,
-                'error': str(e)
+            if intent == 'explain_plan':
+                # 对于计划解释请求，返回保存的计划描述
+                ai_response = self.generate_plan_explanation(account)
+            else:
+                # 任务帮助、鼓励、问候及其他消息，都由调用方用AI生成智能回复
+                ai_response = None
+        return intent, ai_response
+    
+    def _save_ai_reply(self, conversation: ChatConversation, user_message: ChatMessage, intent: str, ai_response: str) -> dict[str, Any]:
+        """保存AI回复并返回接口响应"""
+        # 保存AI回复
+        print(f"[DEBUG] 保存AI回复到数据库: conversation={conversation.id}, response={ai_response[:50]}...")
+        ai_message = ChatMessage.objects.create(  # type: ignore
+            conversation=conversation,
+            message_type='ai',
+            content=ai_response,
+            metadata={'intent': intent, 'ai_powered': use_gemini and intent != 'explain_plan'}
+        )
+        print(f"[DEBUG] AI回复已保存，ID: {ai_message.id}")
+        append_message(ai_message)
+        
+        return {
+            'success': True,
+            'user_message': {
+                'id': user_message.id,  # type: ignore
+                'content': user_message.content,  # type: ignore
+                'timestamp': user_message.timestamp.isoformat(),  # type: ignore
+                'type': 'user'
+            },
+            'ai_response': {
+                'id': ai_message.id,  # type: ignore
+                'content': ai_message.content,  # type: ignore
+                'timestamp': ai_message.timestamp.isoformat(),  # type: ignore
+                'type': 'ai',
+                'intent': intent,
+                'ai_powered': use_gemini and intent != 'explain_plan'
             }
+        }
     
     def get_conversation_history(self, account: StudentAccount, limit: int = 50, days: int = None) -> list[dict[str, Any]]:
         """获取用户的对话历史
@@ -1990,12 +1933,7 @@ Respond as their AI Learning Coach. Use the student's actual course, task, and p
         """
         try:
             print(f"[DEBUG] 获取对话历史: user={account.student_id}, limit={limit}, days={days}")
-            # 创建临时User对象用于查询
-            user, _ = User.objects.get_or_create(  # type: ignore
-                username=account.student_id,
-                defaults={'email': account.email or f'{account.student_id}@temp.com'}
-            )
-            conversation = ChatConversation.objects.filter(user=user, is_active=True).first()  # type: ignore
+            conversation = ChatConversation.objects.filter(user_id=user_id_for(account), is_active=True).first()  # type: ignore
             if not conversation:
                 print(f"[DEBUG] 没有找到对话记录: user={account.student_id}")
                 return []
@@ -2033,34 +1971,22 @@ Respond as their AI Learning Coach. Use the student's actual course, task, and p
         """保存用户的学习计划数据"""
         try:
             # 确保User和StudentAccount一致
-            user, created = User.objects.get_or_create(  # type: ignore
-                username=account.student_id,
-                defaults={
-                    'email': account.email or f'{account.student_id}@temp.com',
-                    'first_name': account.name if account.name else f'Student {account.student_id}'
-                }
-            )
-            
-            if created:
-                print(f"[DEBUG] create new Django User: {user.username} for StudentAccount: {account.student_id}")
-            else:
-                # 确保现有User的email与StudentAccount同步
-                if account.email and user.email != account.email:
-                    user.email = account.email
-                    user.save()
-                    print(f"[DEBUG] 同步了User email: {user.email}")
+            user_id = user_id_for(account)
+            if account.email and User.objects.filter(id=user_id).exclude(email=account.email).update(email=account.email):  # type: ignore
+                print(f"[DEBUG] 同步了User email: {account.email}")
                     
-            print(f"[DEBUG] save plan - StudentAccount: {account.student_id} -> Django User: {user.username}")
+            print(f"[DEBUG] save plan - StudentAccount: {account.student_id} -> Django User id: {user_id}")
             
             # 将之前的计划设为非活跃
-            UserStudyPlan.objects.filter(user=user, is_active=True).update(is_active=False)  # type: ignore
+            UserStudyPlan.objects.filter(user_id=user_id, is_active=True).update(is_active=False)  # type: ignore
             
             # 创建新的活跃计划
             UserStudyPlan.objects.create(  # type: ignore
-                user=user,
+                user_id=user_id,
                 plan_data=plan_data,
                 is_active=True
             )
+            invalidate_student_context(account.student_id)
             
             return True
         except Exception:
@@ -2146,7 +2072,7 @@ Respond as their AI Learning Coach. Use the student's actual course, task, and p
             
             # 验证用户输入的主题
             available_topics = self.get_course_topics(current_course)
-            is_valid, valid_topic = self.validate_topic_input(message, available_topics)
+            is_valid, valid_topic = self.validate_course_topic(message, current_course)
             
             if not is_valid:
                 topics_text = '\n'.join([f"• {t.title()}" for t in available_topics[:10]])
@@ -2188,28 +2114,24 @@ Respond as their AI Learning Coach. Use the student's actual course, task, and p
     
     def extract_current_course_from_history(self, conversation_history: list[dict[str, Any]]) -> str:
         """从对话历史中提取当前讨论的课程"""
+        if isinstance(conversation_history, RecentHistory):
+            return conversation_history.current_course
         if not conversation_history:
             return None
         
-        # 查找最近的AI消息
+        # 查找最近的、提到课程代码的AI消息
         for msg in conversation_history:
             if msg['type'] == 'ai':
-                content = msg['content']
-                
-                # 尝试从消息中提取课程代码
-                import re
-                course_match = re.search(r'practise? ([A-Z]{4}\d{4})', content, re.IGNORECASE)
-                if course_match:
-                    return course_match.group(1).upper()
-                
-                course_match = re.search(r'available topics for ([A-Z]{4}\d{4})', content, re.IGNORECASE)
-                if course_match:
-                    return course_match.group(1).upper()
+                course = course_in(msg['content'])
+                if course:
+                    return course
         
         return None
     
     def detect_practice_step(self, conversation_history: list[dict[str, Any]]) -> str:
         """检测当前练习对话处于哪个步骤"""
+        if isinstance(conversation_history, RecentHistory):
+            return conversation_history.practice_step
         if not conversation_history:
             return 'start'
         
@@ -2223,19 +2145,8 @@ Respond as their AI Learning Coach. Use the student's actual course, task, and p
         if not last_ai_message:
             return 'start'
         
-        content = last_ai_message['content']
-        
         # 检查各种步骤的标识文本
-        if 'which course would you like to practise?' in content.lower():
-            return 'waiting_for_course'
-        elif 'which topic would you like to focus on?' in content.lower() or 'which topic would you like to work on?' in content.lower():
-            return 'waiting_for_topic'
-        elif 'here are some topics available for this course:' in content.lower():
-            return 'waiting_for_topic_selection'
-        elif 'i\'m now generating a practice set for' in content.lower():
-            return 'practice_ready'
-        
-        return 'start'
+        return practice_step(last_ai_message['content'])
     
     def handle_case_1_step_1(self, available_courses: list[str]) -> str:
         """Case 1 - Step 1: 询问课程"""
@@ -2261,31 +2172,6 @@ Respond as their AI Learning Coach. Use the student's actual course, task, and p
         </div>
         """
     
-    def validate_topic_input(self, user_input: str, available_topics: list[str]) -> tuple[bool, str]:
-        """验证用户输入的主题是否有效"""
-        user_input_clean = user_input.strip().lower()
-        
-        # 精确匹配（忽略大小写）
-        for topic in available_topics:
-            if topic.lower() == user_input_clean:
-                return True, topic
-        
-        # 包含匹配
-        for topic in available_topics:
-            if user_input_clean in topic.lower() or topic.lower() in user_input_clean:
-                return True, topic
-        
-        # 关键词匹配
-        user_words = user_input_clean.split()
-        for topic in available_topics:
-            topic_words = topic.lower().split()
-            # 如果用户输入的词汇中有超过一半匹配主题词汇，则认为匹配
-            matches = sum(1 for word in user_words if word in topic_words)
-            if matches >= min(2, len(user_words), len(topic_words)):
-                return True, topic
-        
-        return False, None
-    
     def handle_case_2_step_1(self, mentioned_course: str, available_courses: list[str], account: StudentAccount) -> str:
         """Case 2 - Step 1: 处理用户指定的课程"""
         # 验证课程是否在学生课程列表中
@@ -2354,31 +2240,6 @@ Respond as their AI Learning Coach. Use the student's actual course, task, and p
         </div>
         """
     
-    def validate_topic_input(self, user_input: str, available_topics: list[str]) -> tuple[bool, str]:
-        """验证用户输入的主题是否有效"""
-        user_input_clean = user_input.strip().lower()
-        
-        # 精确匹配（忽略大小写）
-        for topic in available_topics:
-            if topic.lower() == user_input_clean:
-                return True, topic
-        
-        # 包含匹配
-        for topic in available_topics:
-            if user_input_clean in topic.lower() or topic.lower() in user_input_clean:
-                return True, topic
-        
-        # 关键词匹配
-        user_words = user_input_clean.split()
-        for topic in available_topics:
-            topic_words = topic.lower().split()
-            # 如果用户输入的词汇中有超过一半匹配主题词汇，则认为匹配
-            matches = sum(1 for word in user_words if word in topic_words)
-            if matches >= min(2, len(user_words), len(topic_words)):
-                return True, topic
-        
-        return False, None
-    
     def handle_case_3_step_1(self, mentioned_topic: str, available_courses: list[str]) -> str:
         """Case 3 - Step 1: 用户指定了主题但没有课程"""
         courses_text = ', '.join(available_courses)
@@ -2403,31 +2264,6 @@ Respond as their AI Learning Coach. Use the student's actual course, task, and p
         </div>
         """
     
-    def validate_topic_input(self, user_input: str, available_topics: list[str]) -> tuple[bool, str]:
-        """验证用户输入的主题是否有效"""
-        user_input_clean = user_input.strip().lower()
-        
-        # 精确匹配（忽略大小写）
-        for topic in available_topics:
-            if topic.lower() == user_input_clean:
-                return True, topic
-        
-        # 包含匹配
-        for topic in available_topics:
-            if user_input_clean in topic.lower() or topic.lower() in user_input_clean:
-                return True, topic
-        
-        # 关键词匹配
-        user_words = user_input_clean.split()
-        for topic in available_topics:
-            topic_words = topic.lower().split()
-            # 如果用户输入的词汇中有超过一半匹配主题词汇，则认为匹配
-            matches = sum(1 for word in user_words if word in topic_words)
-            if matches >= min(2, len(user_words), len(topic_words)):
-                return True, topic
-        
-        return False, None
-    
     def handle_complete_selection(self, course: str, topic: str, account: StudentAccount) -> str:
         """处理完整的课程和主题选择"""
         available_courses = self.get_student_courses(account)
@@ -2455,7 +2291,7 @@ Respond as their AI Learning Coach. Use the student's actual course, task, and p
         
         # 验证主题
         available_topics = self.get_course_topics(valid_course)
-        is_valid_topic, valid_topic = self.validate_topic_input(topic, available_topics)
+        is_valid_topic, valid_topic = self.validate_course_topic(topic, valid_course)
         
         if not is_valid_topic:
             topics_text = '\n'.join([f"• {t.title()}" for t in available_topics[:10]])
@@ -2519,28 +2355,3 @@ Respond as their AI Learning Coach. Use the student's actual course, task, and p
             </div>
         </div>
         """
-    
-    def validate_topic_input(self, user_input: str, available_topics: list[str]) -> tuple[bool, str]:
-        """验证用户输入的主题是否有效"""
-        user_input_clean = user_input.strip().lower()
-        
-        # 精确匹配（忽略大小写）
-        for topic in available_topics:
-            if topic.lower() == user_input_clean:
-                return True, topic
-        
-        # 包含匹配
-        for topic in available_topics:
-            if user_input_clean in topic.lower() or topic.lower() in user_input_clean:
-                return True, topic
-        
-        # 关键词匹配
-        user_words = user_input_clean.split()
-        for topic in available_topics:
-            topic_words = topic.lower().split()
-            # 如果用户输入的词汇中有超过一半匹配主题词汇，则认为匹配
-            matches = sum(1 for word in user_words if word in topic_words)
-            if matches >= min(2, len(user_words), len(topic_words)):
-                return True, topic
-        
-        return False, None
\ No newline at end of file
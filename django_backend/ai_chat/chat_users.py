@@ -0,0 +1,47 @@
+"""
+Chat conversations and study plans belong to a django.contrib.auth User whose username is the
+student id. user_id_for(account) returns that User's id, creating the User the first time and
+caching the mapping, so chat requests filter on user_id instead of running
+User.objects.get_or_create on every call.
+"""
+from typing import Any
+
+_KEY_PREFIX = "chat_user_id:"
+
+
+def _setting(name: str, default: Any) -> Any:
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+
+def user_id_for(account) -> int:
+    """Id of the auth User mirroring this StudentAccount"""
+    from django.core.cache import cache
+    from django.contrib.auth.models import User
+
+    key = _KEY_PREFIX + str(account.student_id)
+    try:
+        user_id = cache.get(key)
+    except Exception as e:
+        print(f"[CHAT_USERS] cache lookup failed: {e}")
+        user_id = None
+    if user_id is not None:
+        return user_id
+
+    user, created = User.objects.get_or_create(
+        username=account.student_id,
+        defaults={
+            'email': account.email or f'{account.student_id}@temp.com',
+            'first_name': account.name if account.name else f'Student {account.student_id}'
+        }
+    )
+    if created:
+        print(f"[CHAT_USERS] created Django User {user.username} for StudentAccount {account.student_id}")
+    try:
+        cache.set(key, user.id, timeout=int(_setting("CHAT_USER_ID_CACHE_TTL", 86400)))
+    except Exception as e:
+        print(f"[CHAT_USERS] cache store failed: {e}")
+    return user.id
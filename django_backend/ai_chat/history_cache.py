@@ -0,0 +1,183 @@
+"""
+Recent messages of each chat conversation, kept in the Django cache so answering a message
+needs no history query. The buffer holds the last CHAT_HISTORY_SIZE messages, newest first,
+as the same dicts get_conversation_history returns, plus the practice flow state derived from
+them. Every ChatMessage write goes through append_message(), which updates the buffer in
+place; a missing or unreadable buffer is rebuilt from the database on the next read.
+
+This relies on CACHES being shared by all worker processes (see settings.py): with a
+per-process cache, a worker would never see messages appended by the others.
+
+Concurrent writers: appends and rebuilds of one conversation's buffer hold a cache.add lock
+around their read and write. An append that finds the lock taken does not write; it drops the
+buffer and leaves a short-lived "dirty" mark. The lock holder checks for the mark after its
+write and drops what it stored, so a racing append never leaves a message missing from the
+buffer. After contention the buffer is rebuilt on every read until the mark expires.
+"""
+import re
+from typing import Any, Dict, Iterable, Optional
+
+from .intents import intent_engine
+
+_KEY_PREFIX = "chat_history:"
+# Seconds a writer may hold a buffer's lock, and how long a dropped buffer stays marked dirty
+_LOCK_SECONDS = 10
+_DIRTY_SECONDS = 30
+
+_COURSE_PATTERNS = [
+    re.compile(r'practise? ([A-Z]{4}\d{4})', re.IGNORECASE),
+    re.compile(r'available topics for ([A-Z]{4}\d{4})', re.IGNORECASE),
+]
+
+
+def _setting(name: str, default: Any) -> Any:
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+
+def practice_step(ai_content: str) -> str:
+    """Which practice flow step an AI message leaves the student in"""
+    content = ai_content.lower()
+    if 'which course would you like to practise?' in content:
+        return 'waiting_for_course'
+    elif 'which topic would you like to focus on?' in content or 'which topic would you like to work on?' in content:
+        return 'waiting_for_topic'
+    elif 'here are some topics available for this course:' in content:
+        return 'waiting_for_topic_selection'
+    elif 'i\'m now generating a practice set for' in content:
+        return 'practice_ready'
+    return 'start'
+
+def course_in(ai_content: str) -> Optional[str]:
+    """The course code an AI message offers practice for, if any"""
+    for pattern in _COURSE_PATTERNS:
+        match = pattern.search(ai_content)
+        if match:
+            return match.group(1).upper()
+    return None
+
+
+class RecentHistory(list):
+    """Newest-first message dicts, with the flow state derived from them when they were stored"""
+
+    def __init__(self, messages: Iterable[Dict[str, Any]] = ()):
+        super().__init__(messages)
+        last_ai = next((msg for msg in self if msg['type'] == 'ai'), None)
+        self.practice_step = practice_step(last_ai['content']) if last_ai else 'start'
+        self.in_practice_flow = bool(last_ai) and intent_engine.is_practice_flow_prompt(last_ai['content'])
+        self.current_course = next(
+            (course for course in (course_in(msg['content']) for msg in self if msg['type'] == 'ai') if course),
+            None,
+        )
+
+
+def message_dict(msg) -> Dict[str, Any]:
+    return {
+        'id': msg.id,
+        'type': msg.message_type,
+        'content': msg.content,
+        'timestamp': msg.timestamp.isoformat(),
+        'metadata': msg.metadata,
+    }
+
+def _size() -> int:
+    return int(_setting("CHAT_HISTORY_SIZE", 30))
+
+def _store(conversation_id: int, history: RecentHistory) -> None:
+    from django.core.cache import cache
+    cache.set(_KEY_PREFIX + str(conversation_id), history, timeout=int(_setting("CHAT_HISTORY_CACHE_TTL", 1800)))
+
+def recent_history(conversation_id: int) -> RecentHistory:
+    """The conversation's latest messages, from the cache or rebuilt with one query"""
+    from django.core.cache import cache
+    from .models import ChatMessage
+
+    key = _KEY_PREFIX + str(conversation_id)
+    try:
+        cached = cache.get(key)
+    except Exception as e:
+        print(f"[CHAT_HISTORY] cache lookup failed: {e}")
+        cached = None
+    if cached is not None:
+        return cached
+
+    locked = _lock(conversation_id)
+    try:
+        messages = ChatMessage.objects.filter(conversation_id=conversation_id).order_by('-timestamp')[:_size()]
+        history = RecentHistory(message_dict(msg) for msg in messages)
+        # Without the lock an append may be running; leave the buffer to the next read
+        if locked:
+            try:
+                _store(conversation_id, history)
+                _drop_if_dirty(conversation_id)
+            except Exception as e:
+                print(f"[CHAT_HISTORY] cache store failed: {e}")
+    finally:
+        if locked:
+            _unlock(conversation_id)
+    return history
+
+def append_message(msg) -> None:
+    """Call after saving a ChatMessage; a conversation with no buffer is left to rebuild on read"""
+    from django.core.cache import cache
+
+    key = _KEY_PREFIX + str(msg.conversation_id)
+    try:
+        if not _lock(msg.conversation_id):
+            # Another writer is between its read and write; it will see the mark and drop its write
+            _drop(msg.conversation_id)
+            return
+        try:
+            cached = cache.get(key)
+            if cached is None:
+                return
+            if cached and cached[0]['id'] >= msg.id:
+                # Appended out of order (a concurrent request got there first); rebuild on read
+                invalidate_history(msg.conversation_id)
+                return
+            _store(msg.conversation_id, RecentHistory([message_dict(msg)] + cached[:_size() - 1]))
+            _drop_if_dirty(msg.conversation_id)
+        finally:
+            _unlock(msg.conversation_id)
+    except Exception as e:
+        print(f"[CHAT_HISTORY] append failed, dropping buffer: {e}")
+        invalidate_history(msg.conversation_id)
+
+def _lock(conversation_id: int) -> bool:
+    from django.core.cache import cache
+    try:
+        return cache.add(_KEY_PREFIX + str(conversation_id) + ":lock", 1, timeout=_LOCK_SECONDS)
+    except Exception as e:
+        print(f"[CHAT_HISTORY] lock failed: {e}")
+        return False
+
+def _unlock(conversation_id: int) -> None:
+    from django.core.cache import cache
+    try:
+        cache.delete(_KEY_PREFIX + str(conversation_id) + ":lock")
+    except Exception as e:
+        print(f"[CHAT_HISTORY] unlock failed: {e}")
+
+def _drop(conversation_id: int) -> None:
+    """Drop the buffer and mark it dirty, so a write already in flight is dropped too"""
+    from django.core.cache import cache
+    cache.set(_KEY_PREFIX + str(conversation_id) + ":dirty", 1, timeout=_DIRTY_SECONDS)
+    invalidate_history(conversation_id)
+
+def _drop_if_dirty(conversation_id: int) -> None:
+    from django.core.cache import cache
+    if cache.get(_KEY_PREFIX + str(conversation_id) + ":dirty") is not None:
+        invalidate_history(conversation_id)
+
+def invalidate_history(conversation_id: Optional[int]) -> None:
+    """Drop the buffer after messages are changed other than by append_message"""
+    if not conversation_id:
+        return
+    try:
+        from django.core.cache import cache
+        cache.delete(_KEY_PREFIX + str(conversation_id))
+    except Exception as e:
+        print(f"[CHAT_HISTORY] invalidate failed: {e}")
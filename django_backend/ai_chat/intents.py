@@ -0,0 +1,117 @@
+"""
+Intent matching for the AI chat. Every rule's pattern or keyword list is compiled once, at
+import, into a single alternation, so checking a message against a rule is one regex search
+instead of one re.search (plus a lookup in re's pattern cache) per pattern.
+Patterns are matched against the lower-cased message.
+"""
+import re
+from typing import Dict, Iterable, List, Pattern
+
+# Order is priority: detect() returns the first intent that matches
+INTENT_PATTERNS: Dict[str, List[str]] = {
+    'explain_plan': [
+        r'explain.*plan', r'plan.*explain', r'tell.*about.*plan',
+        r'how.*plan.*work', r'plan.*detail', r'plan.*reason'
+    ],
+    'task_help': [
+        r'part.*\d+', r'task.*approach', r'how.*do.*part',
+        r'help.*with.*task', r'task.*detail', r'assignment.*help'
+    ],
+    'practice': [
+        r'practice', r'weak.*topic', r'difficult.*topic',
+        r'need.*help.*with', r'don.*understand', r'struggling.*with',
+        r'weak.*in', r'find.*difficult', r'bad.*at'
+    ],
+    'encouragement': [
+        r'encourage', r'motivation', r'feel.*bad', r'hard.*time',
+        r'anxious', r'worried', r'overwhelm', r'stress'
+    ],
+    'greeting': [
+        r'^(hi|hello|hey)', r'good.*morning', r'good.*afternoon'
+    ]
+}
+
+EXPLAIN_PLAN_PATTERNS = [
+    r'explain.*plan',
+    r'please.*explain.*plan',
+    r'please.*explain.*study.*plan',
+    r'tell.*about.*plan',
+    r'plan.*explain',
+    r'study.*plan.*explain',
+    r'explain.*study.*plan'
+]
+
+STOP_PATTERNS = [r'\bstop\b', r'\bexit\b', r'\bback\b']
+
+WHY_PLAN_PATTERNS = [r'why.*plan', r'plan.*why', r'reason.*plan', r'plan.*reason']
+
+PRACTICE_KEYWORDS = [
+    'practice', 'weak topic', 'difficult topic', 'need help with',
+    'don\'t understand', 'struggling with', 'weak in', 'find difficult',
+    'bad at', 'want to practice', 'need practice', 'practice session'
+]
+
+# Text the practice flow puts in its AI messages
+PRACTICE_FLOW_INDICATORS = [
+    'which course would you like to practise?',
+    'which topic would you like to focus on?',
+    'which topic would you like to work on?',
+    'here are some topics available for this course:',
+    'here are the courses you\'re currently enrolled in:',
+    'which course is this topic for?',
+    'i\'m not seeing that course in your enrolments',
+    'i\'m not able to match that to a topic in this course'
+]
+
+
+def compile_patterns(patterns: Iterable[str]) -> Pattern[str]:
+    """One regex that matches wherever any of the patterns would"""
+    return re.compile("|".join(f"(?:{p})" for p in patterns))
+
+def compile_keywords(keywords: Iterable[str]) -> Pattern[str]:
+    """One regex that matches wherever any of the literal keywords occurs"""
+    return re.compile("|".join(re.escape(k) for k in sorted(keywords, key=len, reverse=True)))
+
+
+class IntentEngine:
+    """Compiled form of the rules above"""
+
+    def __init__(self, intent_patterns: Dict[str, List[str]] = INTENT_PATTERNS):
+        self._intents = [(intent, compile_patterns(patterns)) for intent, patterns in intent_patterns.items()]
+        self._explain_plan = compile_patterns(EXPLAIN_PLAN_PATTERNS)
+        self._stop = compile_patterns(STOP_PATTERNS)
+        self._why_plan = compile_patterns(WHY_PLAN_PATTERNS)
+        self._practice = compile_keywords(PRACTICE_KEYWORDS)
+        self._practice_flow = compile_keywords(PRACTICE_FLOW_INDICATORS)
+
+    def classify(self, message: str) -> List[str]:
+        """Every intent the message matches, highest priority first"""
+        text = message.lower()
+        return [intent for intent, regex in self._intents if regex.search(text)]
+
+    def detect(self, message: str) -> str:
+        """The highest-priority matching intent, or 'general'"""
+        text = message.lower()
+        for intent, regex in self._intents:
+            if regex.search(text):
+                return intent
+        return 'general'
+
+    def is_explain_plan(self, message: str) -> bool:
+        return self._explain_plan.search(message.lower()) is not None
+
+    def is_stop(self, message: str) -> bool:
+        return self._stop.search(message.lower().strip()) is not None
+
+    def is_why_plan(self, message: str) -> bool:
+        return self._why_plan.search(message.lower()) is not None
+
+    def is_practice(self, message: str) -> bool:
+        return self._practice.search(message.lower()) is not None
+
+    def is_practice_flow_prompt(self, ai_message: str) -> bool:
+        return self._practice_flow.search(ai_message.lower()) is not None
+
+
+# Compiled once per process and shared by every AIChatService
+intent_engine = IntentEngine()
@@ -0,0 +1,79 @@
+"""
+Token-budgeted assembly of the chat system prompt. The fixed head and tail (instructions and
+the current message) are always kept; the context between them is added as items in named
+sections, each with a priority. Items are taken lowest priority number first, in the order
+they were added, until the budget is spent; once an item does not fit, the rest of its section
+is dropped so what remains is contiguous. Kept items are rendered in section order and the
+prompt is joined once.
+
+Tokens are estimated at CHARS_PER_TOKEN characters each, which is close enough for budgeting
+English prompts without a tokenizer round trip.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+@dataclass
+class _Section:
+    header: str
+    reverse: bool
+    items: List[tuple] = field(default_factory=list)  # (priority, seq, text)
+
+
+class PromptBuilder:
+
+    def __init__(self, budget_tokens: int):
+        self.budget_tokens = budget_tokens
+        self._sections: Dict[str, _Section] = {}
+        self._seq = 0
+        # Items left out of the last build, by section
+        self.dropped: Dict[str, int] = {}
+
+    def section(self, name: str, header: str = "", reverse: bool = False) -> None:
+        """Declare a section; sections render in declaration order, items reversed if asked"""
+        self._sections[name] = _Section(header, reverse)
+
+    def add(self, name: str, text: str, priority: int) -> None:
+        self._sections[name].items.append((priority, self._seq, text))
+        self._seq += 1
+
+    def content(self, *names: str) -> str:
+        """Untrimmed text of the named sections, e.g. for a cache key"""
+        return "".join(
+            self._sections[name].header + "".join(text for _, _, text in self._sections[name].items)
+            for name in names if self._sections[name].items
+        )
+
+    def build(self, head: str, tail: str) -> str:
+        remaining = self.budget_tokens - estimate_tokens(head) - estimate_tokens(tail)
+        kept: Dict[str, List[tuple]] = {name: [] for name in self._sections}
+        closed = set()
+        candidates = sorted((item, name) for name, section in self._sections.items() for item in section.items)
+        for item, name in candidates:
+            if name in closed:
+                continue
+            cost = estimate_tokens(item[2])
+            if not kept[name]:
+                cost += estimate_tokens(self._sections[name].header)
+            if cost > remaining:
+                closed.add(name)
+                continue
+            kept[name].append(item)
+            remaining -= cost
+
+        parts = [head]
+        self.dropped = {}
+        for name, section in self._sections.items():
+            if len(kept[name]) < len(section.items):
+                self.dropped[name] = len(section.items) - len(kept[name])
+            if kept[name]:
+                parts.append(section.header)
+                parts.extend(text for _, _, text in sorted(kept[name], key=lambda item: item[1], reverse=section.reverse))
+        parts.append(tail)
+        return "".join(parts)
@@ -0,0 +1,83 @@
+"""
+Short-lived cache of Gemini chat replies.
+The key hashes the prompt template version, a digest of the student context that goes into
+the prompt (courses, progress, latest practice test, plan), the last few history messages and
+the normalized message. The context comes from the student context cache, so a change to it
+(a new practice session, plan or progress update) gives a new key as soon as the write
+invalidates that cache; with the shared CACHES backend this holds across worker processes.
+Writes that skip invalidate_student_context can get replies for the old context until that
+entry expires (STUDENT_CONTEXT_CACHE_TTL). Any failure counts as a miss.
+"""
+import hashlib
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+# History messages that take part in the key; the full prompt may carry more
+HISTORY_MESSAGES_IN_KEY = 6
+_KEY_PREFIX = "chat_reply:"
+
+
+def _setting(name: str, default: Any) -> Any:
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+def normalize_message(message: str) -> str:
+    """Lower-case, collapse whitespace and drop trailing punctuation so trivial variants match"""
+    text = re.sub(r"\s+", " ", (message or "").lower()).strip()
+    return text.rstrip("?!.~ ")
+
+def _history_for_key(history: Optional[List[Dict[str, Any]]], normalized: str) -> List[List[str]]:
+    """
+    Last HISTORY_MESSAGES_IN_KEY messages, without trailing asks of this same message and their
+    replies, so asking the same question again right away maps to the same key.
+    """
+    messages = [[m.get("type", ""), m.get("content", "")] for m in (history or [])]
+    while messages:
+        if messages[-1][0] != "user" and len(messages) >= 2 and messages[-2][0] == "user" \
+                and normalize_message(messages[-2][1]) == normalized:
+            del messages[-2:]
+        elif messages[-1][0] == "user" and normalize_message(messages[-1][1]) == normalized:
+            del messages[-1]
+        else:
+            break
+    return messages[-HISTORY_MESSAGES_IN_KEY:]
+
+def make_key(prompt_version: str, context: str, history: Optional[List[Dict[str, Any]]], message: str) -> str:
+    normalized = normalize_message(message)
+    payload = json.dumps([prompt_version, context, _history_for_key(history, normalized), normalized])
+    return _KEY_PREFIX + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def get(cache_key: str) -> Optional[str]:
+    try:
+        from django.core.cache import cache
+        return cache.get(cache_key)
+    except Exception as e:
+        print(f"[CHAT_CACHE] lookup failed, treating as miss: {e}")
+        return None
+
+def put(cache_key: str, reply: str) -> None:
+    try:
+        from django.core.cache import cache
+        cache.set(cache_key, reply, timeout=int(_setting("CHAT_RESPONSE_CACHE_TTL", 600)))
+    except Exception as e:
+        print(f"[CHAT_CACHE] store failed: {e}")
+
+async def aget(cache_key: str) -> Optional[str]:
+    """get() for async code; the database cache must not be queried from the event loop"""
+    try:
+        from django.core.cache import cache
+        return await cache.aget(cache_key)
+    except Exception as e:
+        print(f"[CHAT_CACHE] lookup failed, treating as miss: {e}")
+        return None
+
+async def aput(cache_key: str, reply: str) -> None:
+    try:
+        from django.core.cache import cache
+        await cache.aset(cache_key, reply, timeout=int(_setting("CHAT_RESPONSE_CACHE_TTL", 600)))
+    except Exception as e:
+        print(f"[CHAT_CACHE] store failed: {e}")
@@ -0,0 +1,133 @@
+"""
+Student context used in chat prompts: enrolled courses, recent task progress, the latest
+practice test and the active study plan, fetched with a fixed number of queries and cached per
+student for up to STUDENT_CONTEXT_CACHE_TTL seconds. Views that change any of these call
+invalidate_student_context(student_id), which takes effect in every worker because CACHES is
+shared between processes (see settings.py). A write made elsewhere (the Django admin, a shell)
+shows up once the entry expires.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+_KEY_PREFIX = "chat_student_ctx:"
+
+
+@dataclass
+class TaskProgressItem:
+    course_code: str
+    title: str
+    progress: int
+
+
+@dataclass
+class PracticeSummary:
+    course_code: str
+    topic: str
+    total_score: float
+    max_score: float
+    percentage: float
+    questions_count: int
+    questions: List[Dict[str, Any]] = field(default_factory=list)
+
+
+@dataclass
+class StudentContext:
+    student_id: str
+    courses: List[Tuple[str, Optional[str]]] = field(default_factory=list)  # (code, title or None)
+    task_progress: List[TaskProgressItem] = field(default_factory=list)
+    practice: Optional[PracticeSummary] = None
+    plan: Optional[Dict[str, Any]] = None
+
+
+def _setting(name: str, default: Any) -> Any:
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+
+class StudentContextBuilder:
+    """Build a StudentContext in six queries, or none when it is cached"""
+
+    MAX_COURSES = 5
+    MAX_TASKS = 5
+
+    def build(self, student_id: str) -> StudentContext:
+        from django.core.cache import cache
+
+        key = _KEY_PREFIX + student_id
+        try:
+            cached = cache.get(key)
+        except Exception as e:
+            print(f"[STUDENT_CONTEXT] cache lookup failed: {e}")
+            cached = None
+        if cached is not None:
+            return cached
+
+        context = StudentContext(
+            student_id=student_id,
+            courses=self._courses(student_id),
+            task_progress=self._task_progress(student_id),
+            practice=self._practice(student_id),
+            plan=self._plan(student_id),
+        )
+        try:
+            cache.set(key, context, timeout=int(_setting("STUDENT_CONTEXT_CACHE_TTL", 300)))
+        except Exception as e:
+            print(f"[STUDENT_CONTEXT] cache store failed: {e}")
+        return context
+
+    def _courses(self, student_id: str) -> List[Tuple[str, Optional[str]]]:
+        from courses.models import StudentEnrollment, CourseCatalog
+
+        codes = list(StudentEnrollment.objects.filter(student_id=student_id)
+                     .values_list("course_code", flat=True)[:self.MAX_COURSES])
+        titles = dict(CourseCatalog.objects.filter(code__in=codes).values_list("code", "title"))
+        return [(code, titles.get(code)) for code in codes]
+
+    def _task_progress(self, student_id: str) -> List[TaskProgressItem]:
+        from courses.models import CourseTask
+        from task_progress.models import TaskProgress
+
+        rows = list(TaskProgress.objects.filter(student_id=student_id)
+                    .order_by("-updated_at").values_list("task_id", "progress")[:self.MAX_TASKS])
+        tasks = {t.id: t for t in CourseTask.objects.filter(id__in=[task_id for task_id, _ in rows])
+                 .only("id", "course_code", "title")}
+        return [
+            TaskProgressItem(course_code=tasks[task_id].course_code, title=tasks[task_id].title, progress=progress)
+            for task_id, progress in rows if task_id in tasks
+        ]
+
+    def _practice(self, student_id: str) -> Optional[PracticeSummary]:
+        from .models import RecentPracticeSession
+
+        session = RecentPracticeSession.get_latest_session(student_id)
+        if session is None:
+            return None
+        return PracticeSummary(
+            course_code=session.course_code,
+            topic=session.topic,
+            total_score=session.total_score,
+            max_score=session.max_score,
+            percentage=session.percentage,
+            questions_count=session.questions_count,
+            questions=list((session.test_data or {}).get("questions", [])),
+        )
+
+    def _plan(self, student_id: str) -> Optional[Dict[str, Any]]:
+        from .models import UserStudyPlan
+
+        return (UserStudyPlan.objects.filter(user__username=student_id, is_active=True)
+                .values_list("plan_data", flat=True).first())
+
+
+def invalidate_student_context(student_id: Optional[str]) -> None:
+    """Drop the cached context after a write to the student's enrollments, progress, practice or plan"""
+    if not student_id:
+        return
+    try:
+        from django.core.cache import cache
+        cache.delete(_KEY_PREFIX + str(student_id))
+    except Exception as e:
+        print(f"[STUDENT_CONTEXT] invalidate failed: {e}")
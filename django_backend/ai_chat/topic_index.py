@@ -0,0 +1,153 @@
+"""
+Per-course index of practice topics (QuestionKeyword names) for matching what a student types
+in the practice setup flow. Lookup order, first hit wins:
+  1. exact (case-insensitive) name
+  2. the input contains a topic or a topic contains the input (covers prefixes)
+  3. token overlap: at least min(2, input words, topic words) words in common
+  4. fuzzy: trigram Dice similarity >= FUZZY_THRESHOLD (typos)
+Steps 1-3 give the same answer as the old linear validate_topic_input (the earliest topic in
+course order). Candidates come from an inverted token index and a trigram index, so only topics
+sharing a word or trigram with the input are looked at.
+
+Indexes are kept in process memory per course. Admin views that change keywords call
+invalidate_topic_index(course_code), which bumps a version in the Django cache; since CACHES is
+shared between worker processes (see settings.py), every process sees the bump and rebuilds
+on its next lookup. An index is also rebuilt once it is TOPIC_INDEX_MAX_AGE seconds old, which
+bounds staleness after keyword edits that bypass those views or a version key the cache evicted.
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+FUZZY_THRESHOLD = 0.6
+_VERSION_PREFIX = "topic_index_ver:"
+
+_lock = threading.Lock()
+_indexes: Dict[str, Tuple[Any, float, "TopicIndex"]] = {}  # course -> (version, built at, index)
+
+
+def _setting(name: str, default: Any) -> Any:
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TopicIndex:
+
+    def __init__(self, topics: Iterable[str]):
+        self.topics: List[str] = list(topics)
+        self._names = [t.lower() for t in self.topics]
+        self._exact: Dict[str, int] = {}
+        self._tokens: Dict[str, List[int]] = defaultdict(list)
+        self._grams: Dict[str, List[int]] = defaultdict(list)
+        self._word_counts: List[int] = []
+        self._gram_counts: List[int] = []
+        # Topics under three characters have no trigrams and are always checked directly
+        self._short: List[int] = []
+        for i, name in enumerate(self._names):
+            self._exact.setdefault(name, i)
+            words = name.split()
+            self._word_counts.append(len(words))
+            for word in set(words):
+                self._tokens[word].append(i)
+            grams = _trigrams(name)
+            self._gram_counts.append(len(grams))
+            if not grams:
+                self._short.append(i)
+            for gram in grams:
+                self._grams[gram].append(i)
+
+    def __len__(self) -> int:
+        return len(self.topics)
+
+    def match(self, user_input: str) -> Optional[str]:
+        """The topic the input refers to, or None"""
+        text = user_input.strip().lower()
+        i = self._exact.get(text)
+        if i is None:
+            grams = _trigrams(text)
+            shared: Counter = Counter()
+            for gram in grams:
+                for j in self._grams.get(gram, ()):
+                    shared[j] += 1
+            i = self._containing(text, grams, shared)
+            if i is None:
+                i = self._overlapping(text)
+            if i is None:
+                i = self._similar(grams, shared)
+        return None if i is None else self.topics[i]
+
+    def _containing(self, text: str, grams: Set[str], shared: Counter) -> Optional[int]:
+        if grams:
+            # Substrings share all their trigrams with the longer string
+            candidates = [j for j, n in shared.items() if n == len(grams) or n == self._gram_counts[j]]
+            candidates += self._short
+        else:
+            candidates = range(len(self._names))
+        hits = [j for j in candidates if text in self._names[j] or self._names[j] in text]
+        return min(hits) if hits else None
+
+    def _overlapping(self, text: str) -> Optional[int]:
+        words = text.split()
+        common: Counter = Counter()
+        for word in words:
+            for j in self._tokens.get(word, ()):
+                common[j] += 1
+        hits = [j for j, n in common.items() if n >= min(2, len(words), self._word_counts[j])]
+        return min(hits) if hits else None
+
+    def _similar(self, grams: Set[str], shared: Counter) -> Optional[int]:
+        best, best_score = None, FUZZY_THRESHOLD
+        for j, n in shared.items():
+            score = 2 * n / (len(grams) + self._gram_counts[j])
+            if score > best_score or (score == best_score and (best is None or j < best)):
+                best, best_score = j, score
+        return best
+
+
+def _version(course_code: str) -> Any:
+    try:
+        from django.core.cache import cache
+        return cache.get(_VERSION_PREFIX + course_code, 0)
+    except Exception as e:
+        print(f"[TOPIC_INDEX] version lookup failed: {e}")
+        return None
+
+def _load_topics(course_code: str) -> List[str]:
+    from courses.models import QuestionKeyword
+    return list(QuestionKeyword.objects.filter(
+        questionkeywordmap__question__course_code=course_code
+    ).values_list('name', flat=True).distinct())
+
+def topic_index_for(course_code: str) -> TopicIndex:
+    """The course's TopicIndex, built on first use and after each invalidation"""
+    version = _version(course_code)
+    now = time.monotonic()
+    with _lock:
+        cached = _indexes.get(course_code)
+    if cached is not None and version is not None and cached[0] == version \
+            and now - cached[1] < float(_setting("TOPIC_INDEX_MAX_AGE", 600)):
+        return cached[2]
+    index = TopicIndex(_load_topics(course_code))
+    with _lock:
+        _indexes[course_code] = (version, now, index)
+    return index
+
+def invalidate_topic_index(course_code: Optional[str]) -> None:
+    """Call after creating, editing or deleting a course's questions or keywords"""
+    if not course_code:
+        return
+    with _lock:
+        _indexes.pop(course_code, None)
+    try:
+        from django.core.cache import cache
+        cache.set(_VERSION_PREFIX + course_code, time.time_ns(), timeout=None)
+    except Exception as e:
+        print(f"[TOPIC_INDEX] invalidate failed: {e}")
@@ -6,6 +6,7 @@ app_name = 'ai_chat'
 urlpatterns = [
    
     path('chat/', views.ChatView.as_view(), name='chat'),
+    path('chat/stream/', views.ChatStreamView.as_view(), name='chat_stream'),
     
   
     path('study-plan/', views.StudyPlanView.as_view(), name='study_plan'),
@@ -1,11 +1,59 @@
 import json
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views import View
+from asgiref.sync import sync_to_async
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from .chat_service import AIChatService
 from .models import ChatManager, UserStudyPlan
 
+def _attach_account(request, data):
+    """Resolve the student account from user_id and set request.account; return an error response or None"""
+    from stu_accounts.models import StudentAccount
+    from django.contrib.auth.models import User
+
+    # Obtain authentication token from request header (temporarily allow token free access)
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer ') or True:  
+        token = auth_header[7:]  
+
+        #We should verify the token here and obtain the corresponding user
+        #Temporarily use a simple logic: retrieve the user ID from localStorage
+        #In practical applications, the token should be verified and the corresponding user should be obtained here
+
+        #Retrieve user ID from request parameters or request body
+        user_id = request.GET.get('user_id') or data.get('user_id')
+        if not user_id:
+            return JsonResponse({
+                'success': False,
+                'error': 'User ID is required'
+            }, status=400)
+
+        print(f"[DEBUG] get user's history: user_id={user_id}")
+
+        account, created = StudentAccount.objects.get_or_create(
+            student_id=user_id,
+            defaults={
+                'name': f'User {user_id}',
+                'email': f'{user_id}@example.com',
+                'password_hash': 'default_password_hash'
+            }
+        )
+        if created:
+            print(f"[DEBUG] create new account: {user_id}")
+        else:
+            print(f"[DEBUG] use available account: {user_id}")
+
+        request.account = account
+        return None
+    else:
+
+        return JsonResponse({
+            'success': False,
+            'error': 'Authentication required'
+        }, status=401)
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class ChatView(View):
   
@@ -14,7 +62,7 @@ class ChatView(View):
         super().__init__()
         self.chat_service = AIChatService()
     
-    def post(self, request):
+    async def post(self, request):
         """send msg toAI"""
         try:
             data = json.loads(request.body)
@@ -28,52 +76,12 @@ class ChatView(View):
             
           
             if not hasattr(request, 'account'):
-              
-                from stu_accounts.models import StudentAccount
-                from django.contrib.auth.models import User
-                
-                # Obtain authentication token from request header (temporarily allow token free access)
-                auth_header = request.headers.get('Authorization', '')
-                if auth_header.startswith('Bearer ') or True:  
-                    token = auth_header[7:]  
-                    
-                    #We should verify the token here and obtain the corresponding user
-                    #Temporarily use a simple logic: retrieve the user ID from localStorage
-                    #In practical applications, the token should be verified and the corresponding user should be obtained here
-                                        
-                    #Retrieve user ID from request parameters or request body
-                    user_id = request.GET.get('user_id') or data.get('user_id')
-                    if not user_id:
-                        return JsonResponse({
-                            'success': False,
-                            'error': 'User ID is required'
-                        }, status=400)
-                    
-                    print(f"[DEBUG] get user's history: user_id={user_id}")
-                    
-                    account, created = StudentAccount.objects.get_or_create(
-                        student_id=user_id,
-                        defaults={
-                            'name': f'User {user_id}',
-                            'email': f'{user_id}@example.com',
-                            'password_hash': 'default_password_hash'
-                        }
-                    )
-                    if created:
-                        print(f"[DEBUG] create new account: {user_id}")
-                    else:
-                        print(f"[DEBUG] use available account: {user_id}")
-                    
-                    request.account = account
-                else:
-                  
-                    return JsonResponse({
-                        'success': False,
-                        'error': 'Authentication required'
-                    }, status=401)
+                error = await sync_to_async(_attach_account)(request, data)
+                if error is not None:
+                    return error
             
             # handle msg and ai response
-            result = self.chat_service.process_message(request.account, message)
+            result = await self.chat_service.aprocess_message(request.account, message)
             
             return JsonResponse(result)
             
@@ -88,8 +96,11 @@ class ChatView(View):
                 'error': str(e)
             }, status=500)
     
-    def get(self, request):
+    async def get(self, request):
         """get history conversation"""
+        return await sync_to_async(self._get_history)(request)
+    
+    def _get_history(self, request):
         try:
           
             if not hasattr(request, 'account'):
@@ -166,6 +177,53 @@ class ChatView(View):
                 'error': str(e)
             }, status=500)
 
+@method_decorator(csrf_exempt, name='dispatch')
+class ChatStreamView(View):
+    """Same request as ChatView.post, but the reply is streamed as server-sent events:
+    `delta` events carry text chunks, then one `done` event carries the saved messages
+    (its content is authoritative) or an `error` event."""
+
+    def __init__(self):
+        super().__init__()
+        self.chat_service = AIChatService()
+
+    async def post(self, request):
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({
+                'success': False,
+                'error': 'Invalid JSON data'
+            }, status=400)
+
+        message = data.get('message', '').strip()
+        if not message:
+            return JsonResponse({
+                'success': False,
+                'error': 'Message cannot be empty'
+            }, status=400)
+
+        if not hasattr(request, 'account'):
+            error = await sync_to_async(_attach_account)(request, data)
+            if error is not None:
+                return error
+
+        # An async iterator, so under ASGI each event is sent as soon as it is produced
+        events = self.chat_service.astream_message(request.account, message)
+        response = StreamingHttpResponse(
+            (self.format_event(item['event'], item['data']) async for item in events),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @staticmethod
+    def format_event(event: str, data) -> str:
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class StudyPlanView(View):
     """学习计划存储API视图"""
@@ -360,7 +418,7 @@ class GeneratePracticeView(View):
         super().__init__()
         self.chat_service = AIChatService()
     
-    def post(self, request):
+    async def post(self, request):
         """生成练习题目"""
         try:
             data = json.loads(request.body)
@@ -388,78 +446,45 @@ class GeneratePracticeView(View):
             if difficulty not in ['easy', 'medium', 'hard']:
                 difficulty = 'medium'
             
-            # 获取用户账户
+            # 获取用户账户；示例题目只在题库不够、需要实时生成时才加载
             from stu_accounts.models import StudentAccount
-            try:
-                account = StudentAccount.objects.get(student_id=user_id)
-            except StudentAccount.DoesNotExist:
+            account = await StudentAccount.objects.filter(student_id=user_id).afirst()
+            if account is None:
                 return JsonResponse({
                     'success': False,
                     'error': 'User not found'
                 }, status=404)
             
+            # 根据题目数量计算选择题和简答题的比例 (60% MCQ, 40% Short Answer)
+            mcq_count = int(num_questions * 0.6)
+            short_answer_count = num_questions - mcq_count
+            
+            # 先从预生成题库取题（同一学生不重复），库存不够时再实时生成
+            from ai_question_generator import question_pool
+            pooled_questions = await sync_to_async(question_pool.take)(
+                course, topic, difficulty, mcq_count, short_answer_count, user_id
+            )
+            if pooled_questions is not None:
+                print(f"[DEBUG] 从题库取出 {len(pooled_questions)} 个题目")
+                session_id = await sync_to_async(self._save_practice)(account, course, topic, difficulty, pooled_questions)
+                return JsonResponse({
+                    'success': True,
+                    'session_id': session_id,
+                    'total_questions': len(pooled_questions),
+                    'course': course,
+                    'topic': topic
+                })
+            
             # 🔥 直接调用生成器逻辑,避免HTTP调用超时
             from ai_question_generator.generator import QuestionGenerator
-            from courses.models import Question, QuestionChoice, QuestionKeyword, QuestionKeywordMap
-            import uuid
+            sample_questions = await sync_to_async(self._load_sample_questions)(course, topic, difficulty)
             
             print(f"[DEBUG] 开始生成练习题: course={course}, topic={topic}, num={num_questions}, difficulty={difficulty}")
             
-            # 获取示例题目
-            topic_lower = topic.lower()
-            
-            # 方法1: 通过关键词查找
-            keyword_maps = QuestionKeywordMap.objects.filter(
-                keyword__name__icontains=topic_lower
-            ).select_related('question')
-            
-            sample_questions_objs = [km.question for km in keyword_maps if km.question.course_code == course]
-            
-            # 方法2: 如果没找到,尝试直接匹配课程
-            if not sample_questions_objs:
-                sample_questions_objs = list(Question.objects.filter(
-                    course_code=course,
-                    is_active=True
-                )[:5])
-            
-            print(f"[DEBUG] 找到 {len(sample_questions_objs)} 个示例题目")
-            
-            # 转换为字典格式
-            sample_questions = []
-            for q in sample_questions_objs[:5]:
-                q_dict = {
-                    'type': q.qtype,
-                    'question': q.text,
-                    'topic': topic,
-                    'difficulty': difficulty,  # 使用用户选择的难度
-                    'score': 10
-                }
-                
-                if q.qtype == 'mcq':
-                    choices = QuestionChoice.objects.filter(question=q)
-                    q_dict['options'] = [c.content for c in choices]
-                    correct_choice = choices.filter(is_correct=True).first()
-                    if correct_choice:
-                        q_dict['correct_answer'] = correct_choice.label or 'A'
-                    q_dict['explanation'] = q.description or ''
-                else:
-                    q_dict['sample_answer'] = q.short_answer or ''
-                    # 从keywords_json字段获取关键词
-                    if q.keywords_json:
-                        q_dict['grading_points'] = q.keywords_json if isinstance(q.keywords_json, list) else []
-                    else:
-                        q_dict['grading_points'] = []
-                
-                sample_questions.append(q_dict)
-            
-            # 根据题目数量计算选择题和简答题的比例 (60% MCQ, 40% Short Answer)
-            mcq_count = int(num_questions * 0.6)
-            short_answer_count = num_questions - mcq_count
-            
             # 调用AI生成器
             try:
                 generator = QuestionGenerator()
-                generated_questions = generator.generate_questions(
+                generated_questions = await generator.agenerate_questions(
                     topic=topic,
                     difficulty=difficulty,  # 使用用户选择的难度
                     sample_questions=sample_questions,
@@ -470,58 +495,8 @@ class GeneratePracticeView(View):
                 
                 print(f"[DEBUG] 生成了 {len(generated_questions)} 个题目")
                 
-                # 保存到数据库
-                from ai_question_generator.models import GeneratedQuestion
-                session_id = str(uuid.uuid4())
-                
-                for idx, q in enumerate(generated_questions, 1):
-                    # 构建question_data JSON
-                    question_data = {
-                        'question': q.get('question'),
-                        'score': q.get('score', 10)
-                    }
-                    
-                    if q.get('type') == 'mcq':
-                        question_data.update({
-                            'options': q.get('options'),
-                            'correct_answer': q.get('correct_answer'),
-                            'explanation': q.get('explanation')
-                        })
-                    else:
-                        question_data.update({
-                            'sample_answer': q.get('sample_answer'),
-                            'grading_points': q.get('grading_points')
-                        })
-                    
-                    GeneratedQuestion.objects.create(
-                        session_id=session_id,
-                        course_code=course,
-                        topic=topic,
-                        difficulty=q.get('difficulty', 'medium'),
-                        question_type=q.get('type'),
-                        question_data=question_data
-                    )
-                
-                # 🔥 保存练习就绪消息到聊天历史
-                conversation = self.chat_service.get_or_create_conversation(account)
-                practice_message_content = f"I've generated {len(generated_questions)} {difficulty} questions for {course} – {topic}. Ready to practice?"
-                
-                from .models import ChatMessage
-                ChatMessage.objects.create(
-                    conversation=conversation,
-                    message_type='ai',
-                    content=practice_message_content,
-                    metadata={
-                        'messageType': 'practice_ready',
-                        'practiceInfo': {
-                            'course': course,
-                            'topic': topic,
-                            'sessionId': session_id,
-                            'totalQuestions': len(generated_questions)
-                        }
-                    }
-                )
-                print(f"[DEBUG] 已保存练习就绪消息到聊天历史")
+                # 保存到数据库，并保存练习就绪消息到聊天历史
+                session_id = await sync_to_async(self._save_practice)(account, course, topic, difficulty, generated_questions)
                 
                 return JsonResponse({
                     'success': True,
@@ -552,4 +527,109 @@ class GeneratePracticeView(View):
             return JsonResponse({
                 'success': False,
                 'error': 'Internal server error'
-            }, status=500)
\ No newline at end of file
+            }, status=500)
+    
+    def _load_sample_questions(self, course, topic, difficulty):
+        """返回实时生成用的示例题目列表"""
+        from courses.models import Question, QuestionChoice, QuestionKeyword, QuestionKeywordMap
+        
+        # 获取示例题目
+        topic_lower = topic.lower()
+        
+        # 方法1: 通过关键词查找
+        keyword_maps = QuestionKeywordMap.objects.filter(
+            keyword__name__icontains=topic_lower
+        ).select_related('question')
+        
+        sample_questions_objs = [km.question for km in keyword_maps if km.question.course_code == course]
+        
+        # 方法2: 如果没找到,尝试直接匹配课程
+        if not sample_questions_objs:
+            sample_questions_objs = list(Question.objects.filter(
+                course_code=course,
+                is_active=True
+            )[:5])
+        
+        print(f"[DEBUG] 找到 {len(sample_questions_objs)} 个示例题目")
+        
+        # 转换为字典格式
+        sample_questions = []
+        for q in sample_questions_objs[:5]:
+            q_dict = {
+                'type': q.qtype,
+                'question': q.text,
+                'topic': topic,
+                'difficulty': difficulty,  # 使用用户选择的难度
+                'score': 10
+            }
+        
+            if q.qtype == 'mcq':
+                choices = QuestionChoice.objects.filter(question=q)
+                q_dict['options'] = [c.content for c in choices]
+                correct_choice = choices.filter(is_correct=True).first()
+                if correct_choice:
+                    q_dict['correct_answer'] = correct_choice.label or 'A'
+                q_dict['explanation'] = q.description or ''
+            else:
+                q_dict['sample_answer'] = q.short_answer or ''
+                # 从keywords_json字段获取关键词
+                if q.keywords_json:
+                    q_dict['grading_points'] = q.keywords_json if isinstance(q.keywords_json, list) else []
+                else:
+                    q_dict['grading_points'] = []
+        
+            sample_questions.append(q_dict)
+        
+        return sample_questions
+    
+    @staticmethod
+    def _question_data(q):
+        """构建保存到 GeneratedQuestion 的 question_data JSON"""
+        question_data = {
+            'question': q.get('question'),
+            'score': q.get('score', 10)
+        }
+        
+        if q.get('type') == 'mcq':
+            question_data.update({
+                'options': q.get('options'),
+                'correct_answer': q.get('correct_answer'),
+                'explanation': q.get('explanation')
+            })
+        else:
+            question_data.update({
+                'sample_answer': q.get('sample_answer'),
+                'grading_points': q.get('grading_points')
+            })
+        return question_data
+    
+    def _save_practice(self, account, course, topic, difficulty, generated_questions):
+        """保存生成的题目和练习就绪消息，返回 session_id"""
+        # 保存到数据库（一次批量插入）
+        from ai_question_generator.practice_sessions import persist_generated_session
+        session_id, _ = persist_generated_session(course, topic, difficulty, generated_questions,
+                                                  question_data=self._question_data)
+        
+        # 🔥 保存练习就绪消息到聊天历史
+        conversation = self.chat_service.get_or_create_conversation(account)
+        practice_message_content = f"I've generated {len(generated_questions)} {difficulty} questions for {course} – {topic}. Ready to practice?"
+        
+        from .models import ChatMessage
+        from .history_cache import append_message
+        practice_message = ChatMessage.objects.create(
+            conversation=conversation,
+            message_type='ai',
+            content=practice_message_content,
+            metadata={
+                'messageType': 'practice_ready',
+                'practiceInfo': {
+                    'course': course,
+                    'topic': topic,
+                    'sessionId': session_id,
+                    'totalQuestions': len(generated_questions)
+                }
+            }
+        )
+        append_message(practice_message)
+        print(f"[DEBUG] 已保存练习就绪消息到聊天历史")
+        return session_id
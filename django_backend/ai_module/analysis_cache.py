@@ -0,0 +1,96 @@
+"""
+Persistent, content-addressed cache for task analysis (LLM summary + part split).
+Every student enrolled in a course shares the same task PDF, so the analysis is done once
+and stored in plans.TaskAnalysisCache. Any failure here is treated as a cache miss so plan
+generation never depends on the cache being available.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from .pdf_ingest import resolve_pdf_path
+
+
+def _setting(name: str, default: Any) -> Any:
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+def content_hash(pdf_path: Optional[str] = None, text: Optional[str] = None) -> str:
+    """sha256 of the task PDF bytes, else of the inline detail text, else of nothing"""
+    sha = hashlib.sha256()
+    path = resolve_pdf_path(pdf_path) if pdf_path else None
+    if path is not None:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+    elif text:
+        sha.update(text.encode("utf-8"))
+    return sha.hexdigest()
+
+def make_key(*parts: Any) -> str:
+    return hashlib.sha256(json.dumps([str(p) for p in parts]).encode("utf-8")).hexdigest()
+
+def get(cache_key: str) -> Optional[Dict[str, Any]]:
+    """Return the cached payload and mark it as recently used; expired entries are dropped"""
+    try:
+        from django.db.models import F
+        from django.utils import timezone
+        from plans.models import TaskAnalysisCache
+
+        entry = TaskAnalysisCache.objects.only("id", "payload", "created_at").filter(cache_key=cache_key).first()
+        if entry is None:
+            return None
+        ttl = timedelta(days=_setting("TASK_ANALYSIS_CACHE_TTL_DAYS", 30))
+        if entry.created_at < timezone.now() - ttl:
+            entry.delete()
+            return None
+        TaskAnalysisCache.objects.filter(id=entry.id).update(last_used_at=timezone.now(), hits=F("hits") + 1)
+        return entry.payload
+    except Exception as e:
+        print(f"[ANALYSIS_CACHE] lookup failed, treating as miss: {e}")
+        return None
+
+def put(cache_key: str, source: str, payload: Dict[str, Any]) -> None:
+    try:
+        from django.utils import timezone
+        from plans.models import TaskAnalysisCache
+
+        TaskAnalysisCache.objects.update_or_create(
+            cache_key=cache_key,
+            defaults={"source": source or "", "payload": payload, "last_used_at": timezone.now()},
+        )
+        _evict()
+    except Exception as e:
+        print(f"[ANALYSIS_CACHE] store failed: {e}")
+
+def invalidate_source(source: Optional[str]) -> int:
+    """Drop every entry derived from the given task url (called when admins replace or edit it)"""
+    if not source:
+        return 0
+    try:
+        from plans.models import TaskAnalysisCache
+
+        deleted, _ = TaskAnalysisCache.objects.filter(source=source).delete()
+        return deleted
+    except Exception as e:
+        print(f"[ANALYSIS_CACHE] invalidate failed: {e}")
+        return 0
+
+def _evict() -> None:
+    """TTL first, then least-recently-used entries beyond the size limit"""
+    from django.utils import timezone
+    from plans.models import TaskAnalysisCache
+
+    ttl = timedelta(days=_setting("TASK_ANALYSIS_CACHE_TTL_DAYS", 30))
+    TaskAnalysisCache.objects.filter(created_at__lt=timezone.now() - ttl).delete()
+
+    max_entries = int(_setting("TASK_ANALYSIS_CACHE_MAX_ENTRIES", 2000))
+    stale_ids = list(
+        TaskAnalysisCache.objects.order_by("-last_used_at").values_list("id", flat=True)[max_entries:]
+    )
+    if stale_ids:
+        TaskAnalysisCache.objects.filter(id__in=stale_ids).delete()
@@ -0,0 +1,344 @@
+# pyright: reportMissingImports=false
+"""
+Shared Gemini access for plan generation, chat, question generation and grading.
+google.generativeai is imported and configured on first use rather than at Django startup,
+and one GenerativeModel is kept per (model name, generation config) so every caller reuses
+the same long-lived transport instead of building its own.
+
+Timeouts are per request (request_options), never socket.setdefaulttimeout, which is process
+wide. A caller can also open deadline(seconds): every generate() inside it, including in
+worker threads started with contextvars.copy_context(), gets at most the time left.
+
+Each model has a circuit breaker: after GEMINI_BREAKER_FAILURES consecutive failed or slow
+calls it opens and generate() raises CircuitOpenError at once, so callers go straight to
+their fallback. After GEMINI_BREAKER_COOLDOWN seconds one trial call is let through
+(half-open); its outcome closes the breaker again or reopens it.
+
+agenerate() and agenerate_stream() are the awaitable forms for async views: while the model
+answers, no thread is held. The SDK's async (grpc.aio) client only works on the event loop that
+created it, and it is one client per process, so every async call runs on a single long-lived
+client loop in a daemon thread and the caller awaits the result from its own loop. Calls from
+uvicorn's loop, from async_to_sync under WSGI or from asyncio.run in a command therefore all
+share one connection, through the SDK's public generate_content_async.
+"""
+import asyncio
+import contextvars
+import importlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv(Path(__file__).resolve().parent.parent / ".env")
+GEMINI_KEY = os.getenv("GEMINI_API_KEY")
+DEFAULT_MODEL = "gemini-2.5-flash"
+BREAKER_FAILURES = int(os.getenv("GEMINI_BREAKER_FAILURES", "3"))
+BREAKER_SLOW_SECONDS = float(os.getenv("GEMINI_BREAKER_SLOW_SECONDS", "20"))
+BREAKER_COOLDOWN = float(os.getenv("GEMINI_BREAKER_COOLDOWN", "30"))
+
+_lock = threading.Lock()
+_genai: Any = None
+_models: Dict[Tuple[str, Tuple[Tuple[str, Any], ...]], Any] = {}
+# Event loop the SDK's async client lives on, and the pid that started it (a fork loses the thread)
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_client_loop_pid = 0
+# Absolute time.monotonic() by which the current request's LLM calls must finish
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("gemini_deadline", default=None)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a model whose circuit breaker is open"""
+
+
+class _Breaker:
+    """closed -> open after BREAKER_FAILURES bad calls -> half-open after the cooldown -> closed/open"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def _cooled_down(self) -> bool:
+        return time.monotonic() - self.opened_at >= BREAKER_COOLDOWN
+
+    def available(self) -> bool:
+        """Whether a call would be let through right now (does not claim the half-open trial)"""
+        with self._lock:
+            return self.state == "closed" or (self.state == "open" and self._cooled_down())
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and self._cooled_down():
+                # This caller makes the single trial call
+                self.state = "half-open"
+                return True
+            return False
+
+    def release(self) -> None:
+        """Give back a claimed half-open trial whose call was abandoned, without judging the model"""
+        with self._lock:
+            if self.state == "half-open":
+                self.state = "open"
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self.state = "closed"
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == "half-open" or self.failures >= BREAKER_FAILURES:
+                if self.state != "open":
+                    print(f"[GEMINI] circuit opened after {self.failures} failed or slow calls")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+_breakers: Dict[str, _Breaker] = {}
+
+
+def _breaker(model_name: str) -> _Breaker:
+    with _lock:
+        return _breakers.setdefault(model_name, _Breaker())
+
+def available(model_name: str = DEFAULT_MODEL) -> bool:
+    """True when a key is configured and the model's breaker is not open"""
+    return has_key() and _breaker(model_name).available()
+
+def has_key() -> bool:
+    """True when an API key is configured; does not import the SDK"""
+    return bool(GEMINI_KEY)
+
+def _sdk() -> Any:
+    global _genai
+    if _genai is None:
+        with _lock:
+            if _genai is None:
+                if not GEMINI_KEY:
+                    raise RuntimeError("GEMINI_API_KEY not found, please set it in the environment variable")
+                genai = importlib.import_module("google.generativeai")
+                genai.configure(api_key=GEMINI_KEY)
+                _genai = genai
+    return _genai
+
+def _model_key(generation_config: Optional[Dict[str, Any]], model_name: str) -> Tuple[str, Tuple[Tuple[str, Any], ...]]:
+    return (model_name, tuple(sorted((generation_config or {}).items())))
+
+def get_model(generation_config: Optional[Dict[str, Any]] = None, model_name: str = DEFAULT_MODEL) -> Any:
+    """Return the shared GenerativeModel for this model name and generation config"""
+    key = _model_key(generation_config, model_name)
+    model = _models.get(key)
+    if model is None:
+        genai = _sdk()
+        with _lock:
+            model = _models.get(key)
+            if model is None:
+                model = genai.GenerativeModel(model_name, generation_config=generation_config)
+                _models[key] = model
+    return model
+
+def _loop() -> asyncio.AbstractEventLoop:
+    """The client loop, started on first use"""
+    global _client_loop, _client_loop_pid
+    with _lock:
+        if _client_loop is None or _client_loop_pid != os.getpid():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="gemini-client-loop", daemon=True).start()
+            _client_loop, _client_loop_pid = loop, os.getpid()
+        return _client_loop
+
+async def _on_client_loop(coro: Any) -> Any:
+    """Run coro on the client loop and await its result; cancelling the caller cancels it there too"""
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, _loop()))
+
+async def _next_chunk(chunks: AsyncIterator[Any]) -> Any:
+    try:
+        return await chunks.__anext__()
+    except StopAsyncIteration:
+        return None
+
+async def _close_chunks(chunks: AsyncIterator[Any]) -> None:
+    aclose = getattr(chunks, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+@contextmanager
+def deadline(seconds: float) -> Iterator[None]:
+    """Bound every LLM call in this context to finish within seconds (nested deadlines only shrink)"""
+    at = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(at if outer is None else min(at, outer))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None when there is none"""
+    at = _deadline.get()
+    return None if at is None else max(0.0, at - time.monotonic())
+
+def _effective_timeout(timeout: Optional[float]) -> Optional[float]:
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise TimeoutError("LLM deadline exceeded before the request was sent")
+    return left if timeout is None else min(timeout, left)
+
+def _candidate_text(resp: Any) -> str:
+    cands = getattr(resp, "candidates", None) or []
+    if not cands or not getattr(cands[0], "content", None):
+        return ""
+    parts = getattr(cands[0].content, "parts", None) or []
+    return "".join(getattr(p, "text", "") or "" for p in parts)
+
+def response_text(resp: Any) -> str:
+    """Concatenated text of the first candidate, or "" when the model returned nothing usable"""
+    return _candidate_text(resp).strip()
+
+def _claim(model_name: str, timeout: Optional[float]) -> Tuple[_Breaker, Dict[str, Any]]:
+    """Pass the model's breaker; return it with the generate_content kwargs for this timeout"""
+    breaker = _breaker(model_name)
+    if not breaker.allow():
+        raise CircuitOpenError(f"{model_name} is unavailable, skipping the call")
+    return breaker, ({"request_options": {"timeout": timeout}} if timeout else {})
+
+def _finish(breaker: _Breaker, started: float, resp: Any) -> str:
+    breaker.record(time.monotonic() - started <= BREAKER_SLOW_SECONDS)
+    text = response_text(resp)
+    if not text:
+        raise ValueError("Empty model response")
+    return text
+
+def generate(prompt: str, generation_config: Optional[Dict[str, Any]] = None,
+             timeout: Optional[float] = None, model_name: str = DEFAULT_MODEL) -> str:
+    """
+    Send one prompt and return the response text. timeout (seconds) applies to this request only
+    and is shortened to what is left of the enclosing deadline(). Raise CircuitOpenError while the
+    model's breaker is open, TimeoutError when the deadline has already passed and ValueError on
+    an empty response; SDK and network errors propagate.
+    """
+    timeout = _effective_timeout(timeout)
+    model = get_model(generation_config, model_name)
+    breaker, kwargs = _claim(model_name, timeout)
+    started = time.monotonic()
+    try:
+        resp = model.generate_content(prompt, **kwargs)
+    except Exception:
+        breaker.record(False)
+        raise
+    return _finish(breaker, started, resp)
+
+async def agenerate(prompt: str, generation_config: Optional[Dict[str, Any]] = None,
+                    timeout: Optional[float] = None, model_name: str = DEFAULT_MODEL) -> str:
+    """generate() for async code: awaits the SDK's async API, same timeouts, breaker and errors"""
+    timeout = _effective_timeout(timeout)
+    model = get_model(generation_config, model_name)
+    breaker, kwargs = _claim(model_name, timeout)
+    started = time.monotonic()
+    try:
+        resp = await _on_client_loop(model.generate_content_async(prompt, **kwargs))
+    except asyncio.CancelledError:
+        # The client went away; that says nothing about the model
+        breaker.release()
+        raise
+    except Exception:
+        breaker.record(False)
+        raise
+    return _finish(breaker, started, resp)
+
+def generate_stream(prompt: str, generation_config: Optional[Dict[str, Any]] = None,
+                    timeout: Optional[float] = None, model_name: str = DEFAULT_MODEL) -> Iterator[str]:
+    """
+    Like generate(), but yield text chunks as the model produces them. The breaker judges
+    latency by the first chunk; a stream that ends without any text raises ValueError.
+    """
+    timeout = _effective_timeout(timeout)
+    model = get_model(generation_config, model_name)
+    breaker, kwargs = _claim(model_name, timeout)
+    started = time.monotonic()
+    received = False
+    try:
+        for chunk in model.generate_content(prompt, stream=True, **kwargs):
+            text = _candidate_text(chunk)
+            if not text:
+                continue
+            if not received:
+                received = True
+                breaker.record(time.monotonic() - started <= BREAKER_SLOW_SECONDS)
+            yield text
+    except GeneratorExit:
+        # The consumer stopped early; a half-open trial that produced nothing must not stay claimed
+        if not received:
+            breaker.release()
+        raise
+    except Exception:
+        breaker.record(False)
+        raise
+    if not received:
+        breaker.record(True)
+        raise ValueError("Empty model response")
+
+async def agenerate_stream(prompt: str, generation_config: Optional[Dict[str, Any]] = None,
+                           timeout: Optional[float] = None, model_name: str = DEFAULT_MODEL) -> AsyncIterator[str]:
+    """generate_stream() for async code: chunks come from the SDK's async API, same breaker rules"""
+    timeout = _effective_timeout(timeout)
+    model = get_model(generation_config, model_name)
+    breaker, kwargs = _claim(model_name, timeout)
+    started = time.monotonic()
+    received = False
+    chunks: Optional[AsyncIterator[Any]] = None
+    try:
+        resp = await _on_client_loop(model.generate_content_async(prompt, stream=True, **kwargs))
+        chunks = resp.__aiter__()
+        while (chunk := await _on_client_loop(_next_chunk(chunks))) is not None:
+            text = _candidate_text(chunk)
+            if not text:
+                continue
+            if not received:
+                received = True
+                breaker.record(time.monotonic() - started <= BREAKER_SLOW_SECONDS)
+            yield text
+    except (GeneratorExit, asyncio.CancelledError):
+        # The client went away or stopped reading; that says nothing about the model
+        if not received:
+            breaker.release()
+        if chunks is not None:
+            asyncio.run_coroutine_threadsafe(_close_chunks(chunks), _loop())
+        raise
+    except Exception:
+        breaker.record(False)
+        raise
+    if not received:
+        breaker.record(True)
+        raise ValueError("Empty model response")
+
+def strip_code_fence(raw: str) -> str:
+    """Remove a surrounding ```json ... ``` fence the model sometimes adds"""
+    text = raw.strip()
+    if text.startswith("```json"):
+        text = text[7:]
+    elif text.startswith("```"):
+        text = text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return text.strip()
+
+def generate_json(prompt: str, generation_config: Optional[Dict[str, Any]] = None,
+                  timeout: Optional[float] = None, model_name: str = DEFAULT_MODEL) -> Any:
+    """generate() and parse the reply as JSON; raise ValueError if it is not valid JSON"""
+    return json.loads(strip_code_fence(generate(prompt, generation_config, timeout, model_name)))
+
+async def agenerate_json(prompt: str, generation_config: Optional[Dict[str, Any]] = None,
+                         timeout: Optional[float] = None, model_name: str = DEFAULT_MODEL) -> Any:
+    """agenerate() and parse the reply as JSON; raise ValueError if it is not valid JSON"""
+    return json.loads(strip_code_fence(await agenerate(prompt, generation_config, timeout, model_name)))
@@ -1,12 +1,13 @@
 # pyright: reportMissingImports=false
-from typing import Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from contextlib import closing
 from pathlib import Path
+import hashlib
+import json
 import os
 
-def extract_text_from_pdf(pdf_path: str) -> Optional[str]:
-    """Extract PDF plain text using multiple PDF libraries and support fallback mechanism"""
-    
-    # handle path
+def resolve_pdf_path(pdf_path: str) -> Optional[Path]:
+    """Map a stored task/material url or relative path to an existing file under BASE_DIR"""
     try:
         base_dir = Path(__file__).resolve().parent.parent  # == BASE_DIR
         
@@ -21,114 +22,296 @@ def extract_text_from_pdf(pdf_path: str) -> Optional[str]:
             pdf_path = os.path.join(base_dir, pdf_path)
         
         path = Path(pdf_path)
-        print(f'[PDF_INGEST] try to read PDF: {path}')
-        
         if not path.exists() or not path.is_file():
             print(f'[PDF_INGEST] PDF file not found: {path}')
             return None
+        return path
             
     except Exception as e:
         print(f'[PDF_INGEST] fail to handle path: {e}')
         return None
-    
-    # try using pypdf
-    text = _extract_with_pypdf(str(path))
-    if text and len(text.strip()) > 50:
-        print(f'[PDF_INGEST] pypdf succeed,length: {len(text)}')
-        return text
-    
-    # try using PyPDF2
-    text = _extract_with_pypdf2(str(path))
-    if text and len(text.strip()) > 50:
-        print(f'[PDF_INGEST] PyPDF2 succeed,length: {len(text)}')
-        return text
-    
-    #try using pdfplumber
-    text = _extract_with_pdfplumber(str(path))
-    if text and len(text.strip()) > 50:
-        print(f'[PDF_INGEST] pdfplumber succeed,length: {len(text)}')
-        return text
-    
-    # try using fitz (PyMuPDF)
-    text = _extract_with_fitz(str(path))
-    if text and len(text.strip()) > 50:
-        print(f'[PDF_INGEST] PyMuPDF succeed,length: {len(text)}')
-        return text
-    
-    print(f'[PDF_INGEST] All PDF extraction methods have failed')
-    return None
-
-def _extract_with_pypdf(pdf_path: str) -> Optional[str]:
-    """Extract text using pypdf"""
+
+def extract_text_from_pdf(pdf_path: str, max_chars: Optional[int] = None) -> Optional[str]:
+    """
+    Extract PDF plain text using multiple PDF libraries and support fallback mechanism.
+    With max_chars, reading stops at the first page boundary past that many characters.
+    """
+    text = "\n\n".join(iter_pdf_text(pdf_path, max_chars=max_chars))
+    if not text:
+        print(f'[PDF_INGEST] All PDF extraction methods have failed')
+        return None
+    return text
+
+def iter_pdf_text(pdf_path: str, max_chars: Optional[int] = None,
+                  max_pages: Optional[int] = None) -> Iterator[str]:
+    """
+    Yield the text of each non-empty page lazily, stopping once max_chars characters
+    (counting the blank line between pages) or max_pages pages have been yielded.
+    Pages come from the text store when it covers the budget; otherwise they are parsed
+    on demand and whatever was read is stored when the generator finishes or is closed.
+    """
+    path = resolve_pdf_path(pdf_path)
+    if path is None:
+        return
+
+    # Pre-extracted text for this exact file version, if it covers the budget
+    entry = load_extracted_text(path)
+    if entry is not None and _covers_budget(entry, max_chars, max_pages):
+        print(f'[PDF_INGEST] text cache hit ({entry["extractor"]}): {path}')
+        total = 0
+        for count, text in enumerate(_stored_pages(entry), 1):
+            yield text
+            total += len(text) + 2
+            if _budget_reached(total, count, max_chars, max_pages):
+                return
+        return
+
+    print(f'[PDF_INGEST] try to read PDF: {path}')
+    stream = _stream_pages(path, entry["extractor"] if entry else None)
+    extractor: Optional[str] = None
+    pages: List[Tuple[int, str]] = []
+    complete = False
+    total = 0
     try:
-        from pypdf import PdfReader
-        reader = PdfReader(pdf_path)
-        texts = []
-        for i, page in enumerate(reader.pages):
+        for extractor, page_no, text in stream:
+            pages.append((page_no, text))
+            yield text
+            total += len(text) + 2
+            if _budget_reached(total, len(pages), max_chars, max_pages):
+                break
+        else:
+            complete = True
+    except Exception as e:
+        print(f'[PDF_INGEST] {extractor} stopped after {len(pages)} pages: {e}')
+    finally:
+        stream.close()
+        print(f'[PDF_INGEST] {extractor} read {len(pages)} pages{"" if complete else " (stopped early)"}')
+        _store_extracted_text(path, extractor, pages, complete)
+
+def _budget_reached(total: int, count: int, max_chars: Optional[int], max_pages: Optional[int]) -> bool:
+    return (max_chars is not None and total >= max_chars) or (max_pages is not None and count >= max_pages)
+
+def _covers_budget(entry: Dict[str, Any], max_chars: Optional[int], max_pages: Optional[int]) -> bool:
+    """A stored entry serves a read if it is complete or replaying it would reach the budget"""
+    if entry.get("complete", True):
+        return True
+    # The same count the read loop uses: every page, the last included, adds its separator
+    total = len(entry["text"]) + 2 * len(entry["pages"])
+    return _budget_reached(total, len(entry["pages"]), max_chars, max_pages)
+
+def _stored_pages(entry: Dict[str, Any]) -> Iterator[str]:
+    """Split a stored entry back into page texts using its page offsets"""
+    text = entry["text"]
+    offsets = [off for _, off in entry["pages"]]
+    for i, start in enumerate(offsets):
+        end = offsets[i + 1] - 2 if i + 1 < len(offsets) else len(text)
+        yield text[start:end]
+
+# Pages read from each backend to judge whether it gets text out of this document
+PROBE_PAGES = 2
+
+def _has_text(pages: List[Tuple[int, str]]) -> bool:
+    return len("\n\n".join(t for _, t in pages).strip()) > 50
+
+def _stream_pages(path: Path, preferred: Optional[str] = None) -> Iterator[Tuple[str, int, str]]:
+    """
+    Pick a backend by probing the first PROBE_PAGES pages with each (fastest first, or the
+    backend that won for this file before), then yield (backend, page number, text) for the
+    non-empty pages of the winner. Errors after the probe propagate to the caller.
+    """
+    # The fastest backend's probe stays open: if no backend finds text in its probe pages,
+    # it reads on from there rather than reopening the file
+    fallback: Optional[Tuple[str, Iterator[Tuple[int, str]], List[Tuple[int, str]]]] = None
+    try:
+        backends = sorted(_EXTRACTORS, key=lambda b: b[0] != preferred)
+        for name, iter_pages in backends:
+            # Empty pages count towards the probe, so a text-less document costs each backend
+            # PROBE_PAGES pages rather than a full pass
+            probe: List[Tuple[int, str]] = []
             try:
-                text = page.extract_text() or ""
-                texts.append(text.strip())
-            except Exception:
+                gen = iter_pages(str(path))
+                for page in gen:
+                    probe.append(page)
+                    if len(probe) >= PROBE_PAGES:
+                        break
+            except Exception as e:
+                print(f'[PDF_INGEST] {name} fail: {e}')
                 continue
-        result = "\n\n".join(t for t in texts if t)
-        return result if result.strip() else None
-    except Exception as e:
-        print(f'[PDF_INGEST] pypdf fail: {e}')
-        return None
+            if not _has_text(probe):
+                if name == _EXTRACTORS[0][0] and fallback is None:
+                    fallback = (name, gen, probe)
+                else:
+                    gen.close()
+                continue
+
+            print(f'[PDF_INGEST] {name} picked after probing {len(probe)} pages')
+            with closing(gen):
+                yield from _non_empty(name, probe)
+                yield from _non_empty(name, gen)
+            return
+
+        # No backend found text on the first pages (e.g. image cover): read on with the
+        # fastest until some text turns up
+        if fallback is None:
+            return
+        name, gen, buffered = fallback
+        try:
+            for page in gen:
+                buffered.append(page)
+                if _has_text(buffered):
+                    break
+        except Exception as e:
+            print(f'[PDF_INGEST] {name} fail: {e}')
+            return
+        if not _has_text(buffered):
+            return
+        yield from _non_empty(name, buffered)
+        yield from _non_empty(name, gen)
+    finally:
+        if fallback is not None:
+            fallback[1].close()
+
+def _non_empty(name: str, pages: Iterable[Tuple[int, str]]) -> Iterator[Tuple[str, int, str]]:
+    for page_no, text in pages:
+        if text:
+            yield name, page_no, text
+
+# ---------------------------------------------------------------------------
+# Extracted-text store: one JSON sidecar per file version under TEXT_CACHE_DIR.
+# The sidecar name hashes (path, size, mtime) so a stat() finds it; the entry also
+# records the content sha256, the extractor that won and each page's offset in the text.
+# ---------------------------------------------------------------------------
 
-def _extract_with_pypdf2(pdf_path: str) -> Optional[str]:
-    """Extracting Text with PyPDF2"""
+TEXT_CACHE_DIR = Path(os.getenv("PDF_TEXT_CACHE_DIR") or Path(__file__).resolve().parent.parent / ".pdf_text_cache")
+
+def _fingerprint(path: Path) -> Tuple[str, int, int]:
+    st = path.stat()
+    return str(path.resolve()), st.st_size, st.st_mtime_ns
+
+def _sidecar_for(fingerprint: Tuple[str, int, int]) -> Path:
+    name = hashlib.sha256("|".join(str(x) for x in fingerprint).encode("utf-8")).hexdigest()
+    return TEXT_CACHE_DIR / f"{name}.json"
+
+def load_extracted_text(path: Path) -> Optional[Dict[str, Any]]:
+    """
+    Return the stored extraction for the current version of path, or None.
+    Entry: {"path", "size", "mtime_ns", "sha256", "extractor", "text", "pages": [[page, offset]], "complete"};
+    extractor is None (and text empty) when no backend could read the file, complete is False
+    when extraction stopped at a character budget.
+    """
     try:
-        import PyPDF2
-        with open(pdf_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            texts = []
-            for page in reader.pages:
-                try:
-                    text = page.extract_text() or ""
-                    texts.append(text.strip())
-                except Exception:
-                    continue
-            result = "\n\n".join(t for t in texts if t)
-            return result if result.strip() else None
+        fingerprint = _fingerprint(path)
+        sidecar = _sidecar_for(fingerprint)
+        if not sidecar.exists():
+            return None
+        entry = json.loads(sidecar.read_text(encoding="utf-8"))
+        if (entry.get("path"), entry.get("size"), entry.get("mtime_ns")) != fingerprint:
+            return None
+        return entry
     except Exception as e:
-        print(f'[PDF_INGEST] PyPDF2 fail: {e}')
+        print(f'[PDF_INGEST] text cache read fail: {e}')
         return None
 
-def _extract_with_pdfplumber(pdf_path: str) -> Optional[str]:
-    """Extracting Text with PDF Lumber"""
+def _store_extracted_text(path: Path, extractor: Optional[str], pages: List[Tuple[int, str]],
+                          complete: bool = True) -> None:
     try:
-        import pdfplumber
-        texts = []
-        with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages:
-                try:
-                    text = page.extract_text() or ""
-                    texts.append(text.strip())
-                except Exception:
-                    continue
-        result = "\n\n".join(t for t in texts if t)
-        return result if result.strip() else None
+        fingerprint = _fingerprint(path)
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+
+        offsets: List[List[int]] = []
+        pos = 0
+        for page_no, text in pages:
+            offsets.append([page_no, pos])
+            pos += len(text) + 2  # "\n\n" separator
+        entry = {
+            "path": fingerprint[0],
+            "size": fingerprint[1],
+            "mtime_ns": fingerprint[2],
+            "sha256": sha.hexdigest(),
+            "extractor": extractor,
+            "text": "\n\n".join(text for _, text in pages),
+            "pages": offsets,
+            "complete": complete,
+        }
+
+        TEXT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        sidecar = _sidecar_for(fingerprint)
+        tmp = sidecar.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, sidecar)
     except Exception as e:
-        print(f'[PDF_INGEST] pdfplumber fail: {e}')
-        return None
+        print(f'[PDF_INGEST] text cache write fail: {e}')
 
-def _extract_with_fitz(pdf_path: str) -> Optional[str]:
-    """Extract text using PyMuPDF (fitz)"""
-    try:
-        import fitz  # PyMuPDF
-        doc = fitz.open(pdf_path)
-        texts = []
+def warm_text_cache(roots: Iterable[Path]) -> Dict[str, int]:
+    """Pre-extract every PDF under the given roots; return counts of cached/extracted/failed files"""
+    stats = {"cached": 0, "extracted": 0, "failed": 0}
+    for root in roots:
+        for path in sorted(Path(root).rglob("*")):
+            if not path.is_file() or path.suffix.lower() != ".pdf":
+                continue
+            entry = load_extracted_text(path)
+            if entry is not None and entry.get("complete", True):
+                stats["cached"] += 1
+                continue
+            for _ in iter_pdf_text(str(path)):
+                pass
+            entry = load_extracted_text(path)
+            stats["extracted" if entry and entry["extractor"] else "failed"] += 1
+    return stats
+
+def _pages_pypdf(pdf_path: str) -> Iterator[Tuple[int, str]]:
+    """Yield (page number, text) using pypdf"""
+    from pypdf import PdfReader
+    reader = PdfReader(pdf_path)
+    for i, page in enumerate(reader.pages):
+        try:
+            text = (page.extract_text() or "").strip()
+        except Exception:
+            text = ""
+        yield i + 1, text
+
+def _pages_pypdf2(pdf_path: str) -> Iterator[Tuple[int, str]]:
+    """Yield (page number, text) using PyPDF2"""
+    import PyPDF2
+    with open(pdf_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        for i, page in enumerate(reader.pages):
+            try:
+                text = (page.extract_text() or "").strip()
+            except Exception:
+                text = ""
+            yield i + 1, text
+
+def _pages_pdfplumber(pdf_path: str) -> Iterator[Tuple[int, str]]:
+    """Yield (page number, text) using pdfplumber"""
+    import pdfplumber
+    with pdfplumber.open(pdf_path) as pdf:
+        for i, page in enumerate(pdf.pages):
+            try:
+                text = (page.extract_text() or "").strip()
+            except Exception:
+                text = ""
+            yield i + 1, text
+
+def _pages_fitz(pdf_path: str) -> Iterator[Tuple[int, str]]:
+    """Yield (page number, text) using PyMuPDF (fitz)"""
+    import fitz  # PyMuPDF
+    with fitz.open(pdf_path) as doc:
         for page_num in range(doc.page_count):
             try:
-                page = doc[page_num]
-                text = page.get_text() or ""
-                texts.append(text.strip())
+                text = (doc[page_num].get_text() or "").strip()
             except Exception:
-                continue
-        doc.close()
-        result = "\n\n".join(t for t in texts if t)
-        return result if result.strip() else None
-    except Exception as e:
-        print(f'[PDF_INGEST] PyMuPDF失败: {e}')
-        return None
\ No newline at end of file
+                text = ""
+            yield page_num + 1, text
+
+# Probe order, fastest first; PyPDF2 is the legacy predecessor of pypdf. Each yields every
+# page in order, "" for pages without text, so probes and budgets can count them
+_EXTRACTORS = [
+    ("PyMuPDF", _pages_fitz),
+    ("pypdf", _pages_pypdf),
+    ("pdfplumber", _pages_pdfplumber),
+    ("PyPDF2", _pages_pypdf2),
+]
@@ -1,34 +1,27 @@
 # pyright: reportMissingImports=false
-import os, json, importlib
+import os, json
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import List, Dict, Optional, Any, Tuple
 from dotenv import load_dotenv
 from .types import TaskWithParts, Part, Preferences
 from .scheduler import schedule
 from .pdf_ingest import extract_text_from_pdf
-from .llm_structures import summarize_task_details
+from .llm_structures import summarize_task_details, SUMMARY_TEXT_LIMIT, LLM_CALL_TIMEOUT
+from . import analysis_cache, gemini_client
 
 
 
 load_dotenv()
-GEMINI_KEY = os.getenv("GEMINI_API_KEY")
-use_gemini: bool = bool(GEMINI_KEY)
-_split_model: Any = None
-print("[Gemini Check] GEMINI_KEY found?", bool(GEMINI_KEY)) 
-
-if use_gemini:
-    try:
-        genai = importlib.import_module("google.generativeai")  # type: ignore[reportMissingImports]
-        genai.configure(api_key=GEMINI_KEY)
-        _split_model = genai.GenerativeModel(
-            "gemini-2.5-flash",
-            generation_config={"temperature": 0.2, "max_output_tokens": 1024}
-        )
-        print("[Gemini Check] Gemini model loaded successfully ✅")
-    except Exception:
-        use_gemini = False
-        print("[Gemini Check] Failed to load Gemini ❌:")
-else:
-    print("[Gemini Check] No GEMINI_API_KEY found, using fallback mode ⚙️")
+use_gemini: bool = gemini_client.has_key()
+# Task analysis (PDF + LLM) runs in parallel; tasks not done within the deadline fall back
+PLAN_ANALYSIS_WORKERS = int(os.getenv("PLAN_ANALYSIS_WORKERS", "4"))
+PLAN_ANALYSIS_DEADLINE = float(os.getenv("PLAN_ANALYSIS_DEADLINE", "25"))
+GEMINI_MODEL_NAME = gemini_client.DEFAULT_MODEL
+SPLIT_GENERATION_CONFIG = {"temperature": 0.2, "max_output_tokens": 1024}
+# Bump when the split prompt here or the summary prompt in llm_structures changes
+ANALYSIS_PROMPT_VERSION = "1"
+print("[Gemini Check] GEMINI_KEY found?", use_gemini)
 
 
 def _equal_split(minutes_total: int, parts: int = 3) -> List[int]:
@@ -73,11 +66,14 @@ def _heuristic_minutes_from_text(txt: str) -> int:
     minutes = int(max(180, min(8*60, impl_minutes * 60))) 
     return minutes
 
-def _ai_split_parts(task_title: str, due_date: str, estimated_minutes: int) -> List[Part]:
-  
-    if not use_gemini or _split_model is None:
+def _ai_split_parts(task_title: str, due_date: str, estimated_minutes: int) -> Tuple[List[Part], bool]:
+    """Return (parts, from_model); from_model is False whenever a fallback split was used"""
+    if not use_gemini:
         mins = _equal_split(estimated_minutes, 3)
-        return [Part(partId=f"p{i+1}", order=i+1, title=f"Part {i+1} - General Task", minutes=mins[i]) for i in range(len(mins))]
+        return [Part(partId=f"p{i+1}", order=i+1, title=f"Part {i+1} - General Task", minutes=mins[i]) for i in range(len(mins))], False
+    if not gemini_client.available():
+        print(f"[DEBUG] Gemini circuit open, using intelligent fallback data")
+        return _intelligent_fallback_split(task_title, estimated_minutes), False
     prompt = f"""
 Split the task into 2–6 ordered parts whose minutes sum ≈ {estimated_minutes}.
 Each part should be 30-60 minutes (prefer 45 minutes as target).
@@ -96,36 +92,9 @@ Due: {due_date}
     for attempt in range(max_retries):
         try:
             print(f"[DEBUG] Try to call Gemini API  {attempt + 1}/{max_retries} (plan_generator)")
-            
+            raw = gemini_client.generate(prompt, SPLIT_GENERATION_CONFIG, timeout=LLM_CALL_TIMEOUT)
 
-            import socket
-            original_timeout = socket.getdefaulttimeout()
-            socket.setdefaulttimeout(10) 
-            
-            try:
-                resp = _split_model.generate_content(prompt)
-            finally:
-                socket.setdefaulttimeout(original_timeout)
-            
-            cands = getattr(resp, "candidates", None) or []
-            raw = None
-            if cands and getattr(cands[0], "content", None):
-                parts = getattr(cands[0].content, "parts", None) or []
-                texts = [getattr(p, "text", "") for p in parts if getattr(p, "text", "")]
-                raw = "\n".join(texts).strip() if texts else None
-            if not raw:
-                if attempt < max_retries - 1:
-                    print(f"[DEBUG] no response, retry({attempt + 2}/{max_retries})...")
-                    continue
-                raise ValueError("Empty model response")
-
-           
-            clean_json = raw.strip()
-            if clean_json.startswith('```json'):
-                clean_json = clean_json[7:]  
-            if clean_json.endswith('```'):
-                clean_json = clean_json[:-3]  
-            clean_json = clean_json.strip()
+            clean_json = gemini_client.strip_code_fence(raw)
             
             # Fix common JSON formatting issues
             import re
@@ -163,25 +132,25 @@ Due: {due_date}
             
         
             print(f"[DEBUG] ✅ Split into {len(out)} parts")
-            return out
+            return out, True
             
         except (BrokenPipeError, ConnectionError, OSError) as e:
             print(f"[DEBUG] network err: {type(e).__name__} - {e}")
             print(f"[DEBUG] ❌ API call failed, using intelligent fallback data")
-            return _intelligent_fallback_split(task_title, estimated_minutes)
+            return _intelligent_fallback_split(task_title, estimated_minutes), False
         except Exception as e:
             print(f"[DEBUG] Gemini faile (retry {attempt + 1}/{max_retries}): {type(e).__name__} - {e}")
             print(f"[DEBUG] ❌ fail to decode content，use fall back data")
-            return _intelligent_fallback_split(task_title, estimated_minutes)
+            return _intelligent_fallback_split(task_title, estimated_minutes), False
     
-    return _intelligent_fallback_split(task_title, estimated_minutes)
+    return _intelligent_fallback_split(task_title, estimated_minutes), False
 
 def _parts_from_summary_or_fallback(task_title: str, due_date: str,
                                     est_minutes: int,
-                                    summary: Optional[Dict[str, Any]]) -> Tuple[List[Part], str]:
+                                    summary: Optional[Dict[str, Any]]) -> Tuple[List[Part], str, bool]:
     """
     Prioritize using suggested Parts (including notes) from LLM abstracts, and allocate minutes equally;
-Otherwise, use LLM to split; Otherwise, divide equally. Return (parts, explanation)
+Otherwise, use LLM to split; Otherwise, divide equally. Return (parts, explanation, from_model)
     """
     print("summary keys:", list(summary.keys()) if summary else None)
     explanation = "Split into ordered parts to progress from setup to implementation to validation."
@@ -202,12 +171,12 @@ Otherwise, use LLM to split; Otherwise, divide equally. Return (parts, explanati
                 notes=item.get("notes") or ""
             ))
         explanation = summary.get("explanation") or explanation
-        return out, explanation
+        return out, explanation, True
     else:
         print("[parts] from ai_split or equal_split") 
     # No abstract: Attempt to split LLM directly; Otherwise, divide equally
-    parts = _ai_split_parts(task_title, due_date, est_minutes)
-    return parts, explanation
+    parts, from_model = _ai_split_parts(task_title, due_date, est_minutes)
+    return parts, explanation, from_model
 
 def _generate_reason_for_part(label: str, index: int, total_parts: int) -> str:
     """Generate reasons for each part in the plan"""
@@ -258,11 +227,17 @@ def _to_task_with_parts(meta: Dict[str, Any]) -> Tuple[TaskWithParts, Dict[str,
       "parts":[{"partId","order","title","minutes","notes","percent"}]
     }
     """
+    parts, explanation, _ = _analyse_task(meta)
+    return _build_task_with_parts(meta, parts, explanation)
+
+def _analyse_task(meta: Dict[str, Any]) -> Tuple[List[Part], str, bool]:
+    """PDF + LLM analysis of one task. Return (parts, explanation, from_model)"""
     
     # 1) Extract detailed text
     detail_text = meta.get("detailText")
     if not detail_text and meta.get("detailPdfPath"):
-        detail_text = extract_text_from_pdf(meta["detailPdfPath"])
+        # Only the summary budget is ever used, so stop reading the PDF there
+        detail_text = extract_text_from_pdf(meta["detailPdfPath"], max_chars=SUMMARY_TEXT_LIMIT)
     
     # 2) LLM Summary (optional)
     summary = summarize_task_details(meta["task"], meta["dueDate"], detail_text) if detail_text else None
@@ -271,9 +246,24 @@ def _to_task_with_parts(meta: Dict[str, Any]) -> Tuple[TaskWithParts, Dict[str,
     est_minutes = _estimate_minutes(meta.get("estimatedHours"), summary, detail_text)
 
     # 4) Generate parts+explanation
-    parts, explanation = _parts_from_summary_or_fallback(meta["task"], meta["dueDate"], est_minutes, summary)
+    parts, explanation, from_model = _parts_from_summary_or_fallback(meta["task"], meta["dueDate"], est_minutes, summary)
+
+    print("[debug] meta keys:", list(meta.keys()))
+    print("[debug] detailText len:", len(meta.get("detailText","")) if meta.get("detailText") else None)
+    print("[debug] detailPdfPath:", meta.get("detailPdfPath"))
+    print("[debug] summary type:", type(summary))
 
-    # 5) Calculate the percentage and construct aiTaskInfo (including the fields required for Explain My Plan)
+    return parts, explanation, from_model or summary is not None
+
+def _fallback_task_with_parts(meta: Dict[str, Any]) -> Tuple[TaskWithParts, Dict[str, Any]]:
+    """Same shape as _to_task_with_parts, without PDF or LLM work (used when analysis times out)"""
+    est_minutes = _estimate_minutes(meta.get("estimatedHours"), None, meta.get("detailText"))
+    parts = _intelligent_fallback_split(str(meta["task"]), est_minutes)
+    explanation = "Split into ordered parts to progress from setup to implementation to validation."
+    return _build_task_with_parts(meta, parts, explanation)
+
+def _build_task_with_parts(meta: Dict[str, Any], parts: List[Part], explanation: str) -> Tuple[TaskWithParts, Dict[str, Any]]:
+    """Calculate the percentage and construct aiTaskInfo (including the fields required for Explain My Plan)"""
     total = sum(max(0, int(p.minutes)) for p in parts) or 1
     ai_parts = []
     for i, p in enumerate(sorted(parts, key=lambda x: x.order)):
@@ -305,11 +295,6 @@ def _to_task_with_parts(meta: Dict[str, Any]) -> Tuple[TaskWithParts, Dict[str,
         "explanation": explanation,
         "parts": ai_parts
     }
-    print("[debug] meta keys:", list(meta.keys()))
-    print("[debug] detailText len:", len(meta.get("detailText","")) if meta.get("detailText") else None)
-    print("[debug] detailPdfPath:", meta.get("detailPdfPath"))
-    print("[debug] summary type:", type(summary))
-
     return TaskWithParts(
         taskId=str(meta["id"]),
         taskTitle=str(meta["task"]),
@@ -317,6 +302,65 @@ def _to_task_with_parts(meta: Dict[str, Any]) -> Tuple[TaskWithParts, Dict[str,
         parts=parts
     ), ai_info
 
+def _analysis_cache_key(meta: Dict[str, Any]) -> str:
+    """Content-addressed key: the same PDF, title and due date analyse identically for every student"""
+    return analysis_cache.make_key(
+        analysis_cache.content_hash(meta.get("detailPdfPath"), meta.get("detailText")),
+        meta["task"], meta["dueDate"], meta.get("estimatedHours") or "",
+        ANALYSIS_PROMPT_VERSION, GEMINI_MODEL_NAME,
+    )
+
+def _analyse_tasks(tasks_meta: List[Dict[str, Any]]) -> List[Tuple[TaskWithParts, Dict[str, Any]]]:
+    """
+    Serve cached analyses first, then run _analyse_task for the rest on a bounded thread pool
+    under one plan-wide deadline. Results keep the input order; tasks that fail or miss the
+    deadline use the fallback split. Cache reads and writes stay on the calling thread.
+    The same deadline bounds each worker's LLM calls, so stragglers give up instead of
+    running on after the plan has been returned.
+    """
+    results: List[Optional[Tuple[TaskWithParts, Dict[str, Any]]]] = [None] * len(tasks_meta)
+    keys: List[Optional[str]] = [None] * len(tasks_meta)
+    pending: List[int] = []
+    for i, m in enumerate(tasks_meta):
+        try:
+            keys[i] = _analysis_cache_key(m)
+        except Exception as e:
+            print(f"[DEBUG] cannot build analysis cache key for {m.get('id')}: {e}")
+        cached = analysis_cache.get(keys[i]) if keys[i] else None
+        if cached:
+            parts = [Part(**p) for p in cached["parts"]]
+            results[i] = _build_task_with_parts(m, parts, cached["explanation"])
+        else:
+            pending.append(i)
+
+    if pending:
+        executor = ThreadPoolExecutor(max_workers=max(1, min(PLAN_ANALYSIS_WORKERS, len(pending))))
+        with gemini_client.deadline(PLAN_ANALYSIS_DEADLINE):
+            # Each worker runs in a copy of this context so it sees the deadline
+            futures = {i: executor.submit(contextvars.copy_context().run, _analyse_task, tasks_meta[i])
+                       for i in pending}
+        done, _ = wait(futures.values(), timeout=PLAN_ANALYSIS_DEADLINE)
+        # Do not block on stragglers; they finish (or time out) in the background
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        for i, f in futures.items():
+            m = tasks_meta[i]
+            if f in done and f.exception() is None:
+                parts, explanation, from_model = f.result()
+                results[i] = _build_task_with_parts(m, parts, explanation)
+                # Only model output is worth sharing; fallbacks are retried next time
+                if from_model and keys[i]:
+                    analysis_cache.put(keys[i], m.get("detailPdfPath") or "", {
+                        "explanation": explanation,
+                        "parts": [{"partId": p.partId, "order": p.order, "title": p.title,
+                                   "minutes": int(p.minutes), "notes": p.notes} for p in parts],
+                    })
+                continue
+            reason = f.exception() if f in done else "deadline exceeded"
+            print(f"[DEBUG] ❌ task analysis for {m.get('id')} failed ({reason}), using intelligent fallback data")
+            results[i] = _fallback_task_with_parts(m)
+    return results
+
 def generate_plan(preferences: Dict[str, Any], tasks_meta: List[Dict[str, Any]], user_timezone: str = 'UTC') -> Dict[str, Any]:
 
     
@@ -335,8 +379,7 @@ def generate_plan(preferences: Dict[str, Any], tasks_meta: List[Dict[str, Any]],
 
     task_objs: List[TaskWithParts] = []
     ai_summaries: List[Dict[str, Any]] = []
-    for m in valid_tasks:
-        t, info = _to_task_with_parts(m)
+    for t, info in _analyse_tasks(valid_tasks):
         task_objs.append(t)
         ai_summaries.append(info)
     prefs = Preferences(
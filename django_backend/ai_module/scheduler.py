@@ -1,4 +1,5 @@
 from datetime import date, timedelta, datetime
+from itertools import accumulate
 from typing import List, Dict, Optional, Tuple, Any
 from .types import TaskWithParts, Preferences
 def _normalize_avoid_days(raw) -> set[int]:
@@ -52,6 +53,186 @@ Rule: First remove avoid_days. If today is a day to avoid, start from tomorrow
     #     return base
     # return base[:max(0, weekly_study_days)]
 
+class _DayCapacityIndex:
+    """
+    Max segment tree over the free minutes of consecutive plan days.
+    first_fit answers "first day at or before hi with >= need free minutes" in O(log n),
+    so placement no longer rescans the whole calendar for every part.
+    """
+
+    def __init__(self, capacities: List[int]):
+        self.n = len(capacities)
+        size = 1
+        while size < self.n:
+            size *= 2
+        self._size = size
+        self._tree = [0] * (2 * size)
+        self._tree[size:size + self.n] = capacities
+        for i in range(size - 1, 0, -1):
+            self._tree[i] = max(self._tree[2 * i], self._tree[2 * i + 1])
+
+    def grow(self, deltas: List[int]) -> None:
+        """Add per-day extra minutes (one delta per day) and rebuild the tree in O(n)."""
+        for i, delta in enumerate(deltas):
+            self._tree[self._size + i] += delta
+        for i in range(self._size - 1, 0, -1):
+            self._tree[i] = max(self._tree[2 * i], self._tree[2 * i + 1])
+
+    def free(self, idx: int) -> int:
+        return self._tree[self._size + idx]
+
+    def consume(self, idx: int, minutes: int) -> None:
+        """Take minutes from the day at idx (negative minutes give them back)."""
+        i = self._size + idx
+        self._tree[i] -= minutes
+        i //= 2
+        while i:
+            self._tree[i] = max(self._tree[2 * i], self._tree[2 * i + 1])
+            i //= 2
+
+    def first_fit(self, hi: int, need: int) -> int:
+        """Return the smallest index <= hi whose free minutes >= need, or -1."""
+        if hi < 0 or self.n == 0:
+            return -1
+        return self._descend(1, 0, self._size - 1, min(hi, self.n - 1), need)
+
+    def _descend(self, node: int, lo: int, hi_node: int, hi: int, need: int) -> int:
+        if lo > hi or self._tree[node] < need:
+            return -1
+        if node >= self._size:
+            return lo
+        mid = (lo + hi_node) // 2
+        found = self._descend(2 * node, lo, mid, hi, need)
+        if found >= 0:
+            return found
+        return self._descend(2 * node + 1, mid + 1, hi_node, hi, need)
+
+def _resolve_today(today: Optional[date], user_timezone: str) -> date:
+    if today is not None:
+        return today
+    import pytz
+    from django.utils import timezone as django_timezone
+    try:
+        user_tz = pytz.timezone(user_timezone)
+        return django_timezone.now().astimezone(user_tz).date()
+    except Exception:
+        # invalid tz->utc
+        return date.today()
+
+def _build_day_capacities(start: date, end: date, today: date,
+                          daily_cap_min: int, weekly_days: int, avoid_set: set[int]) -> List[int]:
+    """
+    Return one capacity in minutes per consecutive date from start to end,
+    so a date maps to its index by ordinal offset and every level shares the same axis.
+    """
+    capacities: List[int] = []
+    d = start
+    while d <= end:
+        week_start = week_monday(d)
+        is_first_week = (week_start == week_monday(start))
+        start_wd = start.weekday() if is_first_week else 0
+
+        allowed_weekdays = set(_allowed_weekdays_for_week(weekly_days, avoid_set, start_wd))
+
+        for offset in range(7):
+            cur = week_start + timedelta(days=offset)
+            if cur > end:
+                break
+            cap = daily_cap_min if (cur.weekday() in allowed_weekdays and cur >= today) else 0
+            if cur >= d:
+                capacities.append(cap)
+        d = week_start + timedelta(days=7)
+    return capacities
+
+def _relaxation_levels(prefs: Preferences) -> List[Tuple[str, int, int, set[int]]]:
+    """
+    Relaxation ladder as (name, daily cap minutes, days per week, avoid set).
+    Each level only adds capacity to the previous one, so placements stay valid when escalating.
+    """
+    base_daily = int(prefs.daily_hour_cap) * 60
+    base_weekly_days = max(1, min(7, int(prefs.weekly_study_days)))
+    base_avoid = _normalize_avoid_days(prefs.avoid_days)
+    non_avoid = set(i for i in range(7) if i not in base_avoid)
+    step1_weekly = min(7, max(base_weekly_days, len(non_avoid)))
+    return [
+        ("none", base_daily, base_weekly_days, base_avoid),
+        ("expand-days-per-week", base_daily, step1_weekly, base_avoid),
+        ("allow-avoid-days", base_daily, 7, set()),
+        ("max10h", max(base_daily, 10*60), 7, set()),
+    ]
+
+def _min_feasible_level(tasks_sorted: List[TaskWithParts], start: date,
+                        level_capacities: List[List[int]]) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Deadline-ordered prefix-sum check: a level is feasible when, for every due date,
+    the minutes due by then fit in the capacity up to then. Return (lowest feasible level, [])
+    or (-1, parts that overflow at the top level). Whole-part/chunk granularity is not
+    modelled, so placement may still need to climb past the returned level.
+    """
+    n = len(level_capacities[0]) if level_capacities else 0
+    # (due index, part, task) in placement order; past-due parts have no days and are skipped
+    demand = []
+    for t in tasks_sorted:
+        due_idx = min((iso_to_date(t.dueDate) - start).days, n - 1)
+        if due_idx < 0:
+            continue
+        for p in sorted(t.parts, key=lambda x: x.order):
+            if int(p.minutes) > 0:
+                demand.append((due_idx, p, t))
+
+    for level, capacities in enumerate(level_capacities):
+        supply = list(accumulate(capacities))
+        need = 0
+        for due_idx, p, _ in demand:
+            need += int(p.minutes)
+            if need > supply[due_idx]:
+                break
+        else:
+            return level, []
+
+    # Even the top level overflows: fill earliest deadlines first and report what is left
+    supply = list(accumulate(level_capacities[-1]))
+    used = 0
+    unplaced: List[Dict[str, Any]] = []
+    for due_idx, p, t in demand:
+        minutes = int(p.minutes)
+        placed = max(0, min(minutes, supply[due_idx] - used))
+        used += placed
+        if placed < minutes:
+            unplaced.append({
+                "taskId": t.taskId,
+                "partId": p.partId,
+                "title": p.title,
+                "minutes_remaining": minutes - placed,
+                "dueDate": t.dueDate
+            })
+    return -1, unplaced
+
+def check_feasibility(tasks: List[TaskWithParts], prefs: Preferences, today: Optional[date] = None,
+                      user_timezone: str = 'UTC') -> Dict[str, Any]:
+    """
+    Cheap feasibility verdict without placing any block, e.g. for a live hint on the
+    preferences page. Returns {"ok", "relaxation"} with the minimum relaxation level
+    schedule() would start from, plus "unplaceableParts" when even max10h is not enough.
+    """
+    today = _resolve_today(today, user_timezone)
+    if not tasks:
+        # Nothing to place fits under any preferences
+        return {"ok": True, "relaxation": "none", "unplaceableParts": []}
+
+    start = today
+    end = week_monday(max(iso_to_date(t.dueDate) for t in tasks)) + timedelta(days=6)
+    levels = _relaxation_levels(prefs)
+    level_capacities = [
+        _build_day_capacities(start, end, today, daily, weekly, avoid)
+        for _, daily, weekly, avoid in levels
+    ]
+    tasks_sorted = sorted(tasks, key=lambda t: iso_to_date(t.dueDate))
+    level, unplaced = _min_feasible_level(tasks_sorted, start, level_capacities)
+    if level < 0:
+        return {"ok": False, "relaxation": "impossible", "unplaceableParts": unplaced}
+    return {"ok": True, "relaxation": levels[level][0], "unplaceableParts": []}
+
 def schedule(tasks: List[TaskWithParts], prefs: Preferences, today: Optional[date] = None, user_timezone: str = 'UTC') -> Dict[str, Any]:
     """
     Put the parts in order into the actual date blocks.
@@ -67,6 +248,9 @@ def schedule(tasks: List[TaskWithParts], prefs: Preferences, today: Optional[dat
     2) Allow avoidance days: Allow the use of avoid days
     3) Max10h: Increase the daily limit to 10h
     Still insufficient: Return 'impossible' and list the parts that cannot be placed.
+    The ladder is climbed during a single placement pass: parts due earlier keep the blocks
+    they got at a stricter level and only the part that no longer fits (and those after it)
+    use the relaxed capacity. check_feasibility's cumulative check picks the starting level.
     """
 
     print("===  prefs ===")
@@ -81,16 +265,7 @@ def schedule(tasks: List[TaskWithParts], prefs: Preferences, today: Optional[dat
 
 
     # timezone adjustment
-    if today is None:
-        import pytz
-        from django.utils import timezone as django_timezone
-        try:
-            user_tz = pytz.timezone(user_timezone)
-            today_local = django_timezone.now().astimezone(user_tz).date()
-        except Exception:
-            # invalid tz->utc
-            today_local = date.today()
-        today = today_local
+    today = _resolve_today(today, user_timezone)
 
     if not tasks:
         return {"ok": False, "message": "No course tasks found — cannot generate a plan.", "weekStart": week_monday(today).isoformat()}
@@ -126,177 +301,124 @@ def schedule(tasks: List[TaskWithParts], prefs: Preferences, today: Optional[dat
     #start = week_monday(smart_start)
     start = today # start from now
     end = week_monday(latest_due) + timedelta(days=6)
-    
-  
 
-    def build_days(daily_cap_min: int, weekly_days: int, avoid_set: set[int]) -> List[Dict[str, Any]]:
+    levels = _relaxation_levels(prefs)
+    level_capacities = [
+        _build_day_capacities(start, end, today, daily, weekly, avoid)
+        for _, daily, weekly, avoid in levels
+    ]
+    tasks_sorted = sorted(tasks, key=lambda t: iso_to_date(t.dueDate))
 
-        days: List[Dict[str, Any]] = []
-        #If the start date is the number of days to avoid, start from the next day
-        d = start
-        if d.weekday() in avoid_set:
-            d = d + timedelta(days=1)
-        
-        while d <= end:
-            week_start = week_monday(d)
-            is_first_week = (week_start == week_monday(start))
-            start_wd = start.weekday() if is_first_week else 0
-
-            allowed_weekdays = set(_allowed_weekdays_for_week(weekly_days, avoid_set, start_wd))
-
-            for offset in range(7):
-                cur = week_start + timedelta(days=offset)
-                if cur > end:
-                    break
-                cap = daily_cap_min if (cur.weekday() in allowed_weekdays and cur >= today) else 0
-                if cur >= d:
-                    days.append({"date": cur.isoformat(), "capacity": cap, "used": 0, "blocks": []})
-            d = week_start + timedelta(days=7)
-        return days
-    
-    def try_place(
-        daily_cap_min: int,
-        weekly_days: int,
-        avoid_set: set[int]
-    ) -> Tuple[bool, List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
-        # return (ok, days, summary, unplacedParts)
-        days = build_days(daily_cap_min, weekly_days, avoid_set)
-        tasks_sorted = sorted(tasks, key=lambda t: iso_to_date(t.dueDate))
-        unplaced: List[Dict[str, Any]] = []
-
-        for t in tasks_sorted:
-            due = iso_to_date(t.dueDate)
-            for p in sorted(t.parts, key=lambda x: x.order):
-                remain = int(max(0, p.minutes))
-                # Distributed arrangement: Calculate the number of available days and evenly distribute them
-                available_days = [
-                                    day for day in days
-                                    if (today <= datetime.fromisoformat(day["date"]).date() <= due)
-                                    and day["capacity"] > 0
-                                ]
-                if not available_days:
-                    # There are no available days, just mark as not scheduled
-                    continue
-                
-              #Each part as a whole (60-90 minutes) is dispersed to different days
-                part_minutes = int(p.minutes)
-                if part_minutes <= 0:
-                    continue
-                
-                # Find the best day to place this complete part
-                best_day = None
-                for day in available_days:
-                    free = day["capacity"] - day["used"]
-                    if free >= part_minutes:
-                        best_day = day
-                        break
-                
-                if best_day:
-                    # Find a suitable day and place the entire part
-                    best_day["blocks"].append({
-                        "taskId": t.taskId,
-                        "partId": p.partId,
-                        "title": p.title,
-                        "minutes": part_minutes,
-                        "reason": "within-preference" if daily_cap_min < (10*60) else "max10h"
-                    })
-                    best_day["used"] += part_minutes
-                    remain = 0 
-                else:
-                    #Unable to find a day that can accommodate the entire part, try splitting it into 30-60 minute blocks and arranging them separately
-                    while remain >= 30 and available_days:
-                       
-                        chunk = 60 if (remain >= 60 and (remain - 60 == 0 or remain - 60 >= 30)) else 30
-                        
-                        #Find a day that can accommodate this chunk
-                        target_day = None
-                        for day in available_days:
-                            free = day["capacity"] - day["used"]
-                            if free >= chunk:
-                                target_day = day
-                                break
-                        
-                        if target_day:
-                            title = p.title if chunk == int(p.minutes) else f"{p.title} (cont.)"
-                            target_day["blocks"].append({
-                                "taskId": t.taskId,
-                                "partId": p.partId,
-                                "title": title,
-                                "minutes": chunk,
-                                "reason": "within-preference" if daily_cap_min < (10*60) else "max10h"
-                            })
-                            target_day["used"] += chunk
-                            remain -= chunk
-                            
-                            # If the day is used up, remove it from the list of available days
-                            if target_day["capacity"] - target_day["used"] < 30:
-                                available_days.remove(target_day)
-                        else:
-                            # No days can accommodate it, break out of the cycle
-                            break
-
-                if remain > 0:
-                    unplaced.append({
-                        "taskId": t.taskId,
-                        "partId": p.partId,
-                        "title": p.title,
-                        "minutes_remaining": int(remain),
-                        "dueDate": t.dueDate
-                    })
-
-        summary: List[Dict[str, Any]] = []  #Delay unified generation (to avoid duplication), generate once below
-
-        # Unified generation of summary (consistent with the original implementation for easy front-end rendering)
-        tasks_sorted = sorted(tasks, key=lambda t: iso_to_date(t.dueDate))
-        summary = [{
-            "taskId": t.taskId,
-            "taskTitle": t.taskTitle,
-            "totalMinutes": sum(int(px.minutes) for px in t.parts),
-            "parts": compute_part_percentages(t)
-        } for t in tasks_sorted]
-
-        ok = len(unplaced) == 0
-        out_days = [{"date": day["date"], "blocks": day["blocks"]} for day in days]
-        return ok, out_days, summary, unplaced
-
-    # Rapid Total Feasibility Estimation (Coarse grained): Total minutes available within the statistical planning interval vs. total minutes required
-    base_daily = int(prefs.daily_hour_cap) * 60
-    base_weekly_days = max(1, min(7, int(prefs.weekly_study_days)))
-    #base_avoid = set(prefs.avoid_days or [])
-    base_avoid = _normalize_avoid_days(prefs.avoid_days)
-    
-    total_need = sum(int(max(0, p.minutes)) for t in tasks for p in t.parts)
-    #List of available days (excluding due, only up to the latest due Sunday globally), with stricter due constraints assigned to try_place
-    base_days = build_days(base_daily, base_weekly_days, base_avoid)
-    total_avail = sum((d["capacity"]) for d in base_days)
+    # Exact cumulative check first: skip levels that cannot work and give up early if none can
+    level, unplaced = _min_feasible_level(tasks_sorted, start, level_capacities)
+    if level < 0:
+        return {
+            "ok": False,
+            "relaxation": "impossible",
+            "message": "Insufficient time — cannot generate plan.",
+            "unplaceableParts": unplaced,
+            "weekStart": start.isoformat()
+        }
 
+    # Single placement pass: tasks go in due order at the current level; a part that does
+    # not fit escalates the level in place and is retried, earlier parts are never re-placed.
+    index = _DayCapacityIndex(level_capacities[level])
+    blocks: List[List[Dict[str, Any]]] = [[] for _ in level_capacities[level]]
 
-    ok0, days0, summary0, unplaced0 = try_place(base_daily, base_weekly_days, base_avoid)
-    if ok0:
-        return {"ok": True, "relaxation": "none", "weekStart": start.isoformat(), "days": days0, "taskSummary": summary0}
+    def place_part(t: TaskWithParts, p, due_idx: int) -> Tuple[int, List[int]]:
+        """Place one part at the current level; return (minutes not placed, day indexes used)."""
+        reason = "within-preference" if levels[level][1] < (10*60) else "max10h"
+        part_minutes = int(p.minutes)
 
+        # Find the first day that can hold this complete part
+        best_idx = index.first_fit(due_idx, part_minutes)
+        if best_idx >= 0:
+            blocks[best_idx].append({
+                "taskId": t.taskId,
+                "partId": p.partId,
+                "title": p.title,
+                "minutes": part_minutes,
+                "reason": reason
+            })
+            index.consume(best_idx, part_minutes)
+            return 0, [best_idx]
 
-    non_avoid = set(i for i in range(7) if i not in base_avoid)
-    step1_weekly = min(7, max(base_weekly_days, len(non_avoid)))
-    ok1, days1, summary1, unplaced1 = try_place(base_daily, step1_weekly, base_avoid)
-    if ok1:
-        return {"ok": True, "relaxation": "expand-days-per-week", "weekStart": start.isoformat(), "days": days1, "taskSummary": summary1}
+        #Unable to find a day that can accommodate the entire part, try splitting it into 30-60 minute blocks and arranging them separately
+        remain = part_minutes
+        used: List[int] = []
+        while remain >= 30:
+            chunk = 60 if (remain >= 60 and (remain - 60 == 0 or remain - 60 >= 30)) else 30
+
+            #Find a day that can accommodate this chunk
+            target_idx = index.first_fit(due_idx, chunk)
+            if target_idx < 0:
+                # No days can accommodate it, break out of the cycle
+                break
+
+            title = p.title if chunk == part_minutes else f"{p.title} (cont.)"
+            blocks[target_idx].append({
+                "taskId": t.taskId,
+                "partId": p.partId,
+                "title": title,
+                "minutes": chunk,
+                "reason": reason
+            })
+            index.consume(target_idx, chunk)
+            used.append(target_idx)
+            remain -= chunk
+        return remain, used
+
+    def undo_part(used: List[int]) -> None:
+        for idx in used:
+            block = blocks[idx].pop()
+            index.consume(idx, -block["minutes"])
 
+    for t in tasks_sorted:
+        # Last day index the parts of this task may use
+        due_idx = min((iso_to_date(t.dueDate) - start).days, len(blocks) - 1)
+        for p in sorted(t.parts, key=lambda x: x.order):
+            if due_idx < 0 or int(p.minutes) <= 0:
+                # Already past due (nothing to place into) or nothing to place
+                continue
 
-    ok2, days2, summary2, unplaced2 = try_place(base_daily, 7, set())
-    if ok2:
-        return {"ok": True, "relaxation": "allow-avoid-days", "weekStart": start.isoformat(), "days": days2, "taskSummary": summary2}
+            remain, used = place_part(t, p, due_idx)
+            while remain > 0 and level < len(levels) - 1:
+                # Relax one step: roll back this part, open up the extra capacity, retry
+                undo_part(used)
+                level += 1
+                index.grow([new - old for new, old in zip(level_capacities[level], level_capacities[level - 1])])
+                remain, used = place_part(t, p, due_idx)
 
+            if remain > 0:
+                unplaced.append({
+                    "taskId": t.taskId,
+                    "partId": p.partId,
+                    "title": p.title,
+                    "minutes_remaining": int(remain),
+                    "dueDate": t.dueDate
+                })
 
-    ok3, days3, summary3, unplaced3 = try_place(10*60, 7, set())
-    if ok3:
-        return {"ok": True, "relaxation": "max10h", "weekStart": start.isoformat(), "days": days3, "taskSummary": summary3}
+    if unplaced:
+        return {
+            "ok": False,
+            "relaxation": "impossible",
+            "message": "Insufficient time — cannot generate plan.",
+            "unplaceableParts": unplaced,
+            "weekStart": start.isoformat()
+        }
 
+    # Unified generation of summary (consistent with the original implementation for easy front-end rendering)
+    summary = [{
+        "taskId": t.taskId,
+        "taskTitle": t.taskTitle,
+        "totalMinutes": sum(int(px.minutes) for px in t.parts),
+        "parts": compute_part_percentages(t)
+    } for t in tasks_sorted]
 
-    return {
-        "ok": False,
-        "relaxation": "impossible",
-        "message": "Insufficient time — cannot generate plan.",
-        "unplaceableParts": unplaced3,
-        "weekStart": start.isoformat()
-    }
\ No newline at end of file
+    #If the start date is the number of days to avoid at the final level, the plan starts from the next day
+    first = 1 if start.weekday() in levels[level][3] else 0
+    out_days = [
+        {"date": (start + timedelta(days=i)).isoformat(), "blocks": blocks[i]}
+        for i in range(first, len(blocks))
+    ]
+    return {"ok": True, "relaxation": levels[level][0], "weekStart": start.isoformat(), "days": out_days, "taskSummary": summary}
@@ -2,47 +2,28 @@
 AI Question Generator - 使用 Gemini AI 生成题目
 Django集成版本 - 仅包含核心生成逻辑，所有数据通过API传输
 """
-import os
 import json
 import re
 from typing import List, Dict
-from dotenv import load_dotenv
-import google.generativeai as genai
-
-
-from pathlib import Path
-BASE_DIR = Path(__file__).resolve().parent.parent
-load_dotenv(BASE_DIR / '.env')
-
-
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+from ai_module import gemini_client
 
 
 class QuestionGenerator:
 
-    
-    def __init__(self, api_key: str = None):
+    # Shared model settings; the client itself is created once per process by gemini_client
+    GENERATION_CONFIG = {
+        'temperature': 0.7,
+        'top_p': 0.9,
+        'top_k': 40,
+    }
 
-        self.api_key = api_key or GEMINI_API_KEY
-        if not self.api_key:
-            raise ValueError("GEMINI_API_KEY not found, please set it in the environment variable")
-        
+    def __init__(self):
 
-        genai.configure(api_key=self.api_key)
+        if not gemini_client.has_key():
+            raise ValueError("GEMINI_API_KEY not found, please set it in the environment variable")
 
-        self.model = genai.GenerativeModel(
-            'gemini-2.5-flash',
-            generation_config={
-                'temperature': 0.7,
-                'top_p': 0.9,
-                'top_k': 40,
-            }
-        )
-        
         # Configuration request timeout
-        self.request_options = {
-            'timeout': 120  # 120s
-        }
+        self.timeout = 120  # 120s
     
     def generate_questions(
         self, 
@@ -71,18 +52,38 @@ class QuestionGenerator:
         prompt = self._build_prompt(topic, difficulty, sample_questions, mcq_count, short_answer_count)
         
         # use Gemini API 
-        response = self.model.generate_content(
+        response_text = gemini_client.generate(
             prompt,
-            request_options=self.request_options
+            self.GENERATION_CONFIG,
+            timeout=self.timeout
         )
         
+        return self._valid_questions(response_text, topic, difficulty)
+    
+    async def agenerate_questions(
+        self, 
+        topic: str, 
+        difficulty: str,
+        sample_questions: List[Dict],
+        count: int = 5,
+        mcq_count: int = 3,
+        short_answer_count: int = 2
+    ) -> List[Dict]:
+        """generate_questions() for async views; awaits Gemini instead of blocking a thread"""
+        prompt = self._build_prompt(topic, difficulty, sample_questions, mcq_count, short_answer_count)
+        response_text = await gemini_client.agenerate(
+            prompt,
+            self.GENERATION_CONFIG,
+            timeout=self.timeout
+        )
+        return self._valid_questions(response_text, topic, difficulty)
+    
+    def _valid_questions(self, response_text: str, topic: str, difficulty: str) -> List[Dict]:
         # Analyze response
-        questions = self._parse_response(response.text, topic, difficulty)
+        questions = self._parse_response(response_text, topic, difficulty)
         
         # Verification Question
-        valid_questions = [q for q in questions if self._validate_question(q)]
-        
-        return valid_questions
+        return [q for q in questions if self._validate_question(q)]
     
     def _validate_question(self, question: Dict) -> bool:
         return 'type' in question and 'question' in question
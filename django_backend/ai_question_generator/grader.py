@@ -2,37 +2,42 @@
 AI Auto Trader - Use Gemini AI for automatic scoring
 Django integrated version - only includes core rating logic, all data is transmitted through API
 """
-import os
+import asyncio
+import contextvars
 import json
+import os
 import re
-from typing import List, Dict
-import google.generativeai as genai
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Dict, Optional, Tuple
+from asgiref.sync import sync_to_async
+from ai_module import gemini_client
+from . import grading_cache
 
-
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+# Short answers graded at once per submission
+GRADING_WORKERS = int(os.getenv("GRADING_WORKERS", "4"))
+# Seconds allowed per short answer; a batch of n answers gets n times this
+GRADING_TIMEOUT = float(os.getenv("GRADING_TIMEOUT", "30"))
+# Short answers per grading prompt; above 1 they are graded in batches that return a JSON array
+GRADING_BATCH_SIZE = int(os.getenv("GRADING_BATCH_SIZE", "1"))
+# Upper bound on all grading for one submission; answers not graded by then are left pending
+GRADING_DEADLINE = float(os.getenv("GRADING_DEADLINE", "90"))
+# Part of every grading_cache key; bump it whenever the grading prompt or rubric changes
+GRADING_RUBRIC_VERSION = "1"
 
 
 class AutoGrader:
 
-    
-    def __init__(self, api_key: str = None):
+    # Using tested and available models, configure generation parameters to improve consistency
+    GENERATION_CONFIG = {
+        'temperature': 0.1,
+        'top_p': 0.8,
+        'top_k': 10,
+    }
 
-        self.api_key = api_key or GEMINI_API_KEY
-        if not self.api_key:
+    def __init__(self):
+
+        if not gemini_client.has_key():
             raise ValueError("GEMINI_API_KEY not found, please set it in the environment variable")
-        
-        # use Gemini
-        genai.configure(api_key=self.api_key)
-        
-        # Using tested and available models, configure generation parameters to improve consistency
-        self.model = genai.GenerativeModel(
-            'gemini-2.5-flash',
-            generation_config={
-                'temperature': 0.1,
-                'top_p': 0.8,
-                'top_k': 10,
-            }
-        )
     
     def grade_mcq(self, question: Dict, student_answer: str) -> Dict:
         """
@@ -87,33 +92,59 @@ class AutoGrader:
         
         try:
             # use Gemini API
-            response = self.model.generate_content(prompt)
+            response_text = gemini_client.generate(prompt, self.GENERATION_CONFIG, timeout=GRADING_TIMEOUT)
             
             # analyze solution
-            result = self._parse_grading_response(response.text, question, student_answer)
-            
-            return result
+            return self._parse_grading_response(response_text, question, student_answer)
             
+        except (gemini_client.CircuitOpenError, TimeoutError):
+            return self._pending_result(question, student_answer)
         except Exception as e:
-
-            return {
-                'question_id': question.get('id'),
-                'type': 'short_answer',
-                'student_answer': student_answer,
-                'score': 0,
-                'max_score': 10,
-                'feedback': f'Grading failed: {str(e)}',
-                'breakdown': {}
-            }
+            return self._failed_result(question, student_answer, e)
     
-    def _build_grading_prompt(self, question: Dict, student_answer: str) -> str:
-        
-        max_score = 10
-        key_points = question.get('grading_points', [])
-        key_points_text = "\n".join(f"- {p}" for p in key_points)
-        sample_answer = question.get('sample_answer', 'Not provided')
-        
-        prompt = f"""You are a CONSISTENT and OBJECTIVE grader for educational assessments. You must grade deterministically - identical answers should always receive identical scores.
+    async def agrade_short_answer(self, question: Dict, student_answer: str, rubric: Dict = None) -> Dict:
+        """grade_short_answer() for async views; awaits Gemini instead of blocking a thread"""
+        prompt = self._build_grading_prompt(question, student_answer)
+        try:
+            response_text = await gemini_client.agenerate(prompt, self.GENERATION_CONFIG, timeout=GRADING_TIMEOUT)
+            return self._parse_grading_response(response_text, question, student_answer)
+        except (gemini_client.CircuitOpenError, TimeoutError):
+            return self._pending_result(question, student_answer)
+        except Exception as e:
+            return self._failed_result(question, student_answer, e)
+    
+    def _pending_result(self, question: Dict, student_answer: str) -> Dict:
+        # Gemini is down or too slow: queue the answer for grade_pending_answers instead of failing it
+        return {
+            'question_id': question.get('id'),
+            'type': 'short_answer',
+            'student_answer': student_answer,
+            'score': 0,
+            'max_score': 10,
+            'status': 'pending',
+            'feedback': 'AI grading is temporarily unavailable. Your answer has been saved and will be graded shortly.',
+            'breakdown': {}
+        }
+    
+    def _queued_result(self, question: Dict, student_answer: str) -> Dict:
+        # Background mode: placeholder until a grading_queue worker grades the answer
+        return dict(self._pending_result(question, student_answer),
+                    feedback='Your answer has been received and is being graded.')
+    
+    def _failed_result(self, question: Dict, student_answer: str, error: Exception) -> Dict:
+        return {
+            'question_id': question.get('id'),
+            'type': 'short_answer',
+            'student_answer': student_answer,
+            'score': 0,
+            'max_score': 10,
+            'status': 'failed',
+            'feedback': f'Grading failed: {str(error)}',
+            'breakdown': {}
+        }
+    
+    # Prompt pieces shared by the single-answer and batched grading prompts
+    _PROMPT_INTRO = """You are a CONSISTENT and OBJECTIVE grader for educational assessments. You must grade deterministically - identical answers should always receive identical scores.
 
 **CRITICAL GRADING RULES**:
 1. Use the detailed rubric below to assign scores (0-4 for each criterion)
@@ -124,18 +155,8 @@ class AutoGrader:
 
 ═══════════════════════════════════════════════════════════
 
-**Question**: {question.get('question')}
-
-**Reference Answer**: {sample_answer}
-
-**Required Key Points**:
-{key_points_text}
-
-**Student Answer**: {student_answer}
-
-═══════════════════════════════════════════════════════════
-
-**DETAILED GRADING RUBRIC**:
+"""
+    _PROMPT_RUBRIC = """**DETAILED GRADING RUBRIC**:
 
 **Correctness (0-4 points)**:
 - 0: Incorrect - The answer is fundamentally wrong or completely off-topic, with no meaningful overlap with the correct concepts.
@@ -169,20 +190,17 @@ Step 4: Identify specific gaps or errors in the student's answer
 Step 5: Generate a personalized HINT that addresses the student's specific weaknesses without giving away the full answer
 Step 6: Generate a SOLUTION that explains what the student missed and how to improve
 
-**OUTPUT FORMAT** (MUST be valid JSON, no extra text):
-{{
-  "breakdown": {{
+"""
+    _PROMPT_RESULT_FIELDS = '''  "breakdown": {
     "Correctness": <0-4>,
     "Completeness": <0-4>,
     "Clarity": <0-2>
-  }},
+  },
   "total_score": <sum_of_above>,
   "feedback": "Detailed feedback explaining the score with specific references to what was correct/incorrect/missing",
   "hint": "Personalized hint based on student's specific mistakes (guide them without revealing the answer)",
-  "solution": "Step-by-step explanation of what the student should have included and why"
-}}
-
-**HINT GENERATION GUIDELINES**:
+  "solution": "Step-by-step explanation of what the student should have included and why"'''
+    _PROMPT_GUIDELINES = """**HINT GENERATION GUIDELINES**:
 - If student got 0-2 points: Provide fundamental concepts they need to review
 - If student got 3-5 points: Point to specific missing key points
 - If student got 6-8 points: Suggest refinements and additional details
@@ -200,13 +218,54 @@ Step 6: Generate a SOLUTION that explains what the student missed and how to imp
 - Completeness: 0, 1, 2, 3, or 4
 - Clarity: 0, 1, or 2
 - total_score MUST equal sum of breakdown scores
-- total_score MUST NOT exceed {max_score}
-- Return ONLY the JSON object, nothing else
-- Be CONSISTENT and DETERMINISTIC
+- total_score MUST NOT exceed 10
+"""
+    
+    def _question_block(self, question: Dict, student_answer: str, heading: str = "") -> str:
+        key_points = question.get('grading_points', [])
+        key_points_text = "\n".join(f"- {p}" for p in key_points)
+        sample_answer = question.get('sample_answer', 'Not provided')
+        return f"""{heading}**Question**: {question.get('question')}
+
+**Reference Answer**: {sample_answer}
 
-Begin grading:"""
+**Required Key Points**:
+{key_points_text}
+
+**Student Answer**: {student_answer}
+
+═══════════════════════════════════════════════════════════
+
+"""
+    
+    def _build_grading_prompt(self, question: Dict, student_answer: str) -> str:
         
-        return prompt
+        return (
+            self._PROMPT_INTRO
+            + self._question_block(question, student_answer)
+            + self._PROMPT_RUBRIC
+            + "**OUTPUT FORMAT** (MUST be valid JSON, no extra text):\n{\n" + self._PROMPT_RESULT_FIELDS + "\n}\n\n"
+            + self._PROMPT_GUIDELINES
+            + "- Return ONLY the JSON object, nothing else\n- Be CONSISTENT and DETERMINISTIC\n\nBegin grading:"
+        )
+    
+    def _build_batch_grading_prompt(self, items: List[Tuple[Dict, str]]) -> str:
+        """One prompt grading several (question, answer) pairs; the model returns a JSON array"""
+        blocks = "".join(
+            self._question_block(question, answer, heading=f"### Item {n}\n\n")
+            for n, (question, answer) in enumerate(items, 1)
+        )
+        return (
+            self._PROMPT_INTRO
+            + f"There are {len(items)} items below. Grade each one independently with the same rubric.\n\n"
+            + blocks
+            + self._PROMPT_RUBRIC
+            + "**OUTPUT FORMAT** (MUST be valid JSON, no extra text): a JSON array with one object per item, in item order:\n"
+            + "[\n{\n  \"item\": <item number>,\n" + self._PROMPT_RESULT_FIELDS + "\n}\n]\n\n"
+            + self._PROMPT_GUIDELINES
+            + f"- The array MUST contain exactly {len(items)} objects\n"
+            + "- Return ONLY the JSON array, nothing else\n- Be CONSISTENT and DETERMINISTIC\n\nBegin grading:"
+        )
     
     def _parse_grading_response(self, response_text: str, question: Dict, student_answer: str) -> Dict:
 
@@ -219,8 +278,9 @@ Begin grading:"""
                 cleaned = re.sub(r'^```(?:json)?[\s\n]*', '', cleaned)
                 cleaned = re.sub(r'[\s\n]*```$', '', cleaned)
         
-        grading_result = json.loads(cleaned)
-        
+        return self._graded_result(json.loads(cleaned), question, student_answer)
+    
+    def _graded_result(self, grading_result: Dict, question: Dict, student_answer: str) -> Dict:
         return {
             'question_id': question.get('id'),
             'type': 'short_answer',
@@ -233,43 +293,188 @@ Begin grading:"""
             'solution': grading_result.get('solution', '')
         }
     
-    def grade_all(self, questions: List[Dict], student_answers: Dict, student_id: str = 'unknown') -> Dict:
+    def grade_all(self, questions: List[Dict], student_answers: Dict, student_id: str = 'unknown',
+                  batch_size: Optional[int] = None) -> Dict:
         """
-        Rate all questions
+        Rate all questions. MCQs are graded inline; short answers are sent to Gemini concurrently
+        (at most GRADING_WORKERS at a time, batch_size answers per prompt). Results keep question
+        order, and answers not graded within GRADING_DEADLINE are returned as pending.
         
         Args:
         Questions: List of Questions
         Student_answers: Student Answer Dictionary {question_id: answer}
         Student_id: Student ID
+        Batch_size: Short answers per grading prompt (default GRADING_BATCH_SIZE)
                 
         Returns:
         Complete rating results
         """
-        results = []
+        results, batches, repeats = self._grade_inline(questions, student_answers, batch_size)
         
-        for q in questions:
-            qid = q.get('id')
-            student_ans = student_answers.get(str(qid), '')
+        if batches:
+            executor = ThreadPoolExecutor(max_workers=max(1, min(GRADING_WORKERS, len(batches))))
+            with gemini_client.deadline(GRADING_DEADLINE):
+                # Each worker runs in a copy of this context so it sees the deadline
+                futures = [executor.submit(contextvars.copy_context().run, self._grade_batch, batch)
+                           for batch in batches]
+            done, _ = wait(futures, timeout=GRADING_DEADLINE)
+            # Do not block on stragglers; their answers are regraded by grade_pending_answers
+            executor.shutdown(wait=False, cancel_futures=True)
             
+            for batch, future in zip(batches, futures):
+                if future in done and future.exception() is None:
+                    graded = future.result()
+                else:
+                    print(f"[GRADER] {len(batch)} short answer(s) not graded in time, leaving them pending")
+                    graded = [self._pending_result(q, ans) for _, q, ans in batch]
+                for (i, _, _), result in zip(batch, graded):
+                    results[i] = result
+        
+        self._remember(results, batches, repeats)
+        return self._summarize(results, student_id)
+    
+    async def agrade_all(self, questions: List[Dict], student_answers: Dict, student_id: str = 'unknown',
+                         batch_size: Optional[int] = None) -> Dict:
+        """grade_all() for async views: short answers are awaited concurrently under a semaphore"""
+        results, batches, repeats = await sync_to_async(self._grade_inline)(questions, student_answers, batch_size)
+        semaphore = asyncio.Semaphore(max(1, GRADING_WORKERS))
+        
+        async def grade(batch):
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(self._agrade_batch(batch), timeout=GRADING_TIMEOUT * len(batch))
+                except asyncio.TimeoutError:
+                    print(f"[GRADER] {len(batch)} short answer(s) not graded in time, leaving them pending")
+                    return [self._pending_result(q, ans) for _, q, ans in batch]
+        
+        with gemini_client.deadline(GRADING_DEADLINE):
+            graded_batches = await asyncio.gather(*(grade(batch) for batch in batches))
+        for batch, graded in zip(batches, graded_batches):
+            for (i, _, _), result in zip(batch, graded):
+                results[i] = result
+        await sync_to_async(self._remember)(results, batches, repeats)
+        return self._summarize(results, student_id)
+    
+    def grade_without_ai(self, questions: List[Dict], student_answers: Dict, student_id: str = 'unknown') -> Dict:
+        """grade_all() without the Gemini calls: short answers not in the grading cache get a pending placeholder to be queued"""
+        results, batches, repeats = self._grade_inline(questions, student_answers, batch_size=None)
+        for i, q, ans in [item for batch in batches for item in batch] + [(i, q, ans) for i, q, ans, _ in repeats]:
+            results[i] = self._queued_result(q, ans)
+        return self._summarize(results, student_id)
+    
+    def _grade_inline(self, questions: List[Dict], student_answers: Dict, batch_size: Optional[int]) \
+            -> Tuple[List[Optional[Dict]], List[List[Tuple[int, Dict, str]]], List[Tuple[int, Dict, str, int]]]:
+        """
+        Grade unanswered questions, MCQs and short answers found in the grading cache. Return the
+        results so far, the short answers left (batched), and answers repeating one of those as
+        (position, question, answer, position of the first one) so they are graded only once.
+        """
+        results: List[Optional[Dict]] = [None] * len(questions)
+        ungraded = []
+        for i, q in enumerate(questions):
+            student_ans = student_answers.get(str(q.get('id')), '')
             if not student_ans:
-                results.append({
-                    'question_id': qid,
-                    'type': q.get('type'),
-                    'student_answer': '',
-                    'score': 0,
-                    'max_score': 10, 
-                    'feedback': 'No answer provided'
-                })
-                continue
-            
-            # Score based on question type
-            if q.get('type') == 'mcq':
-                result = self.grade_mcq(q, student_ans)
+                results[i] = self._unanswered_result(q)
+            elif q.get('type') == 'mcq':
+                results[i] = self.grade_mcq(q, student_ans)
             else:
-                result = self.grade_short_answer(q, student_ans)
-            
-            results.append(result)
+                ungraded.append((i, q, student_ans, self._cache_key(q, student_ans)))
+        
+        cached = grading_cache.get_many(key for _, _, _, key in ungraded)
+        short_answers, repeats, first = [], [], {}
+        for i, q, student_ans, key in ungraded:
+            if key in cached:
+                results[i] = self._result_for(cached[key], q, student_ans)
+            elif key in first:
+                repeats.append((i, q, student_ans, first[key]))
+            else:
+                first[key] = i
+                short_answers.append((i, q, student_ans))
         
+        size = max(1, GRADING_BATCH_SIZE if batch_size is None else batch_size)
+        return results, [short_answers[k:k + size] for k in range(0, len(short_answers), size)], repeats
+    
+    def _cache_key(self, question: Dict, student_answer: str) -> str:
+        return grading_cache.make_key(question, student_answer, GRADING_RUBRIC_VERSION, gemini_client.DEFAULT_MODEL)
+    
+    def _result_for(self, grade: Dict, question: Dict, student_answer: str) -> Dict:
+        """A short-answer result for this question and answer carrying another result's grade"""
+        result = {'question_id': question.get('id'), 'type': 'short_answer', 'student_answer': student_answer}
+        result.update((k, v) for k, v in grade.items() if k not in result)
+        return result
+    
+    def _remember(self, results: List[Dict], batches: List[List[Tuple[int, Dict, str]]],
+                  repeats: List[Tuple[int, Dict, str, int]]) -> None:
+        """Store the new grades in the grading cache and give repeated answers the same grade"""
+        grading_cache.put_many({
+            self._cache_key(q, ans): results[i]
+            for batch in batches for i, q, ans in batch
+            if 'status' not in results[i]
+        })
+        for i, q, ans, first in repeats:
+            results[i] = self._result_for(results[first], q, ans)
+    
+    def _grade_batch(self, batch: List[Tuple[int, Dict, str]]) -> List[Dict]:
+        if len(batch) == 1:
+            _, q, ans = batch[0]
+            return [self.grade_short_answer(q, ans)]
+        prompt = self._build_batch_grading_prompt([(q, ans) for _, q, ans in batch])
+        try:
+            response_text = gemini_client.generate(prompt, self.GENERATION_CONFIG, timeout=GRADING_TIMEOUT * len(batch))
+        except gemini_client.CircuitOpenError:
+            return [self._pending_result(q, ans) for _, q, ans in batch]
+        except Exception as e:
+            print(f"[GRADER] batch grading failed ({e}), grading answers one by one")
+            response_text = None
+        graded = self._parse_batch_response(response_text, batch) if response_text else {}
+        # Anything the batch did not grade cleanly is graded on its own
+        return [graded.get(n) or self.grade_short_answer(q, ans) for n, (_, q, ans) in enumerate(batch, 1)]
+    
+    async def _agrade_batch(self, batch: List[Tuple[int, Dict, str]]) -> List[Dict]:
+        if len(batch) == 1:
+            _, q, ans = batch[0]
+            return [await self.agrade_short_answer(q, ans)]
+        prompt = self._build_batch_grading_prompt([(q, ans) for _, q, ans in batch])
+        try:
+            response_text = await gemini_client.agenerate(prompt, self.GENERATION_CONFIG, timeout=GRADING_TIMEOUT * len(batch))
+        except gemini_client.CircuitOpenError:
+            return [self._pending_result(q, ans) for _, q, ans in batch]
+        except Exception as e:
+            print(f"[GRADER] batch grading failed ({e}), grading answers one by one")
+            response_text = None
+        graded = self._parse_batch_response(response_text, batch) if response_text else {}
+        return [graded.get(n) or await self.agrade_short_answer(q, ans) for n, (_, q, ans) in enumerate(batch, 1)]
+    
+    def _parse_batch_response(self, response_text: str, batch: List[Tuple[int, Dict, str]]) -> Dict[int, Dict]:
+        """Results by item number (1-based) for the well-formed objects in a batched reply"""
+        try:
+            items = json.loads(gemini_client.strip_code_fence(response_text))
+        except ValueError as e:
+            print(f"[GRADER] batch reply is not valid JSON: {e}")
+            return {}
+        if not isinstance(items, list):
+            return {}
+        graded = {}
+        for position, item in enumerate(items, 1):
+            if not isinstance(item, dict) or 'total_score' not in item:
+                continue
+            n = item.get('item', position)
+            if isinstance(n, int) and 1 <= n <= len(batch) and n not in graded:
+                _, q, ans = batch[n - 1]
+                graded[n] = self._graded_result(item, q, ans)
+        return graded
+    
+    def _unanswered_result(self, question: Dict) -> Dict:
+        return {
+            'question_id': question.get('id'),
+            'type': question.get('type'),
+            'student_answer': '',
+            'score': 0,
+            'max_score': 10, 
+            'feedback': 'No answer provided'
+        }
+    
+    def _summarize(self, results: List[Dict], student_id: str) -> Dict:
         # calculate total mark
         total_score = sum(r.get('score', 0) for r in results)
         total_max = sum(r.get('max_score', 0) for r in results)
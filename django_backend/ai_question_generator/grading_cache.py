@@ -0,0 +1,85 @@
+"""
+Persistent cache of AI short-answer grades, stored in GradingCache. The grading prompt asks for
+identical answers to get identical scores; serving a stored grade makes that hold and saves
+the Gemini call. The key is a sha256 over the question content the prompt is built from
+(question, reference answer, key points), the normalized answer, the rubric version and the
+model name, so editing a question or the rubric gives new keys. Only clean grades are stored,
+never pending or failed ones. Any failure counts as a miss so grading never depends on it.
+"""
+import hashlib
+import json
+import re
+from typing import Any, Dict, Iterable
+
+# Fields of a short-answer result that describe the grade rather than the submission
+GRADE_FIELDS = ('score', 'max_score', 'feedback', 'breakdown', 'hint', 'solution')
+
+
+def _setting(name: str, default: Any) -> Any:
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+def enabled() -> bool:
+    return bool(_setting("GRADING_CACHE_ENABLED", True))
+
+def normalize_answer(answer: str) -> str:
+    """Lower-case, collapse whitespace and trim surrounding punctuation so trivial variants match"""
+    text = re.sub(r"\s+", " ", (answer or "").lower()).strip()
+    return text.strip(".,;:!?~ ")
+
+def make_key(question: Dict, answer: str, rubric_version: str, model_name: str) -> str:
+    payload = json.dumps([
+        rubric_version,
+        model_name,
+        question.get('question', ''),
+        question.get('sample_answer', ''),
+        question.get('grading_points', []),
+        normalize_answer(answer),
+    ])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def get_many(cache_keys: Iterable[str]) -> Dict[str, Dict]:
+    """Stored grades by key for the keys that have one, marking them as recently used"""
+    keys = set(cache_keys)
+    if not keys or not enabled():
+        return {}
+    try:
+        from django.db.models import F
+        from django.utils import timezone
+        from .models import GradingCache
+
+        found = dict(GradingCache.objects.filter(cache_key__in=keys).values_list("cache_key", "payload"))
+        if found:
+            GradingCache.objects.filter(cache_key__in=found).update(last_used_at=timezone.now(), hits=F("hits") + 1)
+        return found
+    except Exception as e:
+        print(f"[GRADING_CACHE] lookup failed, treating as miss: {e}")
+        return {}
+
+def put_many(grades: Dict[str, Dict]) -> None:
+    """Store graded results by key; keys already stored keep their first grade"""
+    if not grades or not enabled():
+        return
+    try:
+        from .models import GradingCache
+
+        GradingCache.objects.bulk_create(
+            [GradingCache(cache_key=key, payload={f: result.get(f) for f in GRADE_FIELDS})
+             for key, result in grades.items()],
+            ignore_conflicts=True,
+        )
+        _evict()
+    except Exception as e:
+        print(f"[GRADING_CACHE] store failed: {e}")
+
+def _evict() -> None:
+    """Drop least-recently-used entries beyond GRADING_CACHE_MAX_ENTRIES"""
+    from .models import GradingCache
+
+    max_entries = int(_setting("GRADING_CACHE_MAX_ENTRIES", 50000))
+    stale_ids = list(GradingCache.objects.order_by("-last_used_at").values_list("id", flat=True)[max_entries:])
+    if stale_ids:
+        GradingCache.objects.filter(id__in=stale_ids).delete()
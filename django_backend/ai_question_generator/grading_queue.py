@@ -0,0 +1,157 @@
+"""
+DB-backed queue of short answers waiting for AI grading; no broker is needed. StudentAnswer
+rows with status 'queued' are the queue: submit_answers in background mode stores short
+answers that way, and answers left pending by the grader (breaker open, timeout) land there
+too. A worker claims rows by switching them to 'grading' with a conditional UPDATE, so the
+in-process thread started after a submission and `manage.py grade_pending_answers --loop`
+never grade the same answer twice. A claim older than GRADING_CLAIM_TIMEOUT is taken to be
+from a worker that died and is claimed again.
+
+After grading, the attempt's RecentPracticeSession is rebuilt so the AI chat sees the grades.
+"""
+import threading
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def _setting(name: str, default: Any) -> Any:
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+
+def claim(limit: int, session_id: Optional[str] = None) -> List[Any]:
+    """Take up to limit queued answers (oldest first) for this worker"""
+    from django.db.models import Q
+    from django.utils import timezone
+    from .models import StudentAnswer
+
+    now = timezone.now()
+    stale = now - timedelta(seconds=float(_setting("GRADING_CLAIM_TIMEOUT", 300)))
+    candidates = StudentAnswer.objects.filter(Q(status='queued') | Q(status='grading', claimed_at__lt=stale))
+    if session_id:
+        candidates = candidates.filter(session_id=session_id)
+
+    claimed = []
+    for answer in candidates.select_related('question').order_by('id')[:limit]:
+        # Only one worker's UPDATE still matches the row as it was read
+        if StudentAnswer.objects.filter(id=answer.id, status=answer.status, claimed_at=answer.claimed_at) \
+                .update(status='grading', claimed_at=now):
+            claimed.append(answer)
+    return claimed
+
+def grade_queued(limit: int = 20, session_id: Optional[str] = None) -> Tuple[int, int]:
+    """Claim and grade up to limit queued answers; return (graded, put back in the queue)"""
+    from django.utils import timezone
+    from .grader import AutoGrader
+    from .models import StudentAnswer
+
+    answers = claim(limit, session_id)
+    if not answers:
+        return 0, 0
+
+    try:
+        questions = []
+        for answer in answers:
+            q_data = answer.question.question_data.copy()
+            # Keyed by answer id: the same question can be queued for several students
+            q_data['id'] = answer.id
+            q_data['type'] = answer.question.question_type
+            questions.append(q_data)
+        grading = AutoGrader().grade_all(questions, {str(a.id): a.answer_text for a in answers})
+    except Exception:
+        StudentAnswer.objects.filter(id__in=[a.id for a in answers]).update(status='queued', claimed_at=None)
+        raise
+
+    graded_at = timezone.now()
+    graded = 0
+    attempts = set()
+    for answer, result in zip(answers, grading['grading_results']):
+        result['question_id'] = answer.question_id
+        if result.get('status') == 'pending':
+            # Gemini is unavailable again; leave it for a later pass
+            StudentAnswer.objects.filter(id=answer.id).update(status='queued', claimed_at=None)
+            continue
+        StudentAnswer.objects.filter(id=answer.id).update(
+            grading_result=result, graded_at=graded_at, status='graded', claimed_at=None
+        )
+        attempts.add((answer.session_id, answer.student_id))
+        graded += 1
+
+    for session, student_id in attempts:
+        refresh_practice_session(session, student_id)
+    return graded, len(answers) - graded
+
+def grade_in_background(session_id: str) -> None:
+    """Grade this session's queued answers on a daemon thread, unless GRADING_IN_PROCESS_WORKER is off"""
+    if not _setting("GRADING_IN_PROCESS_WORKER", True):
+        return
+    threading.Thread(target=_work, args=(session_id,), name=f"grading-{session_id}", daemon=True).start()
+
+def _work(session_id: str) -> None:
+    from django.db import close_old_connections
+
+    try:
+        while True:
+            graded, requeued = grade_queued(session_id=session_id)
+            if requeued or not graded:
+                break
+    except Exception as e:
+        print(f"[GRADING_QUEUE] background grading of {session_id} failed: {e}")
+    finally:
+        close_old_connections()
+
+
+def latest_answers(session_id: str, student_id: str) -> List[Any]:
+    """The student's most recent answer to each question of the session, in question order"""
+    from .models import StudentAnswer
+
+    latest = {}
+    for answer in StudentAnswer.objects.filter(session_id=session_id, student_id=student_id) \
+            .select_related('question').order_by('id'):
+        latest[answer.question_id] = answer
+    return [latest[question_id] for question_id in sorted(latest)]
+
+def practice_question_detail(question, result: Dict) -> Dict:
+    """One question of the RecentPracticeSession test data the AI chat reads"""
+    detail = {
+        "question_text": question.question_data.get('question', 'N/A'),
+        "question_type": result.get('type', 'unknown'),
+        "student_answer": result.get('student_answer', ''),
+        "correct_answer": question.question_data.get('correct_answer', 'N/A'),
+        "score": result.get('score', 0),
+        "max_score": result.get('max_score', 10),
+        "is_correct": result.get('is_correct', False),
+        "feedback": result.get('feedback', '')
+    }
+    if result.get('type') == 'mcq' and 'options' in question.question_data:
+        detail['options'] = question.question_data.get('options', [])
+    return detail
+
+def refresh_practice_session(session_id: str, student_id: str) -> None:
+    """Recompute the RecentPracticeSession the AI chat shows for this attempt"""
+    from ai_chat.models import RecentPracticeSession
+    from ai_chat.student_context import invalidate_student_context
+
+    answers = latest_answers(session_id, student_id)
+    if not answers:
+        return
+    results = [a.grading_result or {} for a in answers]
+    total = sum(r.get('score', 0) for r in results)
+    total_max = sum(r.get('max_score', 0) for r in results)
+    RecentPracticeSession.objects.update_or_create(
+        student_id=student_id,
+        session_id=session_id,
+        defaults={
+            'course_code': answers[0].question.course_code,
+            'topic': answers[0].question.topic,
+            'total_score': total,
+            'max_score': total_max,
+            'percentage': (total / total_max * 100) if total_max > 0 else 0,
+            'questions_count': len(answers),
+            'test_data': {"questions": [practice_question_detail(a.question, r) for a, r in zip(answers, results)]},
+        }
+    )
+    invalidate_student_context(student_id)
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ai_module import gemini_client
+from ai_question_generator import grading_queue
+from ai_question_generator.models import StudentAnswer
+
+
+class Command(BaseCommand):
+    help = "Grade queued short answers (background submissions, or queued while Gemini was unavailable)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep running as the grading queue worker")
+        parser.add_argument('--interval', type=float, default=5, help="Seconds between polls of an empty queue")
+        parser.add_argument('--batch', type=int, default=20, help="Answers claimed per pass")
+
+    def handle(self, *args, **options):
+        if options['loop']:
+            self.stdout.write("Grading worker started")
+            while True:
+                graded, requeued = self._pass(options['batch'])
+                if graded:
+                    self.stdout.write(f"Graded {graded} answers")
+                if requeued or not graded:
+                    time.sleep(options['interval'])
+
+        if not StudentAnswer.objects.filter(status__in=['queued', 'grading']).exists():
+            self.stdout.write("No pending answers")
+            return
+        if not gemini_client.available():
+            self.stdout.write(self.style.WARNING("Gemini is still unavailable, try again later"))
+            return
+
+        graded = 0
+        while True:
+            done, requeued = self._pass(options['batch'])
+            graded += done
+            if requeued or not done:
+                # Nothing left, or the breaker opened again; leave the rest queued
+                break
+
+        remaining = StudentAnswer.objects.filter(status__in=['queued', 'grading']).count()
+        self.stdout.write(self.style.SUCCESS(f"Graded {graded} pending answers, {remaining} still pending"))
+
+    def _pass(self, batch):
+        if not gemini_client.available():
+            return 0, 0
+        try:
+            return grading_queue.grade_queued(limit=batch)
+        except Exception as e:
+            self.stderr.write(f"Grading pass failed: {e}")
+            return 0, 0
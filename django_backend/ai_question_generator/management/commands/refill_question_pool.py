@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ai_module import gemini_client
+from ai_question_generator import question_pool
+
+
+class Command(BaseCommand):
+    help = "Top up the pre-generated question pool for every course topic whose stock is below the watermark"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', help="Only refill this course code")
+        parser.add_argument('--loop', action='store_true', help="Keep running, checking the stock every --interval seconds")
+        parser.add_argument('--interval', type=float, default=300, help="Seconds between stock checks with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            self._refill_all(options['course'])
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
+
+    def _refill_all(self, course_code):
+        from django.conf import settings
+
+        pruned = question_pool.prune()
+        if pruned:
+            self.stdout.write(f"Removed {pruned} questions served to enough students")
+
+        difficulties = getattr(settings, 'QUESTION_POOL_DIFFICULTIES', ('easy', 'medium', 'hard'))
+        added = 0
+        for course, topic in question_pool.pool_topics(course_code):
+            for difficulty in difficulties:
+                if not question_pool.needs_refill(course, topic, difficulty):
+                    continue
+                if not gemini_client.available():
+                    self.stdout.write(self.style.WARNING("Gemini is unavailable, try again later"))
+                    return
+                try:
+                    n = question_pool.refill(course, topic, difficulty)
+                except Exception as e:
+                    self.stderr.write(f"Refilling {course}/{topic}/{difficulty} failed: {e}")
+                    continue
+                if n:
+                    self.stdout.write(f"{course}/{topic}/{difficulty}: added {n} questions")
+                added += n
+        self.stdout.write(self.style.SUCCESS(f"Question pool refilled with {added} questions"))
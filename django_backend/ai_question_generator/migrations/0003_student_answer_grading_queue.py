@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:34
+
+from django.db import migrations, models
+
+
+def queue_pending_answers(apps, schema_editor):
+    # Answers stored as pending while Gemini was down become queue entries
+    StudentAnswer = apps.get_model('ai_question_generator', 'StudentAnswer')
+    StudentAnswer.objects.filter(grading_result__status='pending').update(status='queued')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_question_generator', '0002_remove_samplequestion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentanswer',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='studentanswer',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued for grading'), ('grading', 'Being graded'), ('graded', 'Graded')], db_index=True, default='graded', max_length=10),
+        ),
+        migrations.RunPython(queue_pending_answers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_question_generator', '0004_grading_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PooledQuestion',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('course_code', models.CharField(max_length=16)),
+                ('topic', models.CharField(max_length=255)),
+                ('difficulty', models.CharField(max_length=10)),
+                ('question_type', models.CharField(choices=[('mcq', 'Multiple Choice'), ('short_answer', 'Short Answer')], max_length=20)),
+                ('question_data', models.JSONField()),
+                ('served_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'ai_question_pool',
+                'indexes': [models.Index(fields=['course_code', 'topic', 'difficulty', 'question_type'], name='ai_question_course__436d1f_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PooledQuestionServe',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('student_id', models.CharField(max_length=64)),
+                ('served_at', models.DateTimeField(auto_now_add=True)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='serves', to='ai_question_generator.pooledquestion')),
+            ],
+            options={
+                'db_table': 'ai_question_pool_serve',
+                'unique_together': {('question', 'student_id')},
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
 
 from django.db import models
+from django.utils import timezone
 
 
 class GeneratedQuestion(models.Model):
@@ -54,6 +55,12 @@ class GeneratedQuestion(models.Model):
 
 class StudentAnswer(models.Model):
 
+    STATUS_CHOICES = (
+        ('queued', 'Queued for grading'),
+        ('grading', 'Being graded'),
+        ('graded', 'Graded'),
+    )
+
     id = models.AutoField(primary_key=True)
     session_id = models.CharField(max_length=64, db_index=True)
     student_id = models.CharField(max_length=64, db_index=True)
@@ -83,6 +90,10 @@ class StudentAnswer(models.Model):
 
     submitted_at = models.DateTimeField(auto_now_add=True)
     graded_at = models.DateTimeField(null=True, blank=True)
+
+    # Grading queue state, see grading_queue.py; claimed_at is when a worker took the answer
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='graded', db_index=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         db_table = 'ai_student_answer'
@@ -94,3 +105,75 @@ class StudentAnswer(models.Model):
     
     def __str__(self):
         return f"[{self.student_id}] Session {self.session_id} Q{self.question_id}"
+
+    @staticmethod
+    def status_for(grading_result):
+        # A pending placeholder result means the answer still has to be graded
+        return 'queued' if (grading_result or {}).get('status') == 'pending' else 'graded'
+
+    def save(self, *args, **kwargs):
+        if self.status == 'graded':
+            self.status = self.status_for(self.grading_result)
+        super().save(*args, **kwargs)
+
+
+class GradingCache(models.Model):
+    """
+    AI grade of one (question content, normalized answer) pair, reused for identical answers;
+    see grading_cache.py. payload holds the grade fields of the short-answer result.
+    """
+    id = models.BigAutoField(primary_key=True)
+    cache_key = models.CharField(max_length=64, unique=True)
+    payload = models.JSONField()
+    hits = models.IntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        db_table = 'ai_grading_cache'
+
+    def __str__(self):
+        return f"[{self.cache_key[:12]}] {self.hits} hits"
+
+
+class PooledQuestion(models.Model):
+    """
+    A validated generated question kept in stock for (course_code, topic, difficulty) so practice
+    sets can be served without waiting for Gemini; see question_pool.py. topic is a
+    QuestionKeyword name.
+    """
+    id = models.AutoField(primary_key=True)
+    course_code = models.CharField(max_length=16)
+    topic = models.CharField(max_length=255)
+    difficulty = models.CharField(max_length=10)
+    question_type = models.CharField(max_length=20, choices=GeneratedQuestion.TYPE_CHOICES)
+    question_data = models.JSONField()  # same format as GeneratedQuestion.question_data
+
+    # Students this question has been served to; it leaves the stock at QUESTION_POOL_MAX_SERVES
+    served_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'ai_question_pool'
+        indexes = [
+            models.Index(fields=['course_code', 'topic', 'difficulty', 'question_type']),
+        ]
+
+    def __str__(self):
+        return f"[{self.course_code}] [{self.difficulty}] [{self.question_type}] {self.topic}"
+
+
+class PooledQuestionServe(models.Model):
+    """A pooled question served to a student, so the student is not served it again"""
+    id = models.BigAutoField(primary_key=True)
+    question = models.ForeignKey(PooledQuestion, on_delete=models.CASCADE, related_name='serves')
+    student_id = models.CharField(max_length=64)
+    served_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'ai_question_pool_serve'
+        unique_together = (('question', 'student_id'),)
+
+    def __str__(self):
+        return f"[{self.student_id}] pooled Q{self.question_id}"
@@ -0,0 +1,41 @@
+"""
+Storage of generated practice sessions, shared by the question generation endpoint and the AI
+chat practice flow. A session's questions are written with one bulk INSERT in a transaction
+instead of one INSERT per question, each of which is a network round trip on the remote
+MySQL/TiDB database. MySQL returns no ids from a bulk INSERT, so they are read back with one
+query on the new session id.
+"""
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def persist_generated_session(course_code: str, topic: str, difficulty: str, generated: List[Dict],
+                              question_data: Optional[Callable[[Dict], Dict]] = None) -> Tuple[str, List]:
+    """
+    Store generated questions as a new session; return (session_id, GeneratedQuestion rows in
+    the order given, with ids). question_data maps a generated question to the JSON stored for
+    it, by default the question itself.
+    """
+    from django.db import transaction
+    from .models import GeneratedQuestion
+
+    session_id = str(uuid.uuid4())
+    rows = [
+        GeneratedQuestion(
+            session_id=session_id,
+            course_code=course_code,
+            topic=topic,
+            difficulty=difficulty,
+            question_type=q.get('type'),
+            question_data=question_data(q) if question_data else q,
+        )
+        for q in generated
+    ]
+    with transaction.atomic():
+        GeneratedQuestion.objects.bulk_create(rows)
+        if any(row.id is None for row in rows):
+            # Ids are handed out in insert order within the statement
+            ids = GeneratedQuestion.objects.filter(session_id=session_id).order_by('id').values_list('id', flat=True)
+            for row, row_id in zip(rows, ids):
+                row.id = row_id
+    return session_id, rows
@@ -0,0 +1,231 @@
+"""
+Pre-generated question pool. For every topic (a QuestionKeyword linked to a course's questions)
+and difficulty the pool keeps a stock of validated generated questions of each type, so
+practice sets are served from the database instead of waiting on Gemini for tens of seconds.
+
+take() serves a practice set, never repeating a question for the same student, or returns None
+when the stock cannot cover the whole set; the caller then generates live as before. A question
+leaves the stock after QUESTION_POOL_MAX_SERVES students. `manage.py refill_question_pool`
+tops a (course, topic, difficulty) back up to QUESTION_POOL_TARGET questions per type once its
+stock falls below QUESTION_POOL_LOW_WATERMARK.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+QUESTION_TYPES = ('mcq', 'short_answer')
+
+
+def _setting(name: str, default: Any) -> Any:
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+def enabled() -> bool:
+    return bool(_setting("QUESTION_POOL_ENABLED", True))
+
+def _in_stock(course_code: str, topic: str, difficulty: str):
+    from .models import PooledQuestion
+
+    return PooledQuestion.objects.filter(
+        course_code=course_code,
+        topic__iexact=topic,
+        difficulty=difficulty,
+        served_count__lt=int(_setting("QUESTION_POOL_MAX_SERVES", 50)),
+    )
+
+def stock(course_code: str, topic: str, difficulty: str) -> Dict[str, int]:
+    """Questions in stock by type"""
+    from django.db.models import Count
+
+    counts = dict(_in_stock(course_code, topic, difficulty).values('question_type')
+                  .annotate(n=Count('id')).values_list('question_type', 'n'))
+    return {qtype: counts.get(qtype, 0) for qtype in QUESTION_TYPES}
+
+def take(course_code: str, topic: str, difficulty: str, mcq_count: int, short_answer_count: int,
+         student_id: Optional[str] = None) -> Optional[List[Dict]]:
+    """
+    A practice set from the pool (MCQs first), in the generator's question format, skipping
+    questions already served to student_id; None if the pool cannot fill it.
+    """
+    if not enabled():
+        return None
+    from django.db import transaction
+    from django.db.models import F
+    from .models import PooledQuestion, PooledQuestionServe
+
+    picked = []
+    with transaction.atomic():
+        for qtype, count in (('mcq', mcq_count), ('short_answer', short_answer_count)):
+            if count <= 0:
+                continue
+            candidates = _in_stock(course_code, topic, difficulty).filter(question_type=qtype)
+            if student_id:
+                candidates = candidates.exclude(serves__student_id=student_id)
+            # Least-served first, so the stock wears evenly
+            rows = list(candidates.order_by('served_count', 'id')[:count])
+            if len(rows) < count:
+                print(f"[QUESTION_POOL] miss {course_code}/{topic}/{difficulty}: {len(rows)}/{count} {qtype}")
+                return None
+            picked.extend(rows)
+
+        PooledQuestion.objects.filter(id__in=[q.id for q in picked]).update(served_count=F('served_count') + 1)
+        if student_id:
+            PooledQuestionServe.objects.bulk_create(
+                [PooledQuestionServe(question=q, student_id=student_id) for q in picked],
+                ignore_conflicts=True,
+            )
+    return [dict(q.question_data, type=q.question_type, topic=topic, difficulty=difficulty) for q in picked]
+
+def pool_topics(course_code: Optional[str] = None) -> List[Tuple[str, str]]:
+    """(course_code, keyword name) pairs the pool is kept for"""
+    from courses.models import QuestionKeywordMap
+
+    maps = QuestionKeywordMap.objects.all()
+    if course_code:
+        maps = maps.filter(question__course_code=course_code)
+    return sorted(set(maps.values_list('question__course_code', 'keyword__name')))
+
+def needs_refill(course_code: str, topic: str, difficulty: str) -> bool:
+    low = int(_setting("QUESTION_POOL_LOW_WATERMARK", 4))
+    return any(n < low for n in stock(course_code, topic, difficulty).values())
+
+def refill(course_code: str, topic: str, difficulty: str, generator=None) -> int:
+    """Top the stock up to QUESTION_POOL_TARGET per type if it is below the watermark; return questions added"""
+    if not needs_refill(course_code, topic, difficulty):
+        return 0
+    sample_questions = load_sample_questions(course_code, topic)
+    if not sample_questions:
+        return 0
+    if generator is None:
+        from .generator import QuestionGenerator
+        generator = QuestionGenerator()
+
+    from .models import PooledQuestion
+
+    target = int(_setting("QUESTION_POOL_TARGET", 10))
+    batch = int(_setting("QUESTION_POOL_REFILL_BATCH", 10))
+    added = 0
+    while True:
+        current = stock(course_code, topic, difficulty)
+        wanted = {qtype: max(0, target - current[qtype]) for qtype in QUESTION_TYPES}
+        mcq_count = min(wanted['mcq'], batch)
+        short_answer_count = min(wanted['short_answer'], batch - mcq_count)
+        if not mcq_count and not short_answer_count:
+            return added
+
+        generated = generator.generate_questions(
+            topic=topic,
+            difficulty=difficulty,
+            sample_questions=sample_questions,
+            count=mcq_count + short_answer_count,
+            mcq_count=mcq_count,
+            short_answer_count=short_answer_count
+        )
+        rows = []
+        for q in generated:
+            qtype = q.get('type')
+            if _valid(q) and wanted.get(qtype, 0) > 0:
+                wanted[qtype] -= 1
+                rows.append(PooledQuestion(course_code=course_code, topic=topic, difficulty=difficulty,
+                                           question_type=qtype, question_data=q))
+        if not rows:
+            # The model gave nothing usable; try again on the next run
+            return added
+        PooledQuestion.objects.bulk_create(rows)
+        added += len(rows)
+
+def prune() -> int:
+    """Delete questions that have left the stock; return how many"""
+    from .models import PooledQuestion
+
+    deleted, _ = PooledQuestion.objects.filter(
+        served_count__gte=int(_setting("QUESTION_POOL_MAX_SERVES", 50))
+    ).delete()
+    return deleted
+
+def _valid(question: Dict) -> bool:
+    """Stricter than the generator's check: the question must be answerable and gradable"""
+    if not str(question.get('question') or '').strip():
+        return False
+    if question.get('type') == 'mcq':
+        options = question.get('options') or []
+        return len(options) >= 2 and bool(str(question.get('correct_answer') or '').strip())
+    if question.get('type') == 'short_answer':
+        return bool(str(question.get('sample_answer') or '').strip())
+    return False
+
+
+def load_sample_questions(course_code: str, topic: str) -> List[Dict]:
+    """Sample questions for the generator prompt, in the generator's format ([] when the course has none)"""
+    # Retrieve sample questions from the Question table of courses_admin
+    from django.db import models
+    from courses.models import Question, QuestionChoice, QuestionKeyword, QuestionKeywordMap
+
+    # Firstly, try to search for relevant questions based on the keywords of the topic
+    topic_lower = topic.lower()
+
+    # Method 1: Search through keyword mapping
+    keyword_matches = QuestionKeyword.objects.filter(name__icontains=topic_lower)
+    if keyword_matches.exists():
+        question_ids = QuestionKeywordMap.objects.filter(
+            keyword__in=keyword_matches
+        ).values_list('question_id', flat=True)
+        sample_questions = Question.objects.filter(
+            id__in=question_ids,
+            course_code=course_code
+        ).order_by('-created_at')[:10]
+    else:
+        # Method 2: Fuzzy matching through title and description
+        sample_questions = Question.objects.filter(
+            course_code=course_code
+        ).filter(
+            models.Q(title__icontains=topic) |
+            models.Q(description__icontains=topic) |
+            models.Q(text__icontains=topic)
+        ).order_by('-created_at')[:10]
+
+    # If no relevant questions are found, obtain all questions for the course
+    if not sample_questions.exists():
+        sample_questions = Question.objects.filter(
+            course_code=course_code
+        ).order_by('-created_at')[:10]
+
+    if not sample_questions.exists():
+        return []
+
+    # Convert to the format required by the generator
+    sample_data = []
+    for q in sample_questions:
+        q_data = {
+            'type': q.qtype,
+            'question': q.text,
+            'score': 10
+        }
+
+        if q.qtype == 'mcq':
+            # Get multiple-choice options
+            choices = QuestionChoice.objects.filter(question=q).order_by('order')
+            options = []
+            correct_answer = ''
+
+            for choice in choices:
+                option_text = f"{choice.label or chr(65 + choice.order)}. {choice.content}"
+                options.append(option_text)
+                if choice.is_correct:
+                    correct_answer = choice.label or chr(65 + choice.order)
+
+            q_data.update({
+                'options': options,
+                'correct_answer': correct_answer,
+                'explanation': q.description or f"Correct answer is {correct_answer}"
+            })
+        else:  # short answer
+            q_data.update({
+                'sample_answer': q.short_answer or "Sample answer not available",
+                'grading_points': q.keywords_json or ["Content accuracy", "Clarity", "Completeness"]
+            })
+
+        sample_data.append(q_data)
+
+    return sample_data
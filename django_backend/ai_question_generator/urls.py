@@ -13,5 +13,6 @@ urlpatterns = [
     
     # Student Answering and Scoring
     path('answers/submit', views.submit_answers, name='submit_answers'),
+    path('answers/results/<str:session_id>', views.grading_results, name='grading_results'),
     path('results', views.get_student_results, name='get_student_results'),
 ]
@@ -3,13 +3,15 @@ AI Question Generator & Grader Views
 Provide API interface for question generation and automatic grading
 """
 import json
-import uuid
 from datetime import datetime
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
-from django.db import models
+from django.db import transaction
+from asgiref.sync import sync_to_async
 from dotenv import load_dotenv
 
 
@@ -20,12 +22,14 @@ load_dotenv(BASE_DIR / '.env')
 from .models import GeneratedQuestion, StudentAnswer
 from .generator import QuestionGenerator
 from .grader import AutoGrader
+from . import grading_queue, question_pool
+from .practice_sessions import persist_generated_session
 
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def generate_questions(request):
+async def generate_questions(request):
     """
     AI question generating
     
@@ -36,9 +40,13 @@ def generate_questions(request):
         "difficulty": "medium",
         "count": 5,
         "mcq_count": 3,
-        "short_answer_count": 2
+        "short_answer_count": 2,
+        "student_id": "z1234567"  // optional, pooled questions are not served to a student twice
     }
     
+    Questions come from the pre-generated pool (question_pool.py) when it has enough in stock,
+    otherwise they are generated on the spot.
+    
     Response: {
         "success": true,
         "session_id": "uuid-...",
@@ -70,88 +78,30 @@ def generate_questions(request):
                 'error': 'Missing required fields: course_code, topic'
             }, status=400)
         
-        # Retrieve sample questions from the Question table of courses_admin
-        from courses.models import Question, QuestionChoice, QuestionKeyword, QuestionKeywordMap
-        
-        # Firstly, try to search for relevant questions based on the keywords of the topic
-        topic_lower = topic.lower()
-        
-        # Method 1: Search through keyword mapping
-        keyword_matches = QuestionKeyword.objects.filter(name__icontains=topic_lower)
-        if keyword_matches.exists():
-            question_ids = QuestionKeywordMap.objects.filter(
-                keyword__in=keyword_matches
-            ).values_list('question_id', flat=True)
-            sample_questions = Question.objects.filter(
-                id__in=question_ids,
-                course_code=course_code
-            ).order_by('-created_at')[:10]
-        else:
-            # Method 2: Fuzzy matching through title and description
-            sample_questions = Question.objects.filter(
-                course_code=course_code
-            ).filter(
-                models.Q(title__icontains=topic) | 
-                models.Q(description__icontains=topic) |
-                models.Q(text__icontains=topic)
-            ).order_by('-created_at')[:10]
-        
-        # If no relevant questions are found, obtain all questions for the course
-        if not sample_questions.exists():
-            sample_questions = Question.objects.filter(
-                course_code=course_code
-            ).order_by('-created_at')[:10]  
-        
-        if not sample_questions.exists():
-            return JsonResponse({
-                'success': False,
-                'error': f'No questions found for course {course_code}. Please upload questions through the admin panel first.'
-            }, status=404)
+        # Serve from the pre-generated question pool when it can fill the whole set
+        generated = await sync_to_async(question_pool.take)(
+            course_code, topic, difficulty, mcq_count, short_answer_count, data.get('student_id')
+        )
         
-        # Convert to the format required by the generator
-        sample_data = []
-        for q in sample_questions:
-            q_data = {
-                'type': q.qtype,
-                'question': q.text,
-                'score': 10  
-            }
-            
-            if q.qtype == 'mcq':
-                # Get multiple-choice options
-                choices = QuestionChoice.objects.filter(question=q).order_by('order')
-                options = []
-                correct_answer = ''
-                
-                for choice in choices:
-                    option_text = f"{choice.label or chr(65 + choice.order)}. {choice.content}"
-                    options.append(option_text)
-                    if choice.is_correct:
-                        correct_answer = choice.label or chr(65 + choice.order)
-                
-                q_data.update({
-                    'options': options,
-                    'correct_answer': correct_answer,
-                    'explanation': q.description or f"Correct answer is {correct_answer}"
-                })
-            else:  # short answer
-                q_data.update({
-                    'sample_answer': q.short_answer or "Sample answer not available",
-                    'grading_points': q.keywords_json or ["Content accuracy", "Clarity", "Completeness"]
-                })
+        if generated is None:
+            # Retrieve sample questions from the Question table of courses_admin
+            sample_data = await sync_to_async(question_pool.load_sample_questions)(course_code, topic)
+            if not sample_data:
+                return JsonResponse({
+                    'success': False,
+                    'error': f'No questions found for course {course_code}. Please upload questions through the admin panel first.'
+                }, status=404)
             
-            sample_data.append(q_data)
-        
-        # Initialize the generator and generate questions
-        generator = QuestionGenerator()
-        generated = generator.generate_questions(
-            topic=topic,
-            difficulty=difficulty,
-            sample_questions=sample_data,
-            count=count,
-            mcq_count=mcq_count,
-            short_answer_count=short_answer_count
-        )
+            # Initialize the generator and generate questions
+            generator = QuestionGenerator()
+            generated = await generator.agenerate_questions(
+                topic=topic,
+                difficulty=difficulty,
+                sample_questions=sample_data,
+                count=count,
+                mcq_count=mcq_count,
+                short_answer_count=short_answer_count
+            )
         
         if not generated:
             return JsonResponse({
@@ -160,23 +110,7 @@ def generate_questions(request):
             }, status=500)
         
         # Create a session ID and save it to the database
-        session_id = str(uuid.uuid4())
-        
-        saved_questions = []
-        for idx, q in enumerate(generated, 1):
-            gen_q = GeneratedQuestion.objects.create(
-                session_id=session_id,
-                course_code=course_code,
-                topic=topic,
-                difficulty=difficulty,
-                question_type=q.get('type'),
-                question_data=q
-            )
-            
-            # Add database ID to the returned question
-            q['db_id'] = gen_q.id
-            q['question_id'] = idx  
-            saved_questions.append(q)
+        session_id, saved_questions = await sync_to_async(_save_generated_questions)(course_code, topic, difficulty, generated)
         
         return JsonResponse({
             'success': True,
@@ -194,9 +128,23 @@ def generate_questions(request):
         }, status=500)
 
 
+def _save_generated_questions(course_code, topic, difficulty, generated):
+    """Store a generated session; return (session_id, questions with their db ids)"""
+    session_id, rows = persist_generated_session(course_code, topic, difficulty, generated)
+    
+    saved_questions = []
+    for idx, (q, gen_q) in enumerate(zip(generated, rows), 1):
+        # Add database ID to the returned question
+        q['db_id'] = gen_q.id
+        q['question_id'] = idx  
+        saved_questions.append(q)
+    
+    return session_id, saved_questions
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
-def submit_answers(request):
+async def submit_answers(request):
     """
     Students submit answers and receive AI ratings
     
@@ -213,9 +161,14 @@ def submit_answers(request):
                 "question_db_id": 2,
                 "answer": "Learning rate controls..."
             }
-        ]
+        ],
+        "background": false  // optional, default settings.GRADING_BACKGROUND
     }
     
+    With background grading the answers are stored right away, MCQs are scored, and the
+    response (202) carries short answers as "pending" plus a results_url to poll or stream
+    (GET /api/ai/answers/results/{session_id}?student_id=...) while they are graded.
+    
     Response: {
         "success": true,
         "grading_results": [
@@ -264,9 +217,9 @@ def submit_answers(request):
             }, status=400)
         
         # Get all the questions for this session
-        questions = GeneratedQuestion.objects.filter(session_id=session_id).order_by('id')
+        questions = await sync_to_async(list)(GeneratedQuestion.objects.filter(session_id=session_id).order_by('id'))
         
-        if not questions.exists():
+        if not questions:
             return JsonResponse({
                 'success': False,
                 'error': f'No questions found for session {session_id}'
@@ -311,89 +264,45 @@ def submit_answers(request):
             }
         }
         
-        # grading
-        grading_result = grader.grade_all(
-            questions_for_grading,
-            student_answers_dict,
-            student_id
-        )
+        background = bool(data.get('background', getattr(settings, 'GRADING_BACKGROUND', False)))
         
-        # Save student answers and grading results to the database
-        graded_at = timezone.now()
-        for result in grading_result['grading_results']:
-            q_db_id = result['question_id']
-            StudentAnswer.objects.create(
-                session_id=session_id,
-                student_id=student_id,
-                question_id=q_db_id,
-                answer_text=student_answers_dict.get(str(q_db_id), ''),
-                grading_result=result,
-                graded_at=graded_at
+        # grading (in background mode short answers are only queued here)
+        if background:
+            grading_result = await sync_to_async(grader.grade_without_ai)(questions_for_grading, student_answers_dict, student_id)
+        else:
+            grading_result = await grader.agrade_all(
+                questions_for_grading,
+                student_answers_dict,
+                student_id
             )
         
-        # Save to RecentPracticeSession for AI chat use
-        try:
-            from ai_chat.models import RecentPracticeSession
-            
-            # Get session information (course and topic) - obtained from model fields, not question_data
-            first_question = questions.first()
-            course_code = first_question.course_code if first_question else 'Unknown'
-            topic = first_question.topic if first_question else 'General'
-            
-            # Build detailed test data
-            test_data_for_ai = {
-                "questions": []
-            }
-            
-            for result in grading_result['grading_results']:
-                q_db_id = result['question_id']
-                question_obj = question_map.get(q_db_id)
-                if question_obj:
-                    q_detail = {
-                        "question_text": question_obj.question_data.get('question', 'N/A'),
-                        "question_type": result.get('type', 'unknown'),
-                        "student_answer": result.get('student_answer', ''),
-                        "correct_answer": question_obj.question_data.get('correct_answer', 'N/A'),
-                        "score": result.get('score', 0),
-                        "max_score": result.get('max_score', 10),
-                        "is_correct": result.get('is_correct', False),
-                        "feedback": result.get('feedback', '')
-                    }
-                    if result.get('type') == 'mcq' and 'options' in question_obj.question_data:
-                        q_detail['options'] = question_obj.question_data.get('options', [])
-                    test_data_for_ai["questions"].append(q_detail)
-            
-            # create/update RecentPracticeSession
-            RecentPracticeSession.objects.update_or_create(
-                student_id=student_id,
-                session_id=session_id,
-                defaults={
-                    'course_code': course_code,
-                    'topic': topic,
-                    'total_score': grading_result['total_score'],
-                    'max_score': grading_result['total_max_score'],
-                    'percentage': grading_result['percentage'],
-                    'questions_count': len(grading_result['grading_results']),
-                    'test_data': test_data_for_ai,
-                }
-            )
-            print(f"[DEBUG] The test results have been saved toRecentPracticeSession: {student_id} - {session_id}")
-        except Exception as e:
-            print(f"[WARNING] save to RecentPracticeSession失败: {e}")
-            # Does not affect the main process, continue to return the rating results
+        # Save student answers and grading results to the database
+        await sync_to_async(_save_graded_answers)(session_id, student_id, questions, question_map, student_answers_dict, grading_result)
         
         # Add questiond_db_id for each result
         for result in grading_result['grading_results']:
             result['question_db_id'] = result['question_id']
         
-        return JsonResponse({
+        response = {
             'success': True,
             'student_id': grading_result['student_id'],
             'grading_results': grading_result['grading_results'],
             'total_score': grading_result['total_score'],
             'total_max_score': grading_result['total_max_score'],
             'percentage': grading_result['percentage']
+        }
+        pending = sum(1 for r in grading_result['grading_results'] if r.get('status') == 'pending')
+        if not background:
+            return JsonResponse(response)
+        
+        if pending:
+            grading_queue.grade_in_background(session_id)
+        response.update({
+            'complete': pending == 0,
+            'pending_count': pending,
+            'results_url': f"{reverse('ai_question_generator:grading_results', args=[session_id])}?student_id={student_id}",
         })
+        return JsonResponse(response, status=202 if pending else 200)
     
     except Exception as e:
         import traceback
@@ -404,6 +313,66 @@ def submit_answers(request):
         }, status=500)
 
 
+def _save_graded_answers(session_id, student_id, questions, question_map, student_answers_dict, grading_result):
+    """Store the graded answers and the RecentPracticeSession the AI chat reads"""
+    # Save student answers and grading results to the database in one INSERT
+    graded_at = timezone.now()
+    with transaction.atomic():
+        StudentAnswer.objects.bulk_create([
+            StudentAnswer(
+                session_id=session_id,
+                student_id=student_id,
+                question_id=result['question_id'],
+                answer_text=student_answers_dict.get(str(result['question_id']), ''),
+                grading_result=result,
+                graded_at=graded_at,
+                # bulk_create skips save(), which would set this
+                status=StudentAnswer.status_for(result)
+            )
+            for result in grading_result['grading_results']
+        ])
+    
+    # Save to RecentPracticeSession for AI chat use
+    try:
+        from ai_chat.models import RecentPracticeSession
+        from ai_chat.student_context import invalidate_student_context
+    
+        # Get session information (course and topic) - obtained from model fields, not question_data
+        first_question = questions[0] if questions else None
+        course_code = first_question.course_code if first_question else 'Unknown'
+        topic = first_question.topic if first_question else 'General'
+    
+        # Build detailed test data
+        test_data_for_ai = {
+            "questions": []
+        }
+    
+        for result in grading_result['grading_results']:
+            question_obj = question_map.get(result['question_id'])
+            if question_obj:
+                test_data_for_ai["questions"].append(grading_queue.practice_question_detail(question_obj, result))
+    
+        # create/update RecentPracticeSession
+        RecentPracticeSession.objects.update_or_create(
+            student_id=student_id,
+            session_id=session_id,
+            defaults={
+                'course_code': course_code,
+                'topic': topic,
+                'total_score': grading_result['total_score'],
+                'max_score': grading_result['total_max_score'],
+                'percentage': grading_result['percentage'],
+                'questions_count': len(grading_result['grading_results']),
+                'test_data': test_data_for_ai,
+            }
+        )
+        invalidate_student_context(student_id)
+        print(f"[DEBUG] The test results have been saved toRecentPracticeSession: {student_id} - {session_id}")
+    except Exception as e:
+        print(f"[WARNING] save to RecentPracticeSession失败: {e}")
+        # Does not affect the main process, continue to return the rating results
+
+
 @require_http_methods(["GET"])
 def get_session_questions(request, session_id):
     """
@@ -499,3 +468,92 @@ def get_student_results(request):
             'success': False,
             'error': str(e)
         }, status=500)
+
+
+@require_http_methods(["GET"])
+async def grading_results(request, session_id):
+    """
+    Grading progress of one submission; short answers fill in as background grading lands
+    
+    GET /api/ai/answers/results/{session_id}?student_id=z1234567[&stream=1]
+    
+    Response: {
+        "success": true,
+        "complete": false,
+        "pending_count": 1,
+        "grading_results": [...],  // same items as submit_answers
+        "total_score": 10,
+        "total_max_score": 20,
+        "percentage": 50.0
+    }
+    
+    With stream=1 the payload is sent as server-sent "progress" events whenever it changes,
+    then a "done" event once nothing is pending, or "timeout" after
+    GRADING_RESULTS_STREAM_SECONDS so the client can reconnect.
+    """
+    student_id = request.GET.get('student_id')
+    if not student_id:
+        return JsonResponse({
+            'success': False,
+            'error': 'Missing required field: student_id'
+        }, status=400)
+    
+    progress = await sync_to_async(_grading_progress)(session_id, student_id)
+    if progress is None:
+        return JsonResponse({
+            'success': False,
+            'error': f'No answers found for session {session_id}'
+        }, status=404)
+    
+    if request.GET.get('stream') not in ('1', 'true'):
+        return JsonResponse(progress)
+    
+    # An async iterator: the stream waits on the event loop and holds no thread between polls
+    response = StreamingHttpResponse(_grading_progress_events(session_id, student_id, progress),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _grading_progress(session_id, student_id):
+    answers = grading_queue.latest_answers(session_id, student_id)
+    if not answers:
+        return None
+    results = [dict(a.grading_result or {}, question_db_id=a.question_id) for a in answers]
+    total_score = sum(r.get('score', 0) for r in results)
+    total_max = sum(r.get('max_score', 0) for r in results)
+    pending = sum(1 for a in answers if a.status != 'graded')
+    return {
+        'success': True,
+        'student_id': student_id,
+        'complete': pending == 0,
+        'pending_count': pending,
+        'grading_results': results,
+        'total_score': total_score,
+        'total_max_score': total_max,
+        'percentage': (total_score / total_max * 100) if total_max > 0 else 0
+    }
+
+
+async def _grading_progress_events(session_id, student_id, progress):
+    import asyncio
+    import time
+    
+    def event(name, data):
+        return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    
+    until = time.monotonic() + getattr(settings, 'GRADING_RESULTS_STREAM_SECONDS', 120)
+    interval = getattr(settings, 'GRADING_RESULTS_POLL_SECONDS', 1)
+    yield event('progress', progress)
+    while not progress['complete']:
+        if time.monotonic() >= until:
+            yield event('timeout', {'pending_count': progress['pending_count']})
+            return
+        await asyncio.sleep(interval)
+        latest = await sync_to_async(_grading_progress)(session_id, student_id)
+        if latest != progress:
+            progress = latest
+            yield event('progress', progress)
+    yield event('done', progress)
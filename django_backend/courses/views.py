@@ -16,6 +16,7 @@ from .models import (
 from plans.models import StudyPlan,StudyPlanItem
 from .models import CourseTask, StudentEnrollment
 from task_progress.models import TaskProgress
+from ai_chat.student_context import invalidate_student_context
 def choose_courses(request):
     sid = _require_student(request)
    
@@ -40,6 +41,7 @@ def choose_courses(request):
             return redirect(f"/courses/materials/{code}?duplicated=1")
 
         StudentEnrollment.objects.create(student_id=sid, course_code=code)
+        invalidate_student_context(sid)
         return redirect(f"/courses/materials/{code}?added=1")
     except IntegrityError:
         return render(request, "choose_courses.html", {"message": "fail to enroll,try again later"})
@@ -135,6 +137,7 @@ def add_course(request):
     _, created = StudentEnrollment.objects.get_or_create(student_id=sid, course_code=code)
     if not created:
         return JsonResponse({"success": True, "message": "already enrolled"})
+    invalidate_student_context(sid)
     return JsonResponse({"success": True})
 
 def my_courses(request):
@@ -18,6 +18,9 @@ from django.http import FileResponse, Http404
 from django.utils import timezone
 from datetime import datetime, time
 from reminder.models import DueReport
+from ai_module import analysis_cache
+from ai_chat.student_context import invalidate_student_context
+from ai_chat.topic_index import invalidate_topic_index
 from decimal import Decimal
 from datetime import datetime, date
 from django.utils import timezone
@@ -259,6 +262,9 @@ def delete_course(request):
                     QuestionKeywordMap.objects.filter(keyword_id=OuterRef('pk'))
                 )
             ).delete()
+            enrolled_students = list(
+                StudentEnrollment.objects.filter(course_code=course_code).values_list("student_id", flat=True)
+            )
             StudentEnrollment.objects.filter(course_code=course_code).delete()
             CourseAdmin.objects.filter(code__code=course_code).delete()
 
@@ -278,6 +284,10 @@ def delete_course(request):
             except Exception as fe:
                 print(f"[delete_course] material file delete failed: {fpath} err={fe}")
 
+        for sid in enrolled_students:
+            invalidate_student_context(sid)
+        invalidate_topic_index(course_code)
+
         return JsonResponse({"success": True, "message": f"course {course_code} has been deleted"})
 
     except Exception as e:
@@ -548,6 +558,7 @@ def create_course_question(request, course_code):
                     for kw in keyword_objs
                 ])
 
+        invalidate_topic_index(course_code)
         return JsonResponse({"success": True, "data": {"id": q.id}}, status=201)
 
     except Exception as e:
@@ -656,6 +667,7 @@ def update_course_question(request, course_id, question_id):
     else:
         q.choices.all().delete()
 
+    transaction.on_commit(lambda: invalidate_topic_index(q.course_code))
     return JsonResponse({
         "success": True,
         "message": "Updated successfully",
@@ -687,6 +699,7 @@ def delete_course_question(request, course_id, question_id):
                 QuestionKeywordMap.objects.filter(keyword_id=OuterRef('pk'))
             )
         ).delete()#delete keyword
+        invalidate_topic_index(course_id)
         return JsonResponse({"success": True})
     except Question.DoesNotExist:
         return JsonResponse({"success": False, "message": "Question not found"}, status=404)
@@ -718,6 +731,8 @@ def upload_task_file(request):
 
     #  return task URL
     url_path = f"{settings.TASK_URL}{course}/{filename}".replace("\\", "/")
+    # The file under this url changed: drop analyses cached for it
+    analysis_cache.invalidate_source(url_path)
 
     return ok({
         "url": url_path,
@@ -938,6 +953,11 @@ def update_course_task(request, course_id: str, task_id: int):
                     }
                 )
             print(">>> [DEBUG] Admin task update notifications sent!", flush=True)
+
+        # Title/deadline/file edits change what the plan analysis sees
+        analysis_cache.invalidate_source(old_url)
+        if new_url is not None:
+            analysis_cache.invalidate_source(new_url)
            
         if new_url is not None and delete_old and old_url and old_url != new_url:
             if hasattr(settings, "TASK_URL") and hasattr(settings, "TASK_ROOT"):
@@ -21,6 +21,7 @@ class AuthTokenMiddleware(MiddlewareMixin):
         "/api/ai/questions/generate",  
         "/api/ai/questions/session/", 
         "/api/ai/answers/submit",  
+        "/api/ai/answers/results/",
         "/api/overdue/report-day", 
     )
 
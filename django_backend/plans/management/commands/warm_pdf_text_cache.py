@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ai_module.pdf_ingest import TEXT_CACHE_DIR, warm_text_cache
+
+
+class Command(BaseCommand):
+    help = "Pre-extract text from every PDF under TASK_ROOT and MAT_ROOT into the PDF text cache"
+
+    def handle(self, *args, **options):
+        roots = [settings.TASK_ROOT, settings.MAT_ROOT]
+        stats = warm_text_cache(roots)
+        self.stdout.write(self.style.SUCCESS(
+            f"PDF text cache at {TEXT_CACHE_DIR}: "
+            f"{stats['extracted']} extracted, {stats['cached']} already cached, {stats['failed']} without text"
+        ))
@@ -0,0 +1,27 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("plans", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TaskAnalysisCache",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("cache_key", models.CharField(max_length=64, unique=True)),
+                ("source", models.CharField(blank=True, db_index=True, default="", max_length=512)),
+                ("payload", models.JSONField()),
+                ("hits", models.IntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("last_used_at", models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                "db_table": "task_analysis_cache",
+            },
+        ),
+    ]
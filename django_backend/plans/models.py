@@ -99,3 +99,25 @@ class StudyPlanItem(models.Model):
 
     def __str__(self):
         return f"[{self.course_code}] {self.external_item_id} @ {self.scheduled_date}"
+
+
+class TaskAnalysisCache(models.Model):
+    """
+    Persisted result of analysing one task PDF (LLM summary + part split), shared by every
+    student enrolled in the course. cache_key is a sha256 over the PDF content hash, task
+    title, due date, prompt version and model name; source is the task url it came from.
+    """
+    id = models.BigAutoField(primary_key=True)
+    cache_key = models.CharField(max_length=64, unique=True)
+    source = models.CharField(max_length=512, blank=True, default="", db_index=True)
+    payload = models.JSONField()
+    hits = models.IntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        db_table = "task_analysis_cache"
+
+    def __str__(self):
+        return f"{self.source or '-'} [{self.cache_key[:12]}]"
@@ -4,6 +4,7 @@ from typing import Dict, List
 from django.utils import timezone
 from django.http import JsonResponse, HttpRequest
 from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
 from utils.auth import get_student_id_from_request
 from typing import Optional
 from ai_module.plan_generator import generate_plan
@@ -130,8 +131,56 @@ def weekly_plan(request: HttpRequest, week_offset: int):
 
 
 @csrf_exempt
-def generate_ai_plan(request):
+async def generate_ai_plan(request):
     """courses + preferences + AI"""
+    inputs = await sync_to_async(_collect_plan_inputs)(request)
+    if isinstance(inputs, JsonResponse):
+        return inputs
+    student, preferences, tasks_meta = inputs
+    
+    try:
+        print(tasks_meta)
+        # Convert preference data format to match the expected field names of the AI module
+        ai_preferences = {
+            "daily_hour_cap": int(preferences.get("dailyHours", 4)),
+            "weekly_study_days": int(preferences.get("weeklyStudyDays", 5)),
+            "avoid_days": preferences.get("avoidDays", [])
+        }
+        print(f"🤖 [GENERATE_AI_PLAN] AI pref: {ai_preferences}")
+        
+        # Get user time zone, default to Australia/Sydney
+        tz = request.POST.get('timezone', request.GET.get('timezone', 'Australia/Sydney'))
+        print(f"🌍 [GENERATE_AI_PLAN] timezone:: {tz}")
+        
+        # PDF reading and the per-task LLM fan-out run in a worker thread
+        ai_result = await sync_to_async(generate_plan)(ai_preferences, tasks_meta, user_timezone=tz)
+        print("🤖 AI generate!：")
+        from pprint import pprint
+        pprint(ai_result)
+        
+        ai_details = {
+            "aiSummary": ai_result.get("aiSummary", {}),
+            "generationReason": f"AI-generated learning plan based on {len(tasks_meta)} course assignment PDFs and user preferences",
+            "generationTime": timezone.now().isoformat(),
+            "preferences": ai_preferences,
+            "tasksAnalysis": tasks_meta
+        }
+        
+        print("🤖 [GENERATE_AI_PLAN] prepare to write into db...")
+        print("🔍 [GENERATE_AI_PLAN] AI result:", list(ai_result.keys()) if isinstance(ai_result, dict) else type(ai_result))
+        
+        return await sync_to_async(_store_ai_plan)(student, ai_result, ai_details, tz)
+
+    except Exception as e:
+        print("[AI_GENERATE_PLAN_ERROR]", str(e))
+        return JsonResponse({
+            "success": False,
+            "message": f"AI Plan generation failed: {str(e)}"
+        }, status=500)
+
+
+def _collect_plan_inputs(request):
+    """Return (student, preferences, tasks_meta) for plan generation, or the error response"""
     print(f"🚀 [GENERATE_AI_PLAN] get request: {request.method}")
     print(f"🚀 [GENERATE_AI_PLAN] Headers: {dict(request.headers)}")
     
@@ -206,99 +255,67 @@ def generate_ai_plan(request):
     if not tasks_meta:
         return JsonResponse({"success": False, "message": "No tasks found"}, status=404)
     
-    try:
-        print(tasks_meta)
-        # Convert preference data format to match the expected field names of the AI module
-        ai_preferences = {
-            "daily_hour_cap": int(preferences.get("dailyHours", 4)),
-            "weekly_study_days": int(preferences.get("weeklyStudyDays", 5)),
-            "avoid_days": preferences.get("avoidDays", [])
-        }
-        print(f"🤖 [GENERATE_AI_PLAN] AI pref: {ai_preferences}")
-        
-        # Get user time zone, default to Australia/Sydney
-        tz = request.POST.get('timezone', request.GET.get('timezone', 'Australia/Sydney'))
-        print(f"🌍 [GENERATE_AI_PLAN] timezone:: {tz}")
-        
-        ai_result = generate_plan(ai_preferences, tasks_meta, user_timezone=tz)
-        print("🤖 AI generate!：")
-        from pprint import pprint
-        pprint(ai_result)
-        
-        ai_details = {
-            "aiSummary": ai_result.get("aiSummary", {}),
-            "generationReason": f"AI-generated learning plan based on {len(tasks_meta)} course assignment PDFs and user preferences",
-            "generationTime": timezone.now().isoformat(),
-            "preferences": ai_preferences,
-            "tasksAnalysis": tasks_meta
-        }
-        
-        print("🤖 [GENERATE_AI_PLAN] prepare to write into db...")
-        print("🔍 [GENERATE_AI_PLAN] AI result:", list(ai_result.keys()) if isinstance(ai_result, dict) else type(ai_result))
-        
-        #  Map AI results to the format required by the frontend and save them directly
-        from .services import map_ai_result_to_weekly_format, _save_plan_to_database_directly
-        try:
-            print("🔄 [GENERATE_AI_PLAN] starting Mapping")
-            weekly_plan = map_ai_result_to_weekly_format(ai_result, tz)
-            print("✅ [GENERATE_AI_PLAN] Mapping done")
-            
-            print("💾 [GENERATE_AI_PLAN] prepare to write into db...")
-            save_result = _save_plan_to_database_directly(student, weekly_plan, ai_details)
-            print("✅ [GENERATE_AI_PLAN] save done:", save_result)
-        except Exception as save_error:
-            print(f"❌ [GENERATE_AI_PLAN] error during saving: {save_error}")
-            print(f"❌ [GENERATE_AI_PLAN] error type: {type(save_error)}")
-            import traceback
-            traceback.print_exc()
-            
+    return student, preferences, tasks_meta
 
-            return JsonResponse({
-                "success": True, 
-                "message": "AI plan generate! but fail to save", 
-                "data": ai_result,
-                "saved": False,
-                "plan_id": None
-            })
-        
-        if save_result["success"]:
-            print("✅ [GENERATE_AI_PLAN] save to db!")
-            
-            # Simultaneously save to AI dialogue module for use in Explain function
-            try:
-                from ai_chat.chat_service import AIChatService
-                chat_service = AIChatService()
-                chat_success = chat_service.save_study_plan(student, ai_result)
-                if chat_success:
-                    print("✅ [GENERATE_AI_PLAN] The plan has been synchronized to the AI dialogue module")
-                else:
-                    print("⚠️ [GENERATE_AI_PLAN] Failed to save plan to AI dialogue module")
-            except Exception as chat_error:
-                print(f"⚠️ [GENERATE_AI_PLAN] AI dialogue module saving error: {chat_error}")
-            
-            # Return complete data containing detailed AI content to the frontend
-            ai_result["aiDetails"] = ai_details
-            return JsonResponse({
-                "success": True, 
-                "message": "OK", 
-                "data": ai_result,
-                "saved": True,
-                "plan_id": save_result.get("plan_id")
-            })
-        else:
-            print(f"❌ [GENERATE_AI_PLAN] Database save failed: {save_result.get('error')}")
-            return JsonResponse({
-                "success": False,
-                "message": f"Failed to save plan: {save_result.get('error')}"
-            }, status=500)
 
-    except Exception as e:
-        print("[AI_GENERATE_PLAN_ERROR]", str(e))
+def _store_ai_plan(student, ai_result, ai_details, tz):
+    """Save the generated plan for the weekly view and the AI chat; return the response"""
+    #  Map AI results to the format required by the frontend and save them directly
+    from .services import map_ai_result_to_weekly_format, _save_plan_to_database_directly
+    try:
+        print("🔄 [GENERATE_AI_PLAN] starting Mapping")
+        weekly_plan = map_ai_result_to_weekly_format(ai_result, tz)
+        print("✅ [GENERATE_AI_PLAN] Mapping done")
+    
+        print("💾 [GENERATE_AI_PLAN] prepare to write into db...")
+        save_result = _save_plan_to_database_directly(student, weekly_plan, ai_details)
+        print("✅ [GENERATE_AI_PLAN] save done:", save_result)
+    except Exception as save_error:
+        print(f"❌ [GENERATE_AI_PLAN] error during saving: {save_error}")
+        print(f"❌ [GENERATE_AI_PLAN] error type: {type(save_error)}")
+        import traceback
+        traceback.print_exc()
+    
+
+        return JsonResponse({
+            "success": True, 
+            "message": "AI plan generate! but fail to save", 
+            "data": ai_result,
+            "saved": False,
+            "plan_id": None
+        })
+    
+    if save_result["success"]:
+        print("✅ [GENERATE_AI_PLAN] save to db!")
+    
+        # Simultaneously save to AI dialogue module for use in Explain function
+        try:
+            from ai_chat.chat_service import AIChatService
+            chat_service = AIChatService()
+            chat_success = chat_service.save_study_plan(student, ai_result)
+            if chat_success:
+                print("✅ [GENERATE_AI_PLAN] The plan has been synchronized to the AI dialogue module")
+            else:
+                print("⚠️ [GENERATE_AI_PLAN] Failed to save plan to AI dialogue module")
+        except Exception as chat_error:
+            print(f"⚠️ [GENERATE_AI_PLAN] AI dialogue module saving error: {chat_error}")
+    
+        # Return complete data containing detailed AI content to the frontend
+        ai_result["aiDetails"] = ai_details
+        return JsonResponse({
+            "success": True, 
+            "message": "OK", 
+            "data": ai_result,
+            "saved": True,
+            "plan_id": save_result.get("plan_id")
+        })
+    else:
+        print(f"❌ [GENERATE_AI_PLAN] Database save failed: {save_result.get('error')}")
         return JsonResponse({
             "success": False,
-            "message": f"AI Plan generation failed: {str(e)}"
+            "message": f"Failed to save plan: {save_result.get('error')}"
         }, status=500)
-    
+
 
 @csrf_exempt
 def save_weekly_plans(request: HttpRequest):
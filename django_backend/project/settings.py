@@ -29,6 +29,42 @@ TASK_URL = "/task/"
 #test for submitting
 MAT_ROOT = BASE_DIR / "material"
 MAT_URL = "/material/"
+
+# Shared task analysis (LLM summary + part split) cache, see ai_module/analysis_cache.py
+TASK_ANALYSIS_CACHE_TTL_DAYS = 30
+TASK_ANALYSIS_CACHE_MAX_ENTRIES = 2000
+# Seconds a Gemini chat reply is reused for the same question and context, see ai_chat/response_cache.py
+CHAT_RESPONSE_CACHE_TTL = 600
+# Seconds the per-student chat context snapshot is kept, see ai_chat/student_context.py
+STUDENT_CONTEXT_CACHE_TTL = 300
+# Recent messages kept per chat conversation and for how many seconds, see ai_chat/history_cache.py
+CHAT_HISTORY_SIZE = 30
+CHAT_HISTORY_CACHE_TTL = 1800
+# Seconds a student id -> chat auth User id mapping is kept, see ai_chat/chat_users.py
+CHAT_USER_ID_CACHE_TTL = 86400
+# Seconds a process keeps a course's practice topic index before rebuilding it, see ai_chat/topic_index.py
+TOPIC_INDEX_MAX_AGE = 600
+# Estimated token budget for the chat system prompt, see ai_chat/prompt_builder.py
+CHAT_PROMPT_TOKEN_BUDGET = 3000
+# Practice submissions: grade short answers on the DB-backed queue instead of in the request,
+# see ai_question_generator/grading_queue.py. With GRADING_IN_PROCESS_WORKER off, run
+# `python manage.py grade_pending_answers --loop` as the worker.
+GRADING_BACKGROUND = False
+GRADING_IN_PROCESS_WORKER = True
+GRADING_CLAIM_TIMEOUT = 300
+GRADING_RESULTS_STREAM_SECONDS = 120
+GRADING_RESULTS_POLL_SECONDS = 1
+# Stored AI grades reused for identical short answers, see ai_question_generator/grading_cache.py
+GRADING_CACHE_ENABLED = True
+GRADING_CACHE_MAX_ENTRIES = 50000
+# Pre-generated practice questions per (course, topic, difficulty), counted per question type,
+# see ai_question_generator/question_pool.py. Refilled by `python manage.py refill_question_pool`.
+QUESTION_POOL_ENABLED = True
+QUESTION_POOL_TARGET = 10
+QUESTION_POOL_LOW_WATERMARK = 4
+QUESTION_POOL_REFILL_BATCH = 10
+QUESTION_POOL_MAX_SERVES = 50
+QUESTION_POOL_DIFFICULTIES = ("easy", "medium", "hard")
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
@@ -139,6 +175,28 @@ else:
         }
     }
 
+# The chat history buffers, topic index, student context snapshots and cached chat replies live
+# in this cache and are invalidated by explicit deletes, so it must be shared by every worker
+# process (gunicorn runs several; a per-process LocMemCache would keep serving stale copies).
+# REDIS_URL selects Redis; otherwise the database cache table is used, created with
+# `python manage.py createcachetable`. See DEPLOYMENT_GUIDE.md.
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "django_cache",
+            # The default of 300 would cull live history buffers and index versions
+            "OPTIONS": {"MAX_ENTRIES": 20000},
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
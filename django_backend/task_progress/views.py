@@ -4,6 +4,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from .models import TaskProgress
 from stu_accounts.models import StudentAccount
+from ai_chat.student_context import invalidate_student_context
 from .models import (
     OverdueStudent,
     OverdueCourseStudent,
@@ -75,6 +76,7 @@ def task_progress_detail(request, task_id):
                 task_id=int(task_id),
                 defaults={"progress": progress}
             )
+            invalidate_student_context(sid)
             return JsonResponse({"success": True})
         except (ValueError, json.JSONDecodeError):
             return JsonResponse({"success": False, "error": "Invalid progress value"}, status=400)
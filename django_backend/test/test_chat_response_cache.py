@@ -0,0 +1,56 @@
+# django_backend/test/test_chat_response_cache.py
+
+import asyncio
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from ai_chat import response_cache
+
+
+LOCAL_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ChatResponseCacheKeyTests(SimpleTestCase):
+
+    def setUp(self):
+        self.history = [
+            {"type": "user", "content": "hi"},
+            {"type": "ai", "content": "Hello! How can I help?"},
+        ]
+
+    def test_repeat_question_maps_to_same_key(self):
+        """Asking the same thing again (modulo case and punctuation) reuses the first key."""
+        first = response_cache.make_key("1", "ctx", self.history, "Explain my plan?")
+        asked_again = self.history + [
+            {"type": "user", "content": "explain my plan"},
+            {"type": "ai", "content": "Your plan has three tasks..."},
+        ]
+        self.assertEqual(first, response_cache.make_key("1", "ctx", asked_again, "explain  my plan"))
+
+    def test_context_or_prompt_change_gives_new_key(self):
+        """A new practice result, plan or prompt version never reuses an older reply."""
+        key = response_cache.make_key("1", "ctx", self.history, "what did I get wrong")
+        self.assertNotEqual(key, response_cache.make_key("1", "ctx + new practice test", self.history, "what did I get wrong"))
+        self.assertNotEqual(key, response_cache.make_key("2", "ctx", self.history, "what did I get wrong"))
+
+    def test_put_then_get(self):
+        """Stored replies come back until the TTL expires."""
+        key = response_cache.make_key("1", "ctx", self.history, "hello")
+        self.assertIsNone(response_cache.get(key))
+        response_cache.put(key, "Hi there 👋")
+        self.assertEqual(response_cache.get(key), "Hi there 👋")
+
+
+class ChatResponseCacheAsyncTests(TestCase):
+
+    def test_async_put_then_get_with_database_cache(self):
+        """aput/aget reach the configured database cache from async code."""
+        key = response_cache.make_key("1", "ctx", [], "hello")
+
+        async def round_trip():
+            await response_cache.aput(key, "Hi there")
+            return await response_cache.aget(key)
+
+        self.assertEqual(asyncio.run(round_trip()), "Hi there")
+        self.assertEqual(response_cache.get(key), "Hi there")
@@ -0,0 +1,113 @@
+# django_backend/test/test_chat_stream.py
+
+import asyncio
+import json
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from ai_chat import chat_service
+from ai_chat.models import ChatMessage
+
+
+def _parse(body):
+    events = []
+    for block in body.decode("utf-8").strip().split("\n\n"):
+        name, data = block.split("\n", 1)
+        events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+async def _events(response):
+    return _parse(b"".join([chunk async for chunk in response.streaming_content]))
+
+
+def _stream(*chunks, error=None):
+    """A stand-in for gemini_client.agenerate_stream yielding the given chunks"""
+    async def agenerate_stream(prompt, generation_config=None):
+        for chunk in chunks:
+            yield chunk
+        if error:
+            raise error
+    return agenerate_stream
+
+
+class ChatStreamViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        for target, value in (("use_gemini", True),):
+            patcher = patch.object(chat_service, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(chat_service.gemini_client, "available", return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def _post(self, message):
+        return await self.async_client.post(
+            reverse("ai_chat:chat_stream"),
+            data=json.dumps({"message": message, "user_id": "s100"}),
+            content_type="application/json",
+        )
+
+    async def test_streams_deltas_then_saves_reply(self):
+        """Model chunks arrive as delta events and the done event carries the saved reply."""
+        with patch.object(chat_service.gemini_client, "agenerate_stream",
+                          _stream("Break it ", "into **small** steps")):
+            response = await self._post("How should I prepare for the exam")
+            # The body is generated lazily, so read it while the model is still patched
+            events = await _events(response)
+
+        self.assertTrue(response.is_async)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual([name for name, _ in events], ["delta", "delta", "done"])
+        self.assertEqual(events[0][1]["text"], "Break it ")
+
+        done = events[-1][1]
+        saved = await ChatMessage.objects.aget(message_type="ai")
+        self.assertEqual(done["ai_response"]["id"], saved.id)
+        self.assertEqual(saved.content, done["ai_response"]["content"])
+        self.assertTrue(await ChatMessage.objects.filter(
+            message_type="user", content="How should I prepare for the exam").aexists())
+
+    async def test_first_chunk_sent_before_model_finishes(self):
+        """The first delta reaches the client while the model is still producing the rest."""
+        release = asyncio.Event()
+
+        async def agenerate_stream(prompt, generation_config=None):
+            yield "Break it "
+            await release.wait()
+            yield "down"
+
+        with patch.object(chat_service.gemini_client, "agenerate_stream", agenerate_stream):
+            response = await self._post("How should I prepare for the exam")
+            chunks = aiter(response.streaming_content)
+            # A buffered response would wait for release forever
+            first = await asyncio.wait_for(anext(chunks), timeout=5)
+            self.assertEqual(_parse(first), [("delta", {"text": "Break it "})])
+            self.assertFalse(await ChatMessage.objects.filter(message_type="ai").aexists())
+
+            release.set()
+            rest = _parse(b"".join([chunk async for chunk in chunks]))
+
+        self.assertEqual([name for name, _ in rest], ["delta", "done"])
+        self.assertEqual(rest[-1][1]["ai_response"]["content"], "Break it down")
+
+    async def test_model_failure_falls_back_to_single_delta(self):
+        """If the stream fails before any text, the fallback reply is sent and saved instead."""
+        with patch.object(chat_service.gemini_client, "agenerate_stream", _stream(error=ConnectionError("down"))):
+            events = await _events(await self._post("How should I prepare for the exam"))
+
+        self.assertEqual([name for name, _ in events], ["delta", "done"])
+        self.assertEqual(events[0][1]["text"], events[1][1]["ai_response"]["content"])
+        self.assertEqual(await ChatMessage.objects.filter(message_type="ai").acount(), 1)
+
+    async def test_missing_user_id_rejected_like_chat_view(self):
+        """The stream endpoint resolves the account the same way as the plain chat endpoint."""
+        for name in ("ai_chat:chat_stream", "ai_chat:chat"):
+            response = await self.async_client.post(reverse(name), data=json.dumps({"message": "hi"}),
+                                                    content_type="application/json")
+            self.assertEqual((response.status_code, response.json()["error"]), (400, "User ID is required"))
@@ -0,0 +1,47 @@
+# django_backend/test/test_chat_users.py
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from ai_chat.chat_service import AIChatService
+from ai_chat.chat_users import user_id_for
+from stu_accounts.models import StudentAccount
+
+
+LOCAL_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ChatUserMappingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.account = StudentAccount.objects.create(student_id="s300", name="Sam", email="sam@example.com",
+                                                     password_hash="x")
+        self.service = AIChatService()
+
+    def test_user_created_once_then_cached(self):
+        """The first lookup creates the mirror User; later lookups run no queries."""
+        user_id = user_id_for(self.account)
+        user = User.objects.get(id=user_id)
+        self.assertEqual((user.username, user.email, user.first_name), ("s300", "sam@example.com", "Sam"))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(user_id_for(self.account), user_id)
+
+    def test_conversation_lookup_is_one_query(self):
+        """Once the conversation exists, fetching it takes a single query."""
+        conversation = self.service.get_or_create_conversation(self.account)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.service.get_or_create_conversation(self.account).id, conversation.id)
+
+    def test_study_plan_round_trip(self):
+        """A saved plan replaces the active one and syncs the User email."""
+        user_id = user_id_for(self.account)
+        User.objects.filter(id=user_id).update(email="old@example.com")
+
+        self.assertTrue(self.service.save_study_plan(self.account, {"v": 1}))
+        self.assertTrue(self.service.save_study_plan(self.account, {"v": 2}))
+        self.assertEqual(self.service.get_user_study_plan(self.account), {"v": 2})
+        self.assertEqual(User.objects.get(id=user_id).email, "sam@example.com")
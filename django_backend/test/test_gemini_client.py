@@ -0,0 +1,162 @@
+# django_backend/test/test_gemini_client.py
+
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from django.test import SimpleTestCase
+
+from ai_module import gemini_client
+
+
+def _response(text):
+    part = SimpleNamespace(text=text)
+    return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+
+class GeminiClientTests(SimpleTestCase):
+
+    def setUp(self):
+        self.sdk = MagicMock()
+        self.sdk.GenerativeModel.side_effect = lambda name, generation_config=None: MagicMock()
+        for name, value in (("GEMINI_KEY", "test-key"), ("_genai", None), ("_models", {}), ("_breakers", {})):
+            patcher = patch.object(gemini_client, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(gemini_client.importlib, "import_module", return_value=self.sdk)
+        self.import_module = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sdk_imported_once_and_models_shared_per_config(self):
+        """The SDK is configured on first use and each generation config maps to one model."""
+        self.import_module.assert_not_called()
+
+        first = gemini_client.get_model({"temperature": 0.2})
+        again = gemini_client.get_model({"temperature": 0.2})
+        other = gemini_client.get_model({"temperature": 0.7})
+
+        self.assertIs(first, again)
+        self.assertIsNot(first, other)
+        self.import_module.assert_called_once_with("google.generativeai")
+        self.sdk.configure.assert_called_once_with(api_key="test-key")
+
+    def test_generate_passes_timeout_and_parses_json(self):
+        """Per-call timeouts go in request_options; generate_json strips a code fence."""
+        model = gemini_client.get_model()
+        model.generate_content.return_value = _response('```json\n{"ok": true}\n```')
+
+        self.assertEqual(gemini_client.generate_json("prompt", timeout=5), {"ok": True})
+        model.generate_content.assert_called_once_with("prompt", request_options={"timeout": 5})
+
+    def test_empty_response_raises(self):
+        """A response without candidates is an error, so callers take their fallback path."""
+        gemini_client.get_model().generate_content.return_value = SimpleNamespace(candidates=[])
+
+        with self.assertRaises(ValueError):
+            gemini_client.generate("prompt")
+
+    def test_deadline_caps_request_timeout(self):
+        """Inside deadline() the per-call timeout shrinks to the time left, and expiry fails fast."""
+        model = gemini_client.get_model()
+        model.generate_content.return_value = _response("ok")
+
+        with gemini_client.deadline(3):
+            gemini_client.generate("prompt", timeout=10)
+        timeout = model.generate_content.call_args.kwargs["request_options"]["timeout"]
+        self.assertLessEqual(timeout, 3)
+
+        model.generate_content.reset_mock()
+        with gemini_client.deadline(60), gemini_client.deadline(0):
+            with self.assertRaises(TimeoutError):
+                gemini_client.generate("prompt", timeout=10)
+        model.generate_content.assert_not_called()
+        self.assertIsNone(gemini_client.remaining())
+
+    def test_breaker_opens_after_failures_and_recovers(self):
+        """Consecutive failures open the breaker; after the cooldown one trial call closes it."""
+        model = gemini_client.get_model()
+        model.generate_content.side_effect = ConnectionError("down")
+        for _ in range(gemini_client.BREAKER_FAILURES):
+            with self.assertRaises(ConnectionError):
+                gemini_client.generate("prompt")
+
+        self.assertFalse(gemini_client.available())
+        with self.assertRaises(gemini_client.CircuitOpenError):
+            gemini_client.generate("prompt")
+        self.assertEqual(model.generate_content.call_count, gemini_client.BREAKER_FAILURES)
+
+        model.generate_content.side_effect = None
+        model.generate_content.return_value = _response("ok")
+        with patch.object(gemini_client, "BREAKER_COOLDOWN", 0):
+            self.assertEqual(gemini_client.generate("prompt"), "ok")
+        self.assertTrue(gemini_client.available())
+
+    def test_slow_calls_count_as_failures(self):
+        """Responses slower than the latency threshold trip the breaker like errors do."""
+        gemini_client.get_model().generate_content.return_value = _response("ok")
+        with patch.object(gemini_client, "BREAKER_SLOW_SECONDS", -1):
+            for _ in range(gemini_client.BREAKER_FAILURES):
+                gemini_client.generate("prompt")
+
+        self.assertFalse(gemini_client.available())
+
+    def test_generate_stream_yields_chunks_and_feeds_breaker(self):
+        """Streaming yields each chunk's text; a failing stream counts against the breaker."""
+        model = gemini_client.get_model()
+        model.generate_content.return_value = iter([_response("Hel"), _response(""), _response("lo")])
+
+        self.assertEqual(list(gemini_client.generate_stream("prompt", timeout=5)), ["Hel", "lo"])
+        model.generate_content.assert_called_once_with("prompt", stream=True, request_options={"timeout": 5})
+
+        model.generate_content.side_effect = ConnectionError("down")
+        for _ in range(gemini_client.BREAKER_FAILURES):
+            with self.assertRaises(ConnectionError):
+                list(gemini_client.generate_stream("prompt"))
+        self.assertFalse(gemini_client.available())
+
+    def test_agenerate_shares_one_model_and_client_loop(self):
+        """Every caller loop awaits the shared model, whose async API runs on the one client loop."""
+        loops = []
+
+        async def reply(*args, **kwargs):
+            loops.append(asyncio.get_running_loop())
+            return _response("ok")
+
+        model = gemini_client.get_model()
+        model.generate_content_async = AsyncMock(side_effect=reply)
+
+        async def call():
+            return await gemini_client.agenerate("prompt", timeout=5), asyncio.get_running_loop()
+
+        (first, caller), (second, other_caller) = asyncio.run(call()), asyncio.run(call())
+        self.assertEqual((first, second), ("ok", "ok"))
+        self.assertEqual(model.generate_content_async.await_count, 2)
+        model.generate_content_async.assert_awaited_with("prompt", request_options={"timeout": 5})
+        self.assertIs(loops[0], loops[1])
+        self.assertNotIn(loops[0], (caller, other_caller))
+
+        with patch.object(gemini_client, "BREAKER_SLOW_SECONDS", -1):
+            for _ in range(gemini_client.BREAKER_FAILURES):
+                asyncio.run(gemini_client.agenerate("prompt"))
+        self.assertFalse(gemini_client.available())
+
+    def test_agenerate_stream_yields_chunks_and_feeds_breaker(self):
+        """Async streaming iterates the SDK's async response; failures count against the breaker."""
+        async def chunks():
+            for text in ("Hel", "", "lo"):
+                yield _response(text)
+
+        model = MagicMock(generate_content_async=AsyncMock(side_effect=lambda *a, **k: chunks()))
+        self.sdk.GenerativeModel.side_effect = lambda name, generation_config=None: model
+
+        async def collect():
+            return [text async for text in gemini_client.agenerate_stream("prompt", timeout=5)]
+
+        self.assertEqual(asyncio.run(collect()), ["Hel", "lo"])
+        model.generate_content_async.assert_awaited_with("prompt", stream=True, request_options={"timeout": 5})
+
+        model.generate_content_async.side_effect = ConnectionError("down")
+        for _ in range(gemini_client.BREAKER_FAILURES):
+            with self.assertRaises(ConnectionError):
+                asyncio.run(collect())
+        self.assertFalse(gemini_client.available())
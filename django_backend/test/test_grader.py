@@ -0,0 +1,238 @@
+# django_backend/test/test_grader.py
+
+import asyncio
+import json
+import time
+from io import StringIO
+from unittest.mock import AsyncMock, patch
+
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from ai_chat.models import RecentPracticeSession
+from ai_module import gemini_client
+from ai_question_generator import grader, grading_queue
+from ai_question_generator.grader import AutoGrader
+from ai_question_generator.models import GeneratedQuestion, GradingCache, StudentAnswer
+from ai_question_generator.practice_sessions import persist_generated_session
+
+
+class PendingGradeTests(TestCase):
+
+    def setUp(self):
+        patcher = patch.object(gemini_client, "GEMINI_KEY", "test-key")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.question = GeneratedQuestion.objects.create(
+            session_id="s1", course_code="COMP9900", topic="Agile", difficulty="easy",
+            question_type="short_answer",
+            question_data={"question": "What is a sprint?", "sample_answer": "A time-box", "grading_points": ["time-box"]},
+        )
+
+    def test_open_breaker_queues_answer_and_command_grades_it(self):
+        """While the breaker is open a short answer is stored as pending and graded later."""
+        q_data = dict(self.question.question_data, id=self.question.id, type="short_answer")
+        with patch.object(gemini_client, "generate", side_effect=gemini_client.CircuitOpenError("down")):
+            result = AutoGrader().grade_short_answer(q_data, "A fixed time-box")
+        self.assertEqual(result["status"], "pending")
+
+        StudentAnswer.objects.create(session_id="s1", student_id="z1", question=self.question,
+                                     answer_text="A fixed time-box", grading_result=result)
+        graded = {"question_id": self.question.id, "type": "short_answer", "score": 8, "max_score": 10}
+        with patch.object(gemini_client, "available", return_value=True), \
+                patch.object(AutoGrader, "grade_short_answer", return_value=graded):
+            call_command("grade_pending_answers", stdout=StringIO())
+
+        answer = StudentAnswer.objects.get()
+        self.assertEqual(answer.grading_result["score"], 8)
+        self.assertIsNotNone(answer.graded_at)
+
+    def test_submit_answers_grades_asynchronously(self):
+        """The async submit view awaits AI grading and stores answers and the practice summary."""
+        reply = json.dumps({"total_score": 7, "feedback": "Good", "breakdown": {}})
+        with patch.object(gemini_client, "agenerate", AsyncMock(return_value=reply)) as agenerate:
+            response = self.client.post("/api/ai/answers/submit", data=json.dumps({
+                "session_id": "s1", "student_id": "z1",
+                "answers": [{"question_db_id": self.question.id, "answer": "A fixed time-box"}],
+            }), content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["total_score"], 7)
+        agenerate.assert_awaited_once()
+        self.assertEqual(StudentAnswer.objects.get().grading_result["score"], 7)
+        self.assertEqual(RecentPracticeSession.objects.get(student_id="z1").total_score, 7)
+
+    def test_background_submit_queues_short_answer_until_worker_grades_it(self):
+        """Background mode answers 202 with the short answer pending; the queue grades it later."""
+        with self.settings(GRADING_IN_PROCESS_WORKER=False):
+            response = self.client.post("/api/ai/answers/submit", data=json.dumps({
+                "session_id": "s1", "student_id": "z1", "background": True,
+                "answers": [{"question_db_id": self.question.id, "answer": "A fixed time-box"}],
+            }), content_type="application/json")
+
+        self.assertEqual(response.status_code, 202)
+        body = response.json()
+        self.assertEqual((body["complete"], body["pending_count"]), (False, 1))
+        self.assertEqual(StudentAnswer.objects.get().status, "queued")
+
+        graded = {"question_id": self.question.id, "type": "short_answer", "score": 6, "max_score": 10}
+        with patch.object(AutoGrader, "grade_short_answer", return_value=graded):
+            self.assertEqual(grading_queue.grade_queued(session_id="s1"), (1, 0))
+            self.assertEqual(grading_queue.grade_queued(session_id="s1"), (0, 0))
+
+        progress = self.client.get(body["results_url"]).json()
+        self.assertTrue(progress["complete"])
+        self.assertEqual(progress["total_score"], 6)
+        self.assertEqual(RecentPracticeSession.objects.get(student_id="z1").total_score, 6)
+
+    async def test_results_stream_sends_progress_until_graded(self):
+        """stream=1 sends the pending state at once, then the graded result and done."""
+        with self.settings(GRADING_IN_PROCESS_WORKER=False):
+            response = await self.async_client.post("/api/ai/answers/submit", data=json.dumps({
+                "session_id": "s1", "student_id": "z1", "background": True,
+                "answers": [{"question_db_id": self.question.id, "answer": "A fixed time-box"}],
+            }), content_type="application/json")
+        results_url = response.json()["results_url"]
+
+        with self.settings(GRADING_RESULTS_POLL_SECONDS=0.01):
+            stream = await self.async_client.get(results_url + "&stream=1")
+            self.assertTrue(stream.is_async)
+            chunks = aiter(stream.streaming_content)
+            first = await asyncio.wait_for(anext(chunks), timeout=5)
+            self.assertTrue(first.startswith(b"event: progress\n"))
+            self.assertEqual(json.loads(first.split(b"data: ", 1)[1])["pending_count"], 1)
+
+            graded = {"question_id": self.question.id, "type": "short_answer", "score": 6, "max_score": 10}
+            with patch.object(AutoGrader, "grade_short_answer", return_value=graded):
+                await sync_to_async(grading_queue.grade_queued)(session_id="s1")
+            rest = [chunk async for chunk in chunks]
+
+        self.assertEqual([chunk.split(b"\n", 1)[0] for chunk in rest], [b"event: progress", b"event: done"])
+        self.assertEqual(json.loads(rest[-1].split(b"data: ", 1)[1])["total_score"], 6)
+
+
+def _short(qid):
+    return {"id": qid, "type": "short_answer", "question": f"Question {qid}", "sample_answer": "x", "grading_points": []}
+
+
+@override_settings(GRADING_CACHE_ENABLED=False)
+class ConcurrentGradingTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = patch.object(gemini_client, "GEMINI_KEY", "test-key")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.questions = [_short(1), {"id": 2, "type": "mcq", "correct_answer": "B"}, _short(3), _short(4), _short(5)]
+        self.answers = {"1": "one", "2": "B", "3": "three", "4": "four", "5": "five"}
+
+    def test_short_answers_graded_concurrently_in_order(self):
+        """Short answers run in parallel and results keep question order."""
+        def slow_generate(prompt, config=None, timeout=None):
+            time.sleep(0.3)
+            qid = int(prompt.split("**Question**: Question ")[1].split()[0])
+            return json.dumps({"total_score": qid, "feedback": "", "breakdown": {}})
+
+        started = time.monotonic()
+        with patch.object(gemini_client, "generate", side_effect=slow_generate), \
+                patch.object(grader, "GRADING_WORKERS", 4):
+            graded = AutoGrader().grade_all(self.questions, self.answers, batch_size=1)
+
+        self.assertLess(time.monotonic() - started, 0.9)
+        self.assertEqual([r["score"] for r in graded["grading_results"]], [1, 10, 3, 4, 5])
+
+    def test_batched_prompt_maps_items_and_regrades_missing(self):
+        """A batched reply is matched by item number; items it leaves out are graded singly."""
+        batch_reply = json.dumps([
+            {"item": 3, "total_score": 5, "feedback": "c"},
+            {"item": 1, "total_score": 1, "feedback": "a"},
+        ])
+        single_reply = json.dumps({"total_score": 3, "feedback": "b"})
+        with patch.object(gemini_client, "generate", side_effect=[batch_reply, single_reply]) as generate:
+            graded = AutoGrader().grade_all(self.questions[:4], self.answers, batch_size=3)
+
+        self.assertEqual(generate.call_count, 2)
+        self.assertIn("### Item 3", generate.call_args_list[0].args[0])
+        self.assertEqual([r["score"] for r in graded["grading_results"]], [1, 10, 3, 5])
+
+    def test_async_timeout_leaves_answer_pending(self):
+        """A short answer that outlives its timeout comes back pending, the others graded."""
+        async def agenerate(prompt, config=None, timeout=None):
+            if "Question 3" in prompt:
+                await asyncio.sleep(1)
+            return json.dumps({"total_score": 6, "feedback": ""})
+
+        with patch.object(gemini_client, "agenerate", side_effect=agenerate), \
+                patch.object(grader, "GRADING_TIMEOUT", 0.2):
+            graded = asyncio.run(AutoGrader().agrade_all(self.questions, self.answers, batch_size=1))
+
+        statuses = [(r["question_id"], r.get("status"), r["score"]) for r in graded["grading_results"]]
+        self.assertEqual(statuses, [(1, None, 6), (2, None, 10), (3, "pending", 0), (4, None, 6), (5, None, 6)])
+
+
+class GradingCacheTests(TestCase):
+
+    def setUp(self):
+        patcher = patch.object(gemini_client, "GEMINI_KEY", "test-key")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.questions = [_short(1), dict(_short(1), id=2)]
+
+    def test_identical_answers_graded_once(self):
+        """Answers differing only in case and spacing share one Gemini call and one grade."""
+        reply = json.dumps({"total_score": 7, "feedback": "Good", "breakdown": {}})
+        with patch.object(gemini_client, "generate", return_value=reply) as generate:
+            first = AutoGrader().grade_all(self.questions, {"1": "A time-box.", "2": "a  TIME-BOX"})
+            again = AutoGrader().grade_all(self.questions[:1], {"1": "A time-box"})
+
+        generate.assert_called_once()
+        self.assertEqual([r["score"] for r in first["grading_results"] + again["grading_results"]], [7, 7, 7])
+        self.assertEqual(first["grading_results"][1]["student_answer"], "a  TIME-BOX")
+        self.assertEqual(GradingCache.objects.get().hits, 1)
+
+    def test_pending_grade_is_not_cached(self):
+        """An answer left pending is graded by Gemini on the next attempt."""
+        reply = json.dumps({"total_score": 4, "feedback": "", "breakdown": {}})
+        with patch.object(gemini_client, "generate", side_effect=[gemini_client.CircuitOpenError("down"), reply]):
+            pending = AutoGrader().grade_all(self.questions[:1], {"1": "A sprint"})
+            graded = AutoGrader().grade_all(self.questions[:1], {"1": "A sprint"})
+
+        self.assertEqual(pending["grading_results"][0]["status"], "pending")
+        self.assertEqual(graded["grading_results"][0]["score"], 4)
+
+
+class PracticeSessionStorageTests(TestCase):
+
+    def _inserts(self, queries):
+        return [q["sql"] for q in queries.captured_queries if q["sql"].startswith("INSERT")]
+
+    def test_generated_session_stored_in_one_insert(self):
+        """All questions of a session go in with one INSERT and come back with ids in order."""
+        generated = [_short(n) for n in range(1, 31)]
+        with CaptureQueriesContext(connection) as queries:
+            session_id, rows = persist_generated_session("COMP9900", "Agile", "easy", generated,
+                                                         question_data=lambda q: {"question": q["question"]})
+
+        self.assertEqual(len(self._inserts(queries)), 1)
+        stored = list(GeneratedQuestion.objects.filter(session_id=session_id).order_by("id"))
+        self.assertEqual([r.id for r in rows], [q.id for q in stored])
+        self.assertEqual(stored[-1].question_data, {"question": "Question 30"})
+
+    def test_submitted_answers_stored_in_one_insert(self):
+        """Graded answers of a submission are saved with one INSERT, pending ones queued."""
+        session_id, rows = persist_generated_session("COMP9900", "Agile", "easy",
+                                                     [{"type": "mcq", "correct_answer": "B"}, _short(2)])
+        with patch.object(gemini_client, "GEMINI_KEY", "test-key"), \
+                patch.object(gemini_client, "agenerate", AsyncMock(side_effect=gemini_client.CircuitOpenError("down"))), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/api/ai/answers/submit", data=json.dumps({
+                "session_id": session_id, "student_id": "z1",
+                "answers": [{"question_db_id": rows[0].id, "answer": "B"}, {"question_db_id": rows[1].id, "answer": "x"}],
+            }), content_type="application/json")
+
+        self.assertEqual(response.json()["total_score"], 10)
+        self.assertEqual(sum("ai_student_answer" in sql for sql in self._inserts(queries)), 1)
+        self.assertEqual(list(StudentAnswer.objects.order_by("question_id").values_list("status", flat=True)),
+                         ["graded", "queued"])
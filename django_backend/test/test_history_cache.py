@@ -0,0 +1,124 @@
+# django_backend/test/test_history_cache.py
+
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from ai_chat.chat_service import AIChatService
+from ai_chat import history_cache
+from ai_chat.history_cache import RecentHistory, append_message, invalidate_history, recent_history
+from ai_chat.models import ChatConversation, ChatMessage
+
+
+LOCAL_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class RecentHistoryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create(username="s200")
+        self.conversation = ChatConversation.objects.create(user=user)
+
+    def _say(self, message_type, content):
+        msg = ChatMessage.objects.create(conversation=self.conversation, message_type=message_type, content=content)
+        append_message(msg)
+        return msg
+
+    def test_appends_without_querying(self):
+        """Once built, the buffer follows new messages with no history query."""
+        recent_history(self.conversation.id)
+        self._say("user", "I want to practice")
+        self._say("ai", "Here are the courses you're currently enrolled in: COMP9900. "
+                        "Which course would you like to practise?")
+
+        with self.assertNumQueries(0):
+            history = recent_history(self.conversation.id)
+        self.assertEqual([m["type"] for m in history], ["ai", "user"])
+        self.assertEqual(history.practice_step, "waiting_for_course")
+        self.assertTrue(history.in_practice_flow)
+
+    def test_rebuilds_on_miss_and_keeps_last_n(self):
+        """A missing buffer is rebuilt from the database, capped at the configured size."""
+        for i in range(35):
+            self._say("user", f"message {i}")
+        invalidate_history(self.conversation.id)
+
+        with self.settings(CHAT_HISTORY_SIZE=30):
+            history = recent_history(self.conversation.id)
+            self.assertEqual(len(history), 30)
+            self.assertEqual(history[0]["content"], "message 34")
+
+            self._say("user", "message 35")
+            history = recent_history(self.conversation.id)
+        self.assertEqual(len(history), 30)
+        self.assertEqual(history[0]["content"], "message 35")
+
+    def test_flow_state_matches_list_scan(self):
+        """The stored flow state equals what the chat service derives from a plain message list."""
+        self._say("ai", "Great, you'd like to practise COMP9331. Which topic would you like to focus on?")
+        self._say("user", "routing")
+        history = recent_history(self.conversation.id)
+        service = AIChatService()
+
+        self.assertIsInstance(history, RecentHistory)
+        self.assertEqual(history.current_course, service.extract_current_course_from_history(list(history)))
+        self.assertEqual(history.practice_step, service.detect_practice_step(list(history)))
+        self.assertEqual(history.in_practice_flow, service.is_in_practice_flow(list(history)))
+        self.assertEqual(history.current_course, "COMP9331")
+
+    def test_out_of_order_append_drops_buffer(self):
+        """A message appended after a newer one forces a rebuild that has both."""
+        recent_history(self.conversation.id)
+        older = ChatMessage.objects.create(conversation=self.conversation, message_type="user", content="first")
+        self._say("ai", "second")
+        append_message(older)
+
+        history = recent_history(self.conversation.id)
+        self.assertEqual([m["content"] for m in history], ["second", "first"])
+
+    def test_interleaved_appends_keep_both_messages(self):
+        """An append landing between another append's read and write never leaves a hole."""
+        recent_history(self.conversation.id)
+        first = ChatMessage.objects.create(conversation=self.conversation, message_type="user", content="first")
+        second = ChatMessage.objects.create(conversation=self.conversation, message_type="ai", content="second")
+        store = history_cache._store
+
+        def store_after_other_append(conversation_id, history):
+            # The second append runs while the first holds the buffer it read
+            if history[0]["id"] == first.id:
+                append_message(second)
+            store(conversation_id, history)
+
+        with patch.object(history_cache, "_store", side_effect=store_after_other_append):
+            append_message(first)
+
+        history = recent_history(self.conversation.id)
+        self.assertEqual([m["content"] for m in history], ["second", "first"])
+
+    def test_append_during_rebuild_is_not_lost(self):
+        """A message appended while a rebuild is reading the database shows up on the next read."""
+        later = []
+        store = history_cache._store
+
+        def store_after_append(conversation_id, history):
+            if not later:
+                later.append(ChatMessage.objects.create(conversation=self.conversation, message_type="user", content="late"))
+                append_message(later[0])
+            store(conversation_id, history)
+
+        with patch.object(history_cache, "_store", side_effect=store_after_append):
+            self.assertEqual(list(recent_history(self.conversation.id)), [])
+
+        self.assertEqual([m["content"] for m in recent_history(self.conversation.id)], ["late"])
+
+
+class SharedCacheSettingTests(SimpleTestCase):
+
+    def test_default_cache_is_shared_between_processes(self):
+        """The configured cache is not per-process, so every worker sees appends and invalidations."""
+        self.assertNotIn("locmem", settings.CACHES["default"]["BACKEND"])
@@ -0,0 +1,52 @@
+# django_backend/test/test_intents.py
+
+import re
+
+from django.test import SimpleTestCase
+
+from ai_chat import intents
+from ai_chat.intents import intent_engine
+
+MESSAGES = [
+    "Hi there", "hello, can you explain my plan?", "Why is my plan ordered like this?",
+    "How do I do part 2 of the task?", "I need practice on recursion", "I don't understand pointers",
+    "I'm so stressed and overwhelmed", "Good morning coach", "stop", "go back please",
+    "exit", "feedback on my essay", "what is the reason for this plan", "Tell me about the plan",
+    "I'm struggling with graphs", "need help with assignment 1", "", "PRACTICE SESSION now",
+]
+
+
+def _first_match(patterns_by_intent, text):
+    for intent, patterns in patterns_by_intent.items():
+        if any(re.search(p, text) for p in patterns):
+            return intent
+    return 'general'
+
+
+class IntentEngineTests(SimpleTestCase):
+
+    def test_matches_the_per_pattern_rules(self):
+        """The compiled engine agrees with searching each raw pattern one by one."""
+        for message in MESSAGES:
+            text = message.lower()
+            with self.subTest(message=message):
+                self.assertEqual(intent_engine.detect(message), _first_match(intents.INTENT_PATTERNS, text))
+                self.assertEqual(intent_engine.is_explain_plan(message),
+                                 any(re.search(p, text) for p in intents.EXPLAIN_PLAN_PATTERNS))
+                self.assertEqual(intent_engine.is_stop(message),
+                                 any(re.search(p, text.strip()) for p in intents.STOP_PATTERNS))
+                self.assertEqual(intent_engine.is_why_plan(message),
+                                 any(re.search(p, text) for p in intents.WHY_PLAN_PATTERNS))
+                self.assertEqual(intent_engine.is_practice(message),
+                                 any(k in text for k in intents.PRACTICE_KEYWORDS))
+
+    def test_classify_returns_all_intents_by_priority(self):
+        """classify lists every matching intent, highest priority first."""
+        self.assertEqual(intent_engine.classify("Hi, explain the plan, I need practice"),
+                         ["explain_plan", "practice", "greeting"])
+        self.assertEqual(intent_engine.classify("what is this"), [])
+
+    def test_practice_flow_prompt(self):
+        """AI messages from the practice flow are recognised regardless of case."""
+        self.assertTrue(intent_engine.is_practice_flow_prompt("Great! Which course would you like to practise?"))
+        self.assertFalse(intent_engine.is_practice_flow_prompt("Here is your plan."))
@@ -0,0 +1,132 @@
+# django_backend/test/test_pdf_ingest.py
+
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from ai_module import pdf_ingest
+
+
+class ExtractedTextStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = patch.object(pdf_ingest, "TEXT_CACHE_DIR", Path(tmp.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pdf = "/task/comp1009/assign.pdf"
+
+    def test_second_extraction_reads_the_store(self):
+        """Repeat extraction of an unchanged file does not parse the PDF again."""
+        first = pdf_ingest.extract_text_from_pdf(self.pdf)
+        self.assertTrue(first)
+
+        with patch.object(pdf_ingest, "_stream_pages") as extract:
+            second = pdf_ingest.extract_text_from_pdf(self.pdf)
+
+        extract.assert_not_called()
+        self.assertEqual(first, second)
+
+    def test_entry_records_extractor_and_page_offsets(self):
+        """The stored entry keeps the winning backend and where each page starts."""
+        text = pdf_ingest.extract_text_from_pdf(self.pdf)
+        entry = pdf_ingest.load_extracted_text(pdf_ingest.resolve_pdf_path(self.pdf))
+
+        self.assertIsNotNone(entry["extractor"])
+        self.assertEqual(len(entry["sha256"]), 64)
+        page_no, offset = entry["pages"][0]
+        self.assertEqual((page_no, offset), (1, 0))
+        self.assertTrue(all(0 <= off < len(text) for _, off in entry["pages"]))
+
+
+class AdaptiveExtractionTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = patch.object(pdf_ingest, "TEXT_CACHE_DIR", Path(tmp.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pdf = "/material/COMP9900/proposal.pdf"
+
+    def test_budget_stops_early_and_is_topped_up_later(self):
+        """A budgeted read stops early; a later full read reuses the recorded backend."""
+        partial = pdf_ingest.extract_text_from_pdf(self.pdf, max_chars=2000)
+        entry = pdf_ingest.load_extracted_text(pdf_ingest.resolve_pdf_path(self.pdf))
+        self.assertFalse(entry["complete"])
+        self.assertEqual(entry["extractor"], "PyMuPDF")
+
+        full = pdf_ingest.extract_text_from_pdf(self.pdf)
+        self.assertGreater(len(full), len(partial))
+        self.assertTrue(full.startswith(partial))
+
+    def test_backend_without_text_on_probe_is_skipped(self):
+        """A backend whose probe pages come back empty loses to the next one."""
+        def no_text(pdf_path):
+            yield from ()
+
+        backends = [("empty", no_text)] + [b for b in pdf_ingest._EXTRACTORS if b[0] == "pypdf"]
+        with patch.object(pdf_ingest, "_EXTRACTORS", backends):
+            pages = list(pdf_ingest.iter_pdf_text(self.pdf, max_chars=500))
+        entry = pdf_ingest.load_extracted_text(pdf_ingest.resolve_pdf_path(self.pdf))
+
+        self.assertEqual(entry["extractor"], "pypdf")
+        self.assertTrue(pages)
+
+    def test_iter_pdf_text_stops_at_page_budget(self):
+        """iter_pdf_text yields at most max_pages pages, from the parser or the store alike."""
+        parsed = list(pdf_ingest.iter_pdf_text(self.pdf, max_pages=2))
+        self.assertEqual(len(parsed), 2)
+
+        with patch.object(pdf_ingest, "_stream_pages") as stream:
+            stored = list(pdf_ingest.iter_pdf_text(self.pdf, max_pages=2))
+        stream.assert_not_called()
+        self.assertEqual(stored, parsed)
+
+    def test_budgeted_read_at_the_limit_reads_the_store(self):
+        """A partial entry serves any budget that would have stopped the read at the same page."""
+        first = list(pdf_ingest.iter_pdf_text(self.pdf, max_pages=1))
+        limit = len(first[0]) + 2
+
+        with patch.object(pdf_ingest, "_stream_pages") as stream:
+            self.assertEqual(list(pdf_ingest.iter_pdf_text(self.pdf, max_chars=limit)), first)
+            self.assertEqual(list(pdf_ingest.iter_pdf_text(self.pdf, max_chars=limit, max_pages=5)), first)
+        stream.assert_not_called()
+
+    def test_closing_the_generator_keeps_what_was_read(self):
+        """Pages read before the consumer stops are stored as an incomplete entry."""
+        pages = pdf_ingest.iter_pdf_text(self.pdf)
+        first = next(pages)
+        pages.close()
+
+        entry = pdf_ingest.load_extracted_text(pdf_ingest.resolve_pdf_path(self.pdf))
+        self.assertFalse(entry["complete"])
+        self.assertEqual(entry["text"], first)
+
+    def test_image_only_pdf_is_read_in_one_pass(self):
+        """A text-less PDF costs each backend its probe pages and the fastest one a single pass."""
+        import fitz
+
+        path = Path(tempfile.mkdtemp(dir=pdf_ingest.TEXT_CACHE_DIR)) / "scan.pdf"
+        pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 8, 8), False)
+        with fitz.open() as doc:
+            for _ in range(30):
+                doc.new_page().insert_image(fitz.Rect(0, 0, 200, 200), pixmap=pixmap)
+            doc.save(path)
+
+        pages_read = {}
+
+        def counted(name, iter_pages):
+            def iterate(pdf_path):
+                for page in iter_pages(pdf_path):
+                    pages_read[name] = pages_read.get(name, 0) + 1
+                    yield page
+            return name, iterate
+
+        with patch.object(pdf_ingest, "_EXTRACTORS", [counted(*b) for b in pdf_ingest._EXTRACTORS]):
+            self.assertIsNone(pdf_ingest.extract_text_from_pdf(str(path)))
+
+        self.assertEqual(pages_read, {"PyMuPDF": 30, "pypdf": 2, "pdfplumber": 2, "PyPDF2": 2})
@@ -0,0 +1,84 @@
+# django_backend/test/test_plan_generator.py
+
+import time
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from ai_module import gemini_client, plan_generator
+from ai_module.types import Part
+from plans.models import TaskAnalysisCache
+
+
+def _work_parts():
+    return [Part(partId="p1", order=1, title="Part 1 - Work", minutes=60, notes="do it")]
+
+
+class AnalyseTasksTests(TestCase):
+
+    def setUp(self):
+        self.tasks_meta = [
+            {"id": f"COMP9900_{i}", "task": f"COMP9900 - Assignment {i}", "dueDate": "2030-01-10"}
+            for i in range(3)
+        ]
+
+    def test_results_keep_input_order(self):
+        """Tasks analysed concurrently come back in the order they were given."""
+        def slow_first(meta):
+            if meta["id"].endswith("_0"):
+                time.sleep(0.2)
+            return _work_parts(), "ai", False
+
+        with patch.object(plan_generator, "_analyse_task", side_effect=slow_first):
+            results = plan_generator._analyse_tasks(self.tasks_meta)
+
+        self.assertEqual([t.taskId for t, _ in results], [m["id"] for m in self.tasks_meta])
+        self.assertTrue(all(info["explanation"] == "ai" for _, info in results))
+
+    def test_missed_deadline_uses_fallback_split(self):
+        """A task still running at the plan deadline gets the intelligent fallback split."""
+        def hang_on_last(meta):
+            if meta["id"].endswith("_2"):
+                time.sleep(1)
+            return _work_parts(), "ai", False
+
+        with patch.object(plan_generator, "_analyse_task", side_effect=hang_on_last), \
+                patch.object(plan_generator, "PLAN_ANALYSIS_DEADLINE", 0.3):
+            results = plan_generator._analyse_tasks(self.tasks_meta)
+
+        self.assertEqual([info["explanation"] == "ai" for _, info in results], [True, True, False])
+        self.assertEqual(results[2][0].parts[0].title, "Part 1 - Research & Planning")
+
+    def test_workers_inherit_plan_deadline(self):
+        """LLM calls made by analysis workers are bounded by the plan-wide deadline."""
+        seen = []
+
+        def record_deadline(meta):
+            seen.append(gemini_client.remaining())
+            return _work_parts(), "ai", False
+
+        with patch.object(plan_generator, "_analyse_task", side_effect=record_deadline):
+            plan_generator._analyse_tasks(self.tasks_meta)
+
+        self.assertEqual(len(seen), 3)
+        self.assertTrue(all(left is not None and 0 < left <= plan_generator.PLAN_ANALYSIS_DEADLINE for left in seen))
+
+    def test_model_output_is_cached_and_reused(self):
+        """A second plan for the same task content is served from the analysis cache."""
+        meta = self.tasks_meta[:1]
+        with patch.object(plan_generator, "_analyse_task", return_value=(_work_parts(), "ai", True)) as analyse:
+            plan_generator._analyse_tasks(meta)
+            results = plan_generator._analyse_tasks([dict(meta[0], id="COMP9900_other")])
+
+        self.assertEqual(analyse.call_count, 1)
+        self.assertEqual(TaskAnalysisCache.objects.count(), 1)
+        task, info = results[0]
+        self.assertEqual(task.taskId, "COMP9900_other")
+        self.assertEqual(info["parts"][0]["notes"], "do it")
+
+    def test_fallback_output_is_not_cached(self):
+        """Fallback splits are not shared, so the model is asked again next time."""
+        with patch.object(plan_generator, "_analyse_task", return_value=(_work_parts(), "fallback", False)):
+            plan_generator._analyse_tasks(self.tasks_meta[:1])
+
+        self.assertEqual(TaskAnalysisCache.objects.count(), 0)
@@ -0,0 +1,66 @@
+# django_backend/test/test_prompt_builder.py
+
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from ai_chat import chat_service
+from ai_chat.prompt_builder import PromptBuilder, estimate_tokens
+from ai_chat.student_context import PracticeSummary, StudentContext
+
+
+class PromptBuilderTests(SimpleTestCase):
+
+    def test_trims_by_priority_and_keeps_sections_in_order(self):
+        """Higher-priority items are kept first; output follows section order, not priority."""
+        builder = PromptBuilder(budget_tokens=10)
+        builder.section("low")
+        builder.section("high")
+        builder.add("low", "l" * 16, priority=2)
+        builder.add("high", "h" * 16, priority=1)
+        builder.add("high", "H" * 16, priority=1)
+
+        prompt = builder.build(head="[", tail="]")
+        self.assertEqual(prompt, "[" + "h" * 16 + "H" * 16 + "]")
+        self.assertEqual(builder.dropped, {"low": 1})
+
+    def test_section_stops_at_first_item_that_does_not_fit(self):
+        """A section keeps a contiguous run of items, rendered reversed when asked."""
+        builder = PromptBuilder(budget_tokens=6)
+        builder.section("history", "#", reverse=True)
+        for text in ("new.", "x" * 40, "old."):
+            builder.add("history", text, priority=1)
+
+        self.assertEqual(builder.build(head="", tail=""), "#new.")
+        self.assertEqual(builder.content("history"), "#new." + "x" * 40 + "old.")
+
+
+class ChatPromptBudgetTests(SimpleTestCase):
+
+    def _context(self, questions):
+        practice = PracticeSummary(course_code="COMP9900", topic="Agile", total_score=10, max_score=50,
+                                   percentage=20.0, questions_count=len(questions), questions=questions)
+        return StudentContext(student_id="s400", courses=[("COMP9900", "Capstone")], practice=practice,
+                              plan={"aiSummary": {"tasks": [{"taskTitle": "Report", "parts": [1, 2]}]}})
+
+    def test_long_practice_test_fits_budget_keeping_wrong_answers(self):
+        """With a 50-question test the prompt stays in budget and keeps every wrong answer."""
+        questions = [
+            {"question_text": f"Question {i} " + "about sprint ceremonies " * 10, "student_answer": "A",
+             "correct_answer": "B", "is_correct": i % 5 != 0, "feedback": "Review the scrum guide."}
+            for i in range(50)
+        ]
+        history = [{"type": "user", "content": f"message {i} " * 20} for i in range(30)]
+        account = SimpleNamespace(student_id="s400", name="Sam")
+
+        with patch.object(chat_service.StudentContextBuilder, "build", return_value=self._context(questions)), \
+                self.settings(CHAT_PROMPT_TOKEN_BUDGET=3000):
+            prompt, _ = chat_service.AIChatService().build_chat_prompt("what did I get wrong?", account, history)
+
+        self.assertLessEqual(estimate_tokens(prompt), 3000)
+        self.assertIn("Current student message: what did I get wrong?", prompt)
+        for i in range(0, 50, 5):
+            self.assertIn(f"Q{i + 1} [✗]", prompt)
+        self.assertIn("Report (2 parts)", prompt)
+        self.assertNotIn("Q50 [✓]", prompt)
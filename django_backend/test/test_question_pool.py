@@ -0,0 +1,98 @@
+# django_backend/test/test_question_pool.py
+
+import json
+from io import StringIO
+from unittest.mock import AsyncMock, patch
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from ai_chat.views import GeneratePracticeView
+from ai_module import gemini_client
+from ai_question_generator import question_pool
+from ai_question_generator.generator import QuestionGenerator
+from ai_question_generator.models import GeneratedQuestion, PooledQuestion
+from courses.models import Question, QuestionKeyword, QuestionKeywordMap
+from stu_accounts.models import StudentAccount
+
+
+def _mcq(n):
+    return {"type": "mcq", "question": f"MCQ {n}", "options": ["A. x", "B. y"], "correct_answer": "A"}
+
+
+def _short(n):
+    return {"type": "short_answer", "question": f"Short {n}", "sample_answer": "y", "grading_points": []}
+
+
+@override_settings(QUESTION_POOL_TARGET=3, QUESTION_POOL_LOW_WATERMARK=2, QUESTION_POOL_REFILL_BATCH=4,
+                   QUESTION_POOL_MAX_SERVES=2, QUESTION_POOL_DIFFICULTIES=("easy",))
+class QuestionPoolTests(TestCase):
+
+    def setUp(self):
+        question = Question.objects.create(course_code="COMP9900", qtype="short", title="Sprint",
+                                           text="What is a sprint?", short_answer="A time-box")
+        keyword = QuestionKeyword.objects.create(name="Agile")
+        QuestionKeywordMap.objects.create(question=question, keyword=keyword)
+
+    def _stock(self, mcqs, shorts):
+        PooledQuestion.objects.bulk_create(
+            [PooledQuestion(course_code="COMP9900", topic="Agile", difficulty="easy", question_type=q["type"],
+                            question_data=q) for q in [_mcq(n) for n in range(mcqs)] + [_short(n) for n in range(shorts)]]
+        )
+
+    def test_take_never_repeats_for_a_student(self):
+        """A student is not served the same pooled question twice; another student can be."""
+        self._stock(mcqs=2, shorts=2)
+
+        first = question_pool.take("COMP9900", "agile", "easy", 1, 1, "z1")
+        second = question_pool.take("COMP9900", "Agile", "easy", 1, 1, "z1")
+        self.assertEqual([q["type"] for q in first], ["mcq", "short_answer"])
+        self.assertFalse({q["question"] for q in first} & {q["question"] for q in second})
+        self.assertIsNone(question_pool.take("COMP9900", "Agile", "easy", 1, 1, "z1"))
+        self.assertEqual(len(question_pool.take("COMP9900", "Agile", "easy", 2, 2, "z2")), 4)
+        # Every question has now been served to QUESTION_POOL_MAX_SERVES students
+        self.assertEqual(question_pool.stock("COMP9900", "Agile", "easy"), {"mcq": 0, "short_answer": 0})
+
+    def test_command_refills_below_watermark_with_valid_questions(self):
+        """The refill command tops each type up to the target and drops invalid questions."""
+        self._stock(mcqs=3, shorts=1)
+        batches = [[_short(10), {"type": "short_answer", "question": "No sample answer"}], [_short(11)]]
+        with patch.object(gemini_client, "GEMINI_KEY", "test-key"), \
+                patch.object(gemini_client, "available", return_value=True), \
+                patch.object(QuestionGenerator, "generate_questions", side_effect=batches) as generate:
+            call_command("refill_question_pool", stdout=StringIO())
+
+        self.assertEqual(generate.call_count, 2)
+        self.assertEqual(generate.call_args_list[0].kwargs["short_answer_count"], 2)
+        self.assertEqual(question_pool.stock("COMP9900", "Agile", "easy"), {"mcq": 3, "short_answer": 3})
+
+    def test_generate_endpoint_serves_from_pool(self):
+        """With enough stock the generate endpoint answers without calling Gemini."""
+        self._stock(mcqs=3, shorts=2)
+        with patch.object(gemini_client, "GEMINI_KEY", "test-key"), \
+                patch.object(QuestionGenerator, "agenerate_questions", AsyncMock()) as agenerate:
+            response = self.client.post("/api/ai/questions/generate", data=json.dumps({
+                "course_code": "COMP9900", "topic": "Agile", "difficulty": "easy", "student_id": "z1",
+            }), content_type="application/json")
+
+        body = response.json()
+        self.assertTrue(body["success"])
+        agenerate.assert_not_called()
+        self.assertEqual(body["total_questions"], 5)
+        self.assertEqual(GeneratedQuestion.objects.filter(session_id=body["session_id"]).count(), 5)
+
+    def test_practice_view_pool_hit_skips_sample_questions(self):
+        """The chat practice endpoint serves from the pool without loading sample questions."""
+        self._stock(mcqs=3, shorts=2)
+        StudentAccount.objects.create(student_id="z1", name="Z", email="z1@example.com", password_hash="x")
+        with patch.object(GeneratePracticeView, "_load_sample_questions") as load_samples, \
+                patch.object(QuestionGenerator, "agenerate_questions", AsyncMock()) as agenerate:
+            response = self.client.post("/api/ai/generate-practice/", data=json.dumps({
+                "course": "COMP9900", "topic": "Agile", "difficulty": "easy", "num_questions": 5, "user_id": "z1",
+            }), content_type="application/json")
+
+        body = response.json()
+        self.assertTrue(body["success"])
+        self.assertEqual(body["total_questions"], 5)
+        load_samples.assert_not_called()
+        agenerate.assert_not_called()
@@ -0,0 +1,124 @@
+# django_backend/test/test_scheduler.py
+
+from datetime import date, timedelta
+
+from django.test import SimpleTestCase
+
+from ai_module.scheduler import _DayCapacityIndex, check_feasibility, schedule
+from ai_module.types import Part, Preferences, TaskWithParts
+
+
+def _task(task_id: str, due: date, minutes: list[int]) -> TaskWithParts:
+    parts = [
+        Part(partId=f"p{i + 1}", order=i + 1, title=f"Part {i + 1}", minutes=m)
+        for i, m in enumerate(minutes)
+    ]
+    return TaskWithParts(taskId=task_id, taskTitle=task_id, dueDate=due.isoformat(), parts=parts)
+
+
+class DayCapacityIndexTests(SimpleTestCase):
+
+    def test_first_fit_respects_bound_and_updates(self):
+        """first_fit returns the leftmost fitting day not after hi and tracks consumption."""
+        index = _DayCapacityIndex([0, 60, 30, 120, 90])
+        self.assertEqual(index.first_fit(4, 60), 1)
+        self.assertEqual(index.first_fit(2, 90), -1)
+        self.assertEqual(index.first_fit(4, 100), 3)
+
+        index.consume(1, 60)
+        self.assertEqual(index.free(1), 0)
+        self.assertEqual(index.first_fit(4, 60), 3)
+
+        index.consume(1, -60)
+        self.assertEqual(index.first_fit(4, 60), 1)
+
+    def test_empty_index(self):
+        """An empty calendar never fits anything."""
+        self.assertEqual(_DayCapacityIndex([]).first_fit(3, 1), -1)
+
+
+class ScheduleTests(SimpleTestCase):
+
+    def setUp(self):
+        # A Monday, so the first week is a full week
+        self.today = date(2025, 10, 13)
+
+    def test_parts_placed_in_order_before_due(self):
+        """Whole parts go to the earliest day with room and never after the due date."""
+        task = _task("t1", self.today + timedelta(days=4), [60, 60, 60])
+        prefs = Preferences(daily_hour_cap=1, weekly_study_days=5, avoid_days=["Sat", "Sun"])
+
+        result = schedule([task], prefs, today=self.today)
+
+        self.assertTrue(result["ok"])
+        self.assertEqual(result["relaxation"], "none")
+        placed = [(d["date"], b["partId"]) for d in result["days"] for b in d["blocks"]]
+        self.assertEqual(placed, [
+            (self.today.isoformat(), "p1"),
+            ((self.today + timedelta(days=1)).isoformat(), "p2"),
+            ((self.today + timedelta(days=2)).isoformat(), "p3"),
+        ])
+
+    def test_impossible_lists_unplaced_parts(self):
+        """A task that cannot fit even at 10h/day is reported as impossible."""
+        task = _task("t1", self.today, [600, 120])
+        prefs = Preferences(daily_hour_cap=2, weekly_study_days=5, avoid_days=[])
+
+        result = schedule([task], prefs, today=self.today)
+
+        self.assertFalse(result["ok"])
+        self.assertEqual(result["relaxation"], "impossible")
+        self.assertEqual([p["partId"] for p in result["unplaceableParts"]], ["p2"])
+
+    def test_relaxes_in_place_when_part_does_not_fit(self):
+        """Only the part that does not fit escalates; earlier parts keep their stricter placement."""
+        early = _task("t1", self.today + timedelta(days=1), [60])
+        late = _task("t2", self.today + timedelta(days=1), [60])
+        prefs = Preferences(daily_hour_cap=1, weekly_study_days=5, avoid_days=["Tue"])
+
+        result = schedule([early, late], prefs, today=self.today)
+
+        self.assertTrue(result["ok"])
+        self.assertEqual(result["relaxation"], "allow-avoid-days")
+        placed = [(d["date"], b["taskId"], b["minutes"]) for d in result["days"] for b in d["blocks"]]
+        self.assertEqual(placed, [
+            (self.today.isoformat(), "t1", 60),
+            ((self.today + timedelta(days=1)).isoformat(), "t2", 60),
+        ])
+
+
+class CheckFeasibilityTests(SimpleTestCase):
+
+    def setUp(self):
+        self.today = date(2025, 10, 13)
+
+    def test_reports_minimum_relaxation(self):
+        """Demand that only fits once weekends are allowed reports allow-avoid-days."""
+        task = _task("t1", self.today + timedelta(days=6), [120, 120, 120, 120, 120, 120, 120])
+        prefs = Preferences(daily_hour_cap=2, weekly_study_days=5, avoid_days=["Sat", "Sun"])
+
+        verdict = check_feasibility([task], prefs, today=self.today)
+
+        self.assertEqual(verdict, {"ok": True, "relaxation": "allow-avoid-days", "unplaceableParts": []})
+
+    def test_empty_demand_is_feasible(self):
+        """No tasks, or tasks without parts, fit without any relaxation."""
+        prefs = Preferences(daily_hour_cap=2, weekly_study_days=5, avoid_days=[])
+        expected = {"ok": True, "relaxation": "none", "unplaceableParts": []}
+
+        self.assertEqual(check_feasibility([], prefs, today=self.today), expected)
+        self.assertEqual(check_feasibility([_task("t1", self.today, [])], prefs, today=self.today), expected)
+
+    def test_impossible_lists_overflowing_parts(self):
+        """Minutes beyond max10h capacity up to the due date are reported per part."""
+        task = _task("t1", self.today, [500, 200])
+        prefs = Preferences(daily_hour_cap=2, weekly_study_days=5, avoid_days=[])
+
+        verdict = check_feasibility([task], prefs, today=self.today)
+
+        self.assertFalse(verdict["ok"])
+        self.assertEqual(verdict["relaxation"], "impossible")
+        self.assertEqual(
+            [(p["partId"], p["minutes_remaining"]) for p in verdict["unplaceableParts"]],
+            [("p2", 100)],
+        )
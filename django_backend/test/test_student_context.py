@@ -0,0 +1,57 @@
+# django_backend/test/test_student_context.py
+
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from ai_chat.models import RecentPracticeSession, UserStudyPlan
+from ai_chat.student_context import StudentContextBuilder, invalidate_student_context
+from courses.models import CourseCatalog, CourseTask, StudentEnrollment
+from task_progress.models import TaskProgress
+
+
+LOCAL_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class StudentContextBuilderTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.sid = "z1234567"
+        for code in ("COMP9900", "COMP9331", "COMP1009"):
+            CourseCatalog.objects.create(code=code, title=f"{code} title")
+            StudentEnrollment.objects.create(student_id=self.sid, course_code=code)
+            task = CourseTask.objects.create(course_code=code, title=f"{code} Assignment",
+                                             deadline=timezone.now() + timedelta(days=7))
+            TaskProgress.objects.create(student_id=self.sid, task_id=task.id, progress=40)
+        RecentPracticeSession.objects.create(student_id=self.sid, session_id="s1", course_code="COMP9900",
+                                             topic="Agile", total_score=10, max_score=20, percentage=50,
+                                             questions_count=2, test_data={"questions": [{"is_correct": False}]})
+        user = User.objects.create(username=self.sid)
+        UserStudyPlan.objects.create(user=user, plan_data={"aiSummary": {"tasks": []}})
+
+    def test_fixed_query_count_and_cached(self):
+        """The snapshot takes the same six queries however many courses and tasks there are; repeats take none."""
+        with self.assertNumQueries(6):
+            context = StudentContextBuilder().build(self.sid)
+        self.assertEqual(len(context.courses), 3)
+        self.assertEqual({t.title for t in context.task_progress},
+                         {"COMP9900 Assignment", "COMP9331 Assignment", "COMP1009 Assignment"})
+        self.assertEqual(context.practice.topic, "Agile")
+        self.assertEqual(context.plan, {"aiSummary": {"tasks": []}})
+
+        with self.assertNumQueries(0):
+            StudentContextBuilder().build(self.sid)
+
+    def test_invalidation_picks_up_new_progress(self):
+        """After a progress write is invalidated, the next build reflects it."""
+        StudentContextBuilder().build(self.sid)
+        TaskProgress.objects.filter(student_id=self.sid).update(progress=100)
+        invalidate_student_context(self.sid)
+
+        context = StudentContextBuilder().build(self.sid)
+        self.assertTrue(all(t.progress == 100 for t in context.task_progress))
@@ -0,0 +1,98 @@
+# django_backend/test/test_topic_index.py
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from ai_chat.topic_index import _VERSION_PREFIX, TopicIndex, invalidate_topic_index, topic_index_for
+from courses.models import Question, QuestionKeyword, QuestionKeywordMap
+
+TOPICS = [
+    "Agile", "Scrum Ceremonies", "Requirements Engineering", "Software Testing", "Unit Testing",
+    "UML", "Use Case Diagrams", "Sprint Planning", "Git", "Continuous Integration", "Risk Management",
+]
+
+INPUTS = [
+    "agile", "  SCRUM CEREMONIES ", "scrum", "testing", "unit", "use case", "planning the sprint",
+    "integration continuous", "uml diagrams", "git", "risk", "management of risk", "databases",
+    "software engineering requirements", "i want sprint planning", "a", "",
+]
+
+
+LOCAL_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+def _linear_match(user_input, available_topics):
+    """The matcher chat_service used before the index (exact, containment, word overlap)."""
+    text = user_input.strip().lower()
+    for topic in available_topics:
+        if topic.lower() == text:
+            return topic
+    for topic in available_topics:
+        if text in topic.lower() or topic.lower() in text:
+            return topic
+    user_words = text.split()
+    for topic in available_topics:
+        topic_words = topic.lower().split()
+        matches = sum(1 for word in user_words if word in topic_words)
+        if matches >= min(2, len(user_words), len(topic_words)):
+            return topic
+    return None
+
+
+class TopicIndexTests(SimpleTestCase):
+
+    def test_agrees_with_linear_matcher(self):
+        """Wherever the old matcher found a topic, the index returns the same one."""
+        index = TopicIndex(TOPICS)
+        for message in INPUTS:
+            expected = _linear_match(message, TOPICS)
+            if expected is not None:
+                with self.subTest(message=message):
+                    self.assertEqual(index.match(message), expected)
+
+    def test_fuzzy_match_for_typos(self):
+        """Misspelt topics fall back to trigram similarity; unrelated text still fails."""
+        index = TopicIndex(TOPICS)
+        self.assertEqual(index.match("Continous Integraton"), "Continuous Integration")
+        self.assertEqual(index.match("requirments engineering"), "Requirements Engineering")
+        self.assertIsNone(index.match("databases"))
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class TopicIndexCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.course = "COMP9900"
+        invalidate_topic_index(self.course)
+        self._add_question("Agile")
+
+    def _add_question(self, keyword):
+        q = Question.objects.create(course_code=self.course, qtype="short", title=keyword, text=keyword)
+        kw, _ = QuestionKeyword.objects.get_or_create(name=keyword)
+        QuestionKeywordMap.objects.create(question=q, keyword=kw)
+
+    def test_index_is_reused_until_invalidated(self):
+        """Repeat lookups skip the keyword query; invalidation picks up new keywords."""
+        self.assertEqual(topic_index_for(self.course).topics, ["Agile"])
+        self._add_question("Scrum")
+        with self.assertNumQueries(0):
+            self.assertIsNone(topic_index_for(self.course).match("scrum"))
+
+        invalidate_topic_index(self.course)
+        self.assertEqual(topic_index_for(self.course).match("scrum"), "Scrum")
+
+    def test_version_bumped_by_another_process_rebuilds(self):
+        """A version bump written to the shared cache by another worker triggers a rebuild."""
+        topic_index_for(self.course)
+        self._add_question("Scrum")
+        # What invalidate_topic_index in another worker leaves in the shared cache
+        cache.set(_VERSION_PREFIX + self.course, 1, timeout=None)
+        self.assertEqual(topic_index_for(self.course).match("scrum"), "Scrum")
+
+    def test_index_rebuilt_after_max_age(self):
+        """Without any invalidation an index older than TOPIC_INDEX_MAX_AGE is rebuilt."""
+        topic_index_for(self.course)
+        self._add_question("Scrum")
+        with self.settings(TOPIC_INDEX_MAX_AGE=0):
+            self.assertEqual(topic_index_for(self.course).match("scrum"), "Scrum")